@@ -5,7 +5,7 @@ from .models import (
     MachineModel, EngineModel, TransmissionModel, DriveAxleModel,
     SteeringAxleModel, Machine, Component, Maintenance, ServiceType,
     ServiceOrganization, TechnicalService, FailureNode, RecoveryMethod,
-    Reclamation, User
+    Reclamation, User, ImportRun, ImportChunk
 )
 
 @admin.register(MachineModel)
@@ -225,6 +225,24 @@ class ReclamationAdmin(admin.ModelAdmin):
     downtime_display.short_description = "Простой (дни)"
 
 
+class ImportChunkInline(admin.TabularInline):
+    model = ImportChunk
+    extra = 0
+    can_delete = False
+    readonly_fields = ('sheet', 'index', 'rows', 'written', 'errors', 'duration', 'committed_at')
+
+
+@admin.register(ImportRun)
+class ImportRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'file_path', 'status', 'rows', 'started_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('file_path', 'options', 'status', 'error', 'rows', 'started_at', 'finished_at')
+    inlines = (ImportChunkInline,)
+
+    def has_add_permission(self, request):
+        return False
+
+
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
     change_password_form = AdminPasswordChangeForm
@@ -0,0 +1,71 @@
+"""
+Кеш пользователей и токенов для проверки входа без запросов к БД.
+
+Токен и пользователь кешируются отдельно: токен -> запись токена,
+id -> пользователь. Сигналы сбрасывают пользователя при любом сохранении
+или удалении (смена роли, пароля, is_active), токен - при его удалении,
+так что отключённый пользователь или отозванный токен перестают работать
+сразу, а TIMEOUT лишь ограничивает жизнь записей, о которых забыли.
+Кеш должен быть общим для всех процессов сервера (CACHES в settings_production).
+"""
+from allauth.account.auth_backends import AuthenticationBackend
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+TIMEOUT = 300
+
+
+def user_cache_key(pk):
+    return f'auth:user:{pk}'
+
+
+def token_cache_key(key):
+    return f'auth:token:{key}'
+
+
+def get_cached_user(pk):
+    """Пользователь по id из кеша или БД; None - пользователя нет"""
+    user = cache.get(user_cache_key(pk))
+    if user is None:
+        user = get_user_model()._default_manager.filter(pk=pk).first()
+        if user is not None:
+            cache.set(user_cache_key(pk), user, TIMEOUT)
+    return user
+
+
+def forget_user(pk):
+    cache.delete(user_cache_key(pk))
+
+
+def forget_token(key):
+    cache.delete(token_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, которой на повторных запросах не нужна БД"""
+
+    def authenticate_credentials(self, key):
+        token = cache.get(token_cache_key(key))
+        if token is None:
+            model = self.get_model()
+            token = model.objects.filter(key=key).first()
+            if token is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            cache.set(token_cache_key(key), token, TIMEOUT)
+
+        user = get_cached_user(token.user_id)
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        token.user = user
+        return user, token
+
+
+class CachedAuthenticationBackend(AuthenticationBackend):
+    """Вход как в allauth; пользователь сессии на каждом запросе берётся из кеша"""
+
+    def get_user(self, user_id):
+        user = get_cached_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
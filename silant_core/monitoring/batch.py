@@ -0,0 +1,257 @@
+"""
+Пакетная запись ТО и рекламаций через API.
+
+Записи приходят с заводским номером машины и названиями из справочников.
+Пакет проверяется за один проход: машины, справочники и уже существующие
+записи загружаются одним запросом на таблицу. Существующие записи читаются
+с блокировкой в той же транзакции, что и запись, права проверяются для
+каждой из них, и обновляются только проверенные строки. Новые записи
+вставляются без upsert'а: если такую же запись одновременно создал другой
+запрос, она не перезаписывается, а возвращается ошибкой. Ошибки
+возвращаются по номеру записи и не мешают сохранить остальные.
+"""
+from abc import ABC, abstractmethod
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .forecast import schedule_forecast_refresh
+from .models import FailureNode, Reclamation, RecoveryMethod, ServiceOrganization, ServiceType, TechnicalService
+from .references import forget_reference, reference_ids
+from .rollup import machine_scopes, schedule_rollup_refresh
+from .summary import schedule_refresh
+
+MAX_BATCH_SIZE = 1000
+
+
+class TechnicalServiceRecordSerializer(serializers.Serializer):
+    serial_number = serializers.CharField(max_length=50)
+    service_type = serializers.CharField(max_length=100)
+    service_date = serializers.DateField()
+    operating_hours = serializers.IntegerField(min_value=0)
+    work_order_number = serializers.CharField(max_length=50)
+    work_order_date = serializers.DateField()
+    service_organization = serializers.CharField(max_length=255, required=False, allow_blank=True)
+
+
+class ReclamationRecordSerializer(serializers.Serializer):
+    serial_number = serializers.CharField(max_length=50)
+    failure_date = serializers.DateField()
+    operating_hours = serializers.IntegerField(min_value=0)
+    failure_node = serializers.CharField(max_length=100)
+    failure_description = serializers.CharField()
+    recovery_method = serializers.CharField(max_length=100)
+    spare_parts_used = serializers.CharField(required=False, allow_blank=True)
+    recovery_date = serializers.DateField()
+
+
+class BatchWriter(ABC):
+    model = None
+    record_serializer = None
+    date_field = None
+    # Поле записи -> справочник, название которого в нём должно быть
+    references = {}
+    update_fields = []
+
+    def __init__(self, user):
+        self.user = user
+        self.errors = {}
+
+    def error(self, index, field, message):
+        self.errors.setdefault(index, {}).setdefault(field, []).append(message)
+
+    def validate(self, records):
+        valid = {}
+        keys = set()
+        for index, record in enumerate(records):
+            serializer = self.record_serializer(data=record)
+            if not serializer.is_valid():
+                self.errors[index] = serializer.errors
+                continue
+            data = serializer.validated_data
+            key = (data['serial_number'], data[self.date_field])
+            if key in keys:
+                self.error(index, self.date_field, "Запись с этой машиной и датой уже есть в пакете")
+                continue
+            keys.add(key)
+            valid[index] = data
+        return valid
+
+    def load_machines(self, valid):
+        serials = {data['serial_number'] for data in valid.values()}
+        return {
+            serial: (pk, service_company_id, client_id)
+            for serial, pk, service_company_id, client_id in self.user.get_accessible_machines().filter(
+                serial_number__in=serials
+            ).values_list('serial_number', 'pk', 'service_company_id', 'client_id')
+        }
+
+    def load_references(self, valid):
+        """Поле -> (название -> id), из кеша справочников"""
+        references = {}
+        for field, model in self.references.items():
+            names = {data[field] for data in valid.values() if data.get(field)}
+            if not names <= reference_ids(model).keys():
+                # Запись могли только что добавить в другом процессе
+                forget_reference(model)
+            references[field] = reference_ids(model)
+        return references
+
+    def load_existing(self, keys):
+        machine_ids = {machine_id for machine_id, _ in keys}
+        dates = {date for _, date in keys}
+        existing = self.model.objects.select_for_update().filter(
+            machine_id__in=machine_ids, **{f'{self.date_field}__in': dates}
+        ).only('pk', 'machine_id', self.date_field, 'service_company_id')
+        return {(row.machine_id, getattr(row, self.date_field)): row for row in existing}
+
+    @abstractmethod
+    def build(self, index, data, machine_id, service_company_id, references):
+        """Несохранённый объект записи или None, если в ней ошибка"""
+
+    def written(self, machine_ids):
+        """Обновление производных данных после записи пакета"""
+        schedule_refresh(*machine_ids)
+
+    def resolve_reference(self, index, field, data, references):
+        name = data[field]
+        if name not in references[field]:
+            self.error(index, field, f"Нет в справочнике: {name}")
+            return None
+        return references[field][name]
+
+    def create(self, new):
+        """
+        Вставка новых записей. Запись с тем же ключом, созданная другим
+        запросом после чтения существующих, не перезаписывается: её номер
+        уходит в ошибки и удаляется из new, остальные вставляются заново
+        """
+        while new:
+            try:
+                with transaction.atomic():
+                    self.model.objects.bulk_create(new.values())
+                return
+            except IntegrityError:
+                keys = {index: (obj.machine_id, getattr(obj, self.date_field)) for index, obj in new.items()}
+                taken = self.load_existing(set(keys.values()))
+                if not taken:
+                    raise
+                for index, key in keys.items():
+                    if key in taken:
+                        self.error(index, self.date_field, "Запись с этой машиной и датой создана другим запросом")
+                        del new[index]
+
+    def write(self, records):
+        valid = self.validate(records)
+        machines = self.load_machines(valid)
+        references = self.load_references(valid)
+
+        planned = {}
+        for index, data in valid.items():
+            machine = machines.get(data['serial_number'])
+            if machine is None:
+                self.error(index, 'serial_number', "Машина не найдена или недоступна")
+                continue
+            planned[index] = (machine, data)
+
+        with transaction.atomic():
+            existing = self.load_existing(
+                {(machine_id, data[self.date_field]) for (machine_id, _, _), data in planned.values()}
+            )
+            new, changed = {}, {}
+            for index, ((machine_id, machine_company_id, client_id), data) in planned.items():
+                current = existing.get((machine_id, data[self.date_field]))
+                if current is not None and not current.can_be_edited_by(self.user):
+                    self.error(index, 'non_field_errors', "Нет прав на изменение этой записи")
+                    continue
+                # Новая запись сервисной компании - её собственная, иначе - компании машины
+                service_company_id = self.user.pk if self.user.role == 'service' else machine_company_id
+                obj = self.build(index, data, machine_id, service_company_id, references)
+                if obj is None:
+                    continue
+                obj.client_id = client_id
+                if current is None:
+                    new[index] = obj
+                else:
+                    obj.pk = current.pk
+                    obj.updated_at = timezone.now()
+                    changed[index] = obj
+
+            self.model.objects.bulk_update(changed.values(), [*self.update_fields, 'updated_at'])
+            self.create(new)
+            # bulk_create и bulk_update не вызывают сигналы
+            self.written({obj.machine_id for obj in [*new.values(), *changed.values()]})
+
+        return {
+            'created': len(new),
+            'updated': len(changed),
+            'errors': [{'index': index, 'errors': errors} for index, errors in sorted(self.errors.items())],
+        }
+
+
+class TechnicalServiceBatchWriter(BatchWriter):
+    model = TechnicalService
+    record_serializer = TechnicalServiceRecordSerializer
+    date_field = 'service_date'
+    references = {'service_type': ServiceType, 'service_organization': ServiceOrganization}
+    update_fields = [
+        'service_type', 'operating_hours', 'work_order_number', 'work_order_date',
+        'service_organization', 'service_organization_name',
+    ]
+
+    def written(self, machine_ids):
+        super().written(machine_ids)
+        schedule_forecast_refresh(*machine_ids)
+
+    def build(self, index, data, machine_id, service_company_id, references):
+        service_type_id = self.resolve_reference(index, 'service_type', data, references)
+        if service_type_id is None:
+            return None
+        # Организации нет в справочнике - сохраняется текстом, как в форме и импорте
+        organization = data.get('service_organization') or ''
+        organization_id = references['service_organization'].get(organization)
+        return TechnicalService(
+            machine_id=machine_id,
+            service_type_id=service_type_id,
+            service_date=data['service_date'],
+            operating_hours=data['operating_hours'],
+            work_order_number=data['work_order_number'],
+            work_order_date=data['work_order_date'],
+            service_organization_id=organization_id,
+            service_organization_name='' if organization_id else organization,
+            service_company_id=service_company_id,
+        )
+
+
+class ReclamationBatchWriter(BatchWriter):
+    model = Reclamation
+    record_serializer = ReclamationRecordSerializer
+    date_field = 'failure_date'
+    references = {'failure_node': FailureNode, 'recovery_method': RecoveryMethod}
+    update_fields = [
+        'operating_hours', 'failure_node', 'failure_description', 'recovery_method',
+        'spare_parts_used', 'recovery_date',
+    ]
+
+    def written(self, machine_ids):
+        super().written(machine_ids)
+        # Ключ upsert - (машина, дата отказа), так что область записи не меняется
+        schedule_rollup_refresh(machine_scopes(machine_ids))
+
+    def build(self, index, data, machine_id, service_company_id, references):
+        failure_node_id = self.resolve_reference(index, 'failure_node', data, references)
+        recovery_method_id = self.resolve_reference(index, 'recovery_method', data, references)
+        if failure_node_id is None or recovery_method_id is None:
+            return None
+        return Reclamation(
+            machine_id=machine_id,
+            failure_date=data['failure_date'],
+            operating_hours=data['operating_hours'],
+            failure_node_id=failure_node_id,
+            failure_description=data['failure_description'],
+            recovery_method_id=recovery_method_id,
+            spare_parts_used=data.get('spare_parts_used', ''),
+            recovery_date=data['recovery_date'],
+            service_company_id=service_company_id,
+        )
@@ -0,0 +1,216 @@
+"""
+Набор замеров списков, карточки, поиска, админки и импорта.
+
+На каждый размер парка (SIZES) генерируется синтетический парк
+(synthetic.FleetGenerator), и каждый случай запрашивается через полный
+стек URL - middleware, права, шаблон - от лица клиента и сервисной
+компании с самыми большими парками и менеджера. Поиск по номеру открыт
+только анонимным пользователям, админка - только менеджеру.
+
+На случай: прогрев, repeat замеров задержки, число запросов к БД за
+последний замер и пик выделенной Python памяти (tracemalloc) за отдельный,
+не входящий в задержку прогон.
+"""
+import os
+import time
+import tracemalloc
+from io import StringIO
+
+import pandas as pd
+from django.contrib import admin
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from .importer import MACHINE_COLUMNS, RECLAMATION_COLUMNS, SERVICE_COLUMNS
+from .management.commands.bench_asgi import percentile
+from .models import Machine, Reclamation, TechnicalService, User
+from .synthetic import FleetGenerator
+
+SIZES = {'small': 200, 'medium': 2000, 'large': 20000}
+PREFIX = 'BEN'
+# Фильтр списка машин: модель и двигатель, подстрокой
+MACHINE_FILTER = 'machine_model=ПД&engine_model=Kubota'
+DATE_FORMAT = '%d.%m.%Y'
+
+
+class QueryCounter:
+    """execute_wrapper, считающий запросы (queries_log ограничен 9000 записей)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(call, repeat, warmup=1):
+    """Задержки, запросы и пик памяти вызова call()"""
+    for _ in range(warmup):
+        call()
+    latencies = []
+    counter = None
+    for _ in range(repeat):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'runs': repeat,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2),
+        'queries': counter.count,
+        'peak_kb': round(peak / 1024),
+    }
+
+
+def role_users(prefix=PREFIX):
+    """Клиент и сервисная компания с самыми большими парками и менеджер (с доступом в админку)"""
+    client = Machine.objects.values('client').annotate(total=Count('pk')).order_by('-total', 'client')[0]
+    service = Machine.objects.filter(service_company__isnull=False).values('service_company').annotate(
+        total=Count('pk')
+    ).order_by('-total', 'service_company')[0]
+    manager, _ = User.objects.get_or_create(
+        username=f'{prefix.lower()}-manager',
+        defaults={'role': 'manager', 'is_staff': True, 'is_superuser': True},
+    )
+    return {
+        'client': User.objects.get(pk=client['client']),
+        'service': User.objects.get(pk=service['service_company']),
+        'manager': manager,
+    }
+
+
+def heaviest_machine(user):
+    """Доступная пользователю машина с самой длинной историей ТО"""
+    return TechnicalService.objects.filter(machine__in=user.get_accessible_machines()).values('machine').annotate(
+        total=Count('pk')
+    ).order_by('-total', 'machine')[0]['machine']
+
+
+def view_cases(users):
+    """[(случай, роль, пользователь или None, адрес)]"""
+    cases = []
+    for role, user in users.items():
+        machine = heaviest_machine(user)
+        cases += [
+            ('machine_list', role, user, reverse('monitoring:machine_list')),
+            ('machine_list_filtered', role, user, f"{reverse('monitoring:machine_list')}?{MACHINE_FILTER}"),
+            ('machine_detail', role, user, reverse('monitoring:machine_detail', args=[machine])),
+            ('technical_service_list', role, user, reverse('monitoring:technical_service_list')),
+            ('reclamation_list', role, user, reverse('monitoring:reclamation_list')),
+        ]
+    serial = Machine.objects.values_list('serial_number', flat=True).get(pk=heaviest_machine(users['manager']))
+    search = f"{reverse('monitoring:machine_search')}?serial_number={serial}"
+    cases.append(('machine_search', 'anonymous', None, search))
+    for model in admin.site._registry:
+        if model._meta.app_label == 'monitoring':
+            opts = model._meta
+            cases.append((
+                f'admin_{opts.model_name}', 'manager', users['manager'],
+                reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist'),
+            ))
+    return cases
+
+
+def get_page(client, url):
+    def call():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise ValueError(f'{url}: ответ {response.status_code}')
+    return call
+
+
+def export_tables(directory):
+    """Парк из БД - в machines/services/reclamations.csv с заголовками выгрузки завода"""
+    def write(name, columns, rows):
+        headers = {field: names[0] for field, names, _, _ in columns}
+        frame = pd.DataFrame.from_records(list(rows), columns=list(headers))
+        for field, _, _, kind in columns:
+            if kind == 'date':
+                frame[field] = pd.to_datetime(frame[field]).dt.strftime(DATE_FORMAT)
+        frame.rename(columns=headers).to_csv(os.path.join(directory, f'{name}.csv'), index=False)
+
+    write('machines', MACHINE_COLUMNS, Machine.objects.order_by('pk').values_list(
+        'serial_number', 'machine_model__name', 'engine_model__name', 'engine_serial',
+        'transmission_model__name', 'transmission_serial', 'drive_axle_model__name', 'drive_axle_serial',
+        'steering_axle_model__name', 'steering_axle_serial', 'shipment_date', 'client__username',
+        'consignee', 'delivery_address', 'equipment', 'service_company__company',
+    ))
+    write('services', SERVICE_COLUMNS, (
+        (*row[:-2], row[-2] or row[-1]) for row in TechnicalService.objects.order_by('pk').values_list(
+            'machine__serial_number', 'service_type__name', 'service_date', 'operating_hours',
+            'work_order_number', 'work_order_date', 'service_organization__name', 'service_organization_name',
+        )
+    ))
+    write('reclamations', RECLAMATION_COLUMNS, Reclamation.objects.order_by('pk').values_list(
+        'machine__serial_number', 'failure_date', 'operating_hours', 'failure_node__name',
+        'failure_description', 'recovery_method__name', 'spare_parts_used', 'recovery_date',
+        'service_company__company',
+    ))
+
+
+def run_size(machines, directory, seed=0, repeat=20, import_repeat=1, progress=None):
+    """
+    Парк из machines машин в текущую БД и замеры по нему.
+    directory - каталог для выгрузки, которую затем перечитывает import_data --full.
+    """
+    fleet = FleetGenerator(seed=seed, prefix=PREFIX).generate(machines)
+    users = role_users()
+    results = {}
+    clients = {}
+    for case, role, user, url in view_cases(users):
+        if role not in clients:
+            clients[role] = Client()
+            if user is not None:
+                clients[role].force_login(user)
+        results[f'{case}:{role}'] = measure(get_page(clients[role], url), repeat)
+        if progress:
+            progress(case, role, results[f'{case}:{role}'])
+
+    export_tables(directory)
+    results['import_data:manager'] = measure(
+        lambda: call_command('import_data', directory, '--full', stdout=StringIO()), import_repeat, warmup=0
+    )
+    if progress:
+        progress('import_data', 'manager', results['import_data:manager'])
+    return {'machines': machines, 'fleet': fleet, 'cases': results}
+
+
+def compare(results, baseline, tolerance=0.5, min_delta_ms=5.0):
+    """
+    Регрессии относительно baseline: больше запросов к БД (число запросов от
+    нагрузки машины не зависит), пик памяти выше более чем на tolerance, медиана
+    задержки выше более чем на tolerance и на min_delta_ms. Задержки сравнимы
+    только между прогонами на одной машине
+    """
+    regressions = []
+    for size, data in results['sizes'].items():
+        base_cases = baseline.get('sizes', {}).get(size, {}).get('cases', {})
+        for case, current in data['cases'].items():
+            base = base_cases.get(case)
+            if base is None:
+                continue
+            label = f'{size} {case}'
+            if current['queries'] > base['queries']:
+                regressions.append(f"{label}: запросов {base['queries']} -> {current['queries']}")
+            if (
+                current['p50_ms'] > base['p50_ms'] * (1 + tolerance)
+                and current['p50_ms'] - base['p50_ms'] > min_delta_ms
+            ):
+                regressions.append(f"{label}: p50 {base['p50_ms']} -> {current['p50_ms']} мс")
+            if current['peak_kb'] > base['peak_kb'] * (1 + tolerance):
+                regressions.append(f"{label}: пик памяти {base['peak_kb']} -> {current['peak_kb']} КБ")
+    return regressions
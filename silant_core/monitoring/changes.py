@@ -0,0 +1,224 @@
+"""
+Лента изменений для синхронизации внешних систем.
+
+Изменения читаются из журнала Change, который пишут триггеры БД при любой
+записи в машины, ТО, рекламации, компоненты и справочники. id журнала
+выдаётся внутри пишущей транзакции, а SQLite пишет одной транзакцией за
+раз, поэтому порядок id совпадает с порядком фиксации: курсор - последний
+прочитанный id, и длинная транзакция (пакет импорта) не проскочит мимо
+него, как проскакивала мимо отметки времени. Запись журнала - только
+ссылка: в ответ попадает текущее состояние записей, видимых пользователю.
+
+Удаление записи приходит в deleted. Туда же приходит запись, ушедшая к
+другому покупателю или сервисной компании: при смене покупателя или
+компании машины, ТО или рекламации триггеры пишут прежнему владельцу
+отметку о потере видимости. Новый владелец получает записи как изменения.
+
+Без курсора сначала выдаются все видимые записи по лентам (id журнала на
+начало - в курсоре), затем журнал с этого id. Журнал хранится RETENTION
+(prune_changes, команда prune_changes); курсор старше хранимого журнала
+отклоняется ResyncRequired - клиент начинает заново без курсора.
+Названия справочников в записях - на момент выдачи; при переименовании
+справочника меняется только его собственная лента.
+"""
+import base64
+import json
+from datetime import timedelta
+
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Change, Component, Reclamation, TechnicalService
+from .serializers import (
+    REFERENCE_MODELS, MachineSerializer, ReclamationSerializer, TechnicalServiceSerializer,
+    queryset_columns, reference_serializer
+)
+
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+RETENTION = timedelta(days=30)
+
+
+class InvalidChangesCursor(Exception):
+    pass
+
+
+class ResyncRequired(Exception):
+    """Курсор старше хранимого журнала: часть изменений уже удалена"""
+
+
+class ComponentSerializer(serializers.ModelSerializer):
+    wear_percentage = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Component
+        fields = [
+            'id', 'machine', 'name', 'part_number', 'lifetime_hours', 'install_date',
+            'current_hours', 'wear_percentage', 'updated_at',
+        ]
+        column_sources = {'wear_percentage': ['lifetime_hours', 'current_hours']}
+
+
+def visible_components(user):
+    return Component.objects.filter(machine__in=user.get_accessible_machines().values('pk'))
+
+
+# Лента -> (сериализатор, записи, видимые пользователю). Названия лент - в триггерах миграции 0015
+FEEDS = {
+    'machines': (MachineSerializer, lambda user: user.get_accessible_machines()),
+    'technical-services': (TechnicalServiceSerializer, TechnicalService.get_visible_to_user),
+    'reclamations': (ReclamationSerializer, Reclamation.get_visible_to_user),
+    'components': (ComponentSerializer, visible_components),
+}
+for prefix, reference_model in REFERENCE_MODELS:
+    FEEDS[prefix] = (
+        reference_serializer(reference_model),
+        lambda user, model=reference_model: model.objects.all(),
+    )
+
+
+def encode_cursor(position):
+    payload = json.dumps(position, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Курсор -> {'seq': id журнала} или, пока идёт первичная выдача,
+    {'seq', 'feed', 'pk'} - лента и последний выданный id в ней
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception as exc:
+        raise InvalidChangesCursor(cursor) from exc
+    if isinstance(payload, dict) and 'seq' not in payload:
+        # Курсор прежнего формата (позиции лент по времени изменения)
+        raise ResyncRequired(cursor)
+    try:
+        position = {'seq': int(payload['seq'])}
+        if 'feed' in payload:
+            if payload['feed'] not in FEEDS:
+                raise ValueError(payload['feed'])
+            position.update(feed=payload['feed'], pk=int(payload['pk']))
+        return position
+    except Exception as exc:
+        raise InvalidChangesCursor(cursor) from exc
+
+
+def last_seq():
+    return Change.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def check_retention(seq):
+    """Записи журнала после seq ещё не удалены"""
+    oldest = Change.objects.order_by('pk').values_list('pk', flat=True).first()
+    if oldest is not None and seq < oldest - 1:
+        raise ResyncRequired(seq)
+
+
+def feed_rows(user, feed, ids=None, after=None, limit=None):
+    serializer_class, visible = FEEDS[feed]
+    queryset = queryset_columns(visible(user), serializer_class(), extra=['updated_at'])
+    if ids is not None:
+        queryset = queryset.filter(pk__in=ids)
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    queryset = queryset.order_by('pk')
+    return list(queryset if limit is None else queryset[:limit])
+
+
+def collect_snapshot(user, position, limit):
+    """Первичная выдача: все видимые записи по лентам, по id"""
+    feeds = list(FEEDS)
+    start = feeds.index(position['feed']) if 'feed' in position else 0
+    after = position.get('pk')
+    changes = {}
+    for feed in feeds[start:]:
+        rows = feed_rows(user, feed, after=after, limit=limit + 1)
+        after = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            changes[feed] = FEEDS[feed][0](rows, many=True).data
+            return changes, {'seq': position['seq'], 'feed': feed, 'pk': rows[-1].pk}, True
+        if rows:
+            changes[feed] = FEEDS[feed][0](rows, many=True).data
+            limit -= len(rows)
+        if not limit:
+            following = feeds[feeds.index(feed) + 1:]
+            if following:
+                return changes, {'seq': position['seq'], 'feed': following[0], 'pk': 0}, True
+    return changes, {'seq': position['seq']}, False
+
+
+def collect_log(user, seq, limit):
+    """Записи журнала после seq -> текущее состояние затронутых записей"""
+    # Граница читается первой: записи журнала не выше неё уже зафиксированы
+    until = last_seq()
+    entries = list(
+        Change.get_visible_to_user(user).filter(pk__gt=seq, pk__lte=until).order_by('pk').values_list(
+            'pk', 'feed', 'object_id', 'kind'
+        )[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    if has_more:
+        entries = entries[:limit]
+        until = entries[-1][0]
+
+    touched = {}
+    gone = {}
+    for _, feed, object_id, kind in entries:
+        if feed not in FEEDS:
+            continue
+        touched.setdefault(feed, set()).add(object_id)
+        if kind != Change.SAVED:
+            gone.setdefault(feed, set()).add(object_id)
+
+    changes = {}
+    deleted = []
+    for feed, ids in touched.items():
+        rows = feed_rows(user, feed, ids=ids)
+        if rows:
+            changes[feed] = FEEDS[feed][0](rows, many=True).data
+        # Видимая сейчас запись не удалена, даже если раньше уходила к другому владельцу
+        visible = {row.pk for row in rows}
+        deleted += [{'feed': feed, 'id': object_id} for object_id in sorted(gone.get(feed, set()) - visible)]
+    return changes, deleted, {'seq': until}, has_more
+
+
+def collect_changes(user, cursor=None, limit=PAGE_SIZE):
+    """
+    Изменения, видимые пользователю, после курсора: {'cursor', 'has_more',
+    'changes': {лента: [...]}, 'deleted': [{'feed', 'id'}]}. Пока has_more,
+    клиент повторяет запрос с новым курсором.
+    """
+    position = decode_cursor(cursor)
+    if position is None:
+        position = {'seq': last_seq(), 'feed': next(iter(FEEDS)), 'pk': 0}
+    else:
+        check_retention(position['seq'])
+
+    if 'feed' in position:
+        changes, position, has_more = collect_snapshot(user, position, limit)
+        deleted = []
+    else:
+        changes, deleted, position, has_more = collect_log(user, position['seq'], limit)
+
+    return {
+        'cursor': encode_cursor(position),
+        'has_more': has_more,
+        'changes': changes,
+        'deleted': deleted,
+    }
+
+
+def prune_changes(retention=RETENTION):
+    """
+    Удалить записи журнала старше retention. Последняя запись остаётся, чтобы
+    по ней было видно, до какого id журнал удалён. -> число удалённых записей
+    """
+    latest = last_seq()
+    deleted, _ = Change.objects.filter(created_at__lt=timezone.now() - retention, pk__lt=latest).delete()
+    return deleted
@@ -0,0 +1,65 @@
+"""
+Полная выгрузка парка в NDJSON: строка на машину с её ТО и рекламациями.
+
+Машины читаются через iterator(chunk_size=...), и prefetch_related
+выполняется на каждый пакет машин отдельно, поэтому в памяти одновременно
+только один пакет, а первая строка уходит клиенту сразу после первого пакета.
+Состав полей - тот же, что в API машин, ТО и рекламаций.
+"""
+import json
+
+from django.db.models import Prefetch
+
+from .models import Reclamation, TechnicalService
+from .serializers import MachineSerializer, ReclamationSerializer, TechnicalServiceSerializer, queryset_columns
+
+CHUNK_SIZE = 500
+# Машина у вложенных записей известна из строки, повторять её не нужно
+NESTED_EXCLUDE = ('machine', 'machine_serial_number')
+
+
+class DumpTechnicalServiceSerializer(TechnicalServiceSerializer):
+    class Meta(TechnicalServiceSerializer.Meta):
+        fields = [name for name in TechnicalServiceSerializer.Meta.fields if name not in NESTED_EXCLUDE]
+
+
+class DumpReclamationSerializer(ReclamationSerializer):
+    class Meta(ReclamationSerializer.Meta):
+        fields = [name for name in ReclamationSerializer.Meta.fields if name not in NESTED_EXCLUDE]
+
+
+class DumpMachineSerializer(MachineSerializer):
+    technical_services = DumpTechnicalServiceSerializer(many=True, read_only=True)
+    reclamations = DumpReclamationSerializer(many=True, read_only=True)
+
+    class Meta(MachineSerializer.Meta):
+        fields = [*MachineSerializer.Meta.fields, 'technical_services', 'reclamations']
+
+
+def nested(model, serializer_class, user, ordering):
+    # machine_id нужен prefetch_related, чтобы разложить записи по машинам
+    queryset = queryset_columns(model.get_visible_to_user(user), serializer_class(), extra=['machine'])
+    return queryset.order_by(ordering, 'pk')
+
+
+def fleet_lines(user, chunk_size=CHUNK_SIZE):
+    """Строки NDJSON (bytes) по всем машинам, видимым пользователю"""
+    serializer = DumpMachineSerializer()
+    machines = queryset_columns(user.get_accessible_machines(), MachineSerializer())
+    machines = machines.order_by('pk').prefetch_related(
+        Prefetch('technical_services', queryset=nested(
+            TechnicalService, DumpTechnicalServiceSerializer, user, 'service_date'
+        )),
+        Prefetch('reclamations', queryset=nested(
+            Reclamation, DumpReclamationSerializer, user, 'failure_date'
+        )),
+    )
+    lines = []
+    for machine in machines.iterator(chunk_size=chunk_size):
+        lines.append(json.dumps(serializer.to_representation(machine), ensure_ascii=False, separators=(',', ':')))
+        # Отдаём пакетами: строка на машину - слишком мелкие записи в сокет
+        if len(lines) == chunk_size:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
@@ -1,37 +1,52 @@
 import django_filters
 from django import forms
-from .models import Machine, User, TechnicalService, Reclamation
+from django_filters.constants import EMPTY_VALUES
+from .models import FailureNode, MachineSummary, RecoveryMethod, ServiceType, User, TechnicalService, Reclamation
+from .references import matching_ids
+
+
+class ReferenceNameFilter(django_filters.CharFilter):
+    """Поиск по части названия справочника: подходящие id берутся из кеша справочников, без JOIN"""
+
+    def __init__(self, *args, reference_model=None, **kwargs):
+        self.reference_model = reference_model
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        return qs.filter(**{f'{self.field_name}__in': matching_ids(self.reference_model, value)})
 
 
 class MachineFilter(django_filters.FilterSet):
     machine_model = django_filters.CharFilter(
-        field_name='machine_model__name',
+        field_name='machine_model_name',
         lookup_expr='icontains',
         label='Модель техники'
     )
     engine_model = django_filters.CharFilter(
-        field_name='engine_model__name',
+        field_name='engine_model_name',
         lookup_expr='icontains',
         label='Модель двигателя'
     )
     transmission_model = django_filters.CharFilter(
-        field_name='transmission_model__name',
+        field_name='transmission_model_name',
         lookup_expr='icontains',
         label='Модель трансмиссии'
     )
     drive_axle_model = django_filters.CharFilter(
-        field_name='drive_axle_model__name',
+        field_name='drive_axle_model_name',
         lookup_expr='icontains',
         label='Модель ведущего моста'
     )
     steering_axle_model = django_filters.CharFilter(
-        field_name='steering_axle_model__name',
+        field_name='steering_axle_model_name',
         lookup_expr='icontains',
         label='Модель управляемого моста'
     )
 
     class Meta:
-        model = Machine
+        model = MachineSummary
         fields = [
             'machine_model',
             'engine_model',
@@ -42,9 +57,9 @@ class MachineFilter(django_filters.FilterSet):
 
 
 class TechnicalServiceFilter(django_filters.FilterSet):
-    service_type = django_filters.CharFilter(
-        field_name='service_type__name',
-        lookup_expr='icontains',
+    service_type = ReferenceNameFilter(
+        field_name='service_type',
+        reference_model=ServiceType,
         label='Вид ТО'
     )
     machine_serial_number = django_filters.CharFilter(
@@ -62,14 +77,14 @@ class TechnicalServiceFilter(django_filters.FilterSet):
 
 
 class ReclamationFilter(django_filters.FilterSet):
-    failure_node = django_filters.CharFilter(
-        field_name='failure_node__name',
-        lookup_expr='icontains',
+    failure_node = ReferenceNameFilter(
+        field_name='failure_node',
+        reference_model=FailureNode,
         label='Узел отказа'
     )
-    recovery_method = django_filters.CharFilter(
-        field_name='recovery_method__name',
-        lookup_expr='icontains',
+    recovery_method = ReferenceNameFilter(
+        field_name='recovery_method',
+        reference_model=RecoveryMethod,
         label='Способ восстановления'
     )
 
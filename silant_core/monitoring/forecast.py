@@ -0,0 +1,215 @@
+"""
+Прогноз следующего ТО каждого вида по машине.
+
+Темп работы машины (м/час в сутки) - наклон прямой наименьших квадратов
+через её ТО (дата, наработка) и отгрузку (дата отгрузки, 0 м/час).
+Периодичность вида ТО - медиана наработки между соседними ТО этого вида на
+одной машине по всему парку. Следующее ТО вида ждём на наработке
+последнего ТО этого вида плюс периодичность, а дату считаем от последнего
+ТО машины с её темпом.
+
+Всё считается массивами NumPy сразу по всем машинам пакета: суммы по
+машинам - np.bincount, последние ТО - lexsort. Периодичности - только при
+полной пересборке (команда forecast_maintenance), между пересборками они
+лежат в кеше и пересчёт отдельных машин после изменения ТО берёт их оттуда.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Machine, MaintenanceForecast, TechnicalService
+
+BATCH_SIZE = 1000
+INTERVALS_CACHE_KEY = 'forecast:intervals'
+# Дальше горизонта прогноз не храним: машина почти не работает
+HORIZON_DAYS = 10 * 365
+
+FORECAST_COLUMNS = [
+    'machine', 'service_type', 'client', 'service_company', 'hours_per_day', 'last_service_date',
+    'last_service_hours', 'interval_hours', 'next_service_hours', 'due_date',
+]
+
+
+def load_fleet(machines):
+    """Машины -> массивы id, дня отгрузки, покупателя и сервисной компании (0 - нет)"""
+    rows = list(machines.order_by('id').values_list('id', 'shipment_date', 'client_id', 'service_company_id'))
+    ids, shipped, clients, companies = zip(*rows) if rows else ((), (), (), ())
+    return (
+        np.array(ids, dtype=np.int64),
+        np.array([day.toordinal() for day in shipped], dtype=np.int64),
+        np.array(clients, dtype=np.int64),
+        np.array([company or 0 for company in companies], dtype=np.int64),
+    )
+
+
+def load_services(services):
+    """ТО -> массивы машины, вида ТО, дня и наработки"""
+    rows = list(services.order_by().values_list('machine_id', 'service_type_id', 'service_date', 'operating_hours'))
+    machines, types, days, hours = zip(*rows) if rows else ((), (), (), ())
+    return (
+        np.array(machines, dtype=np.int64),
+        np.array(types, dtype=np.int64),
+        np.array([day.toordinal() for day in days], dtype=np.int64),
+        np.array(hours, dtype=np.int64),
+    )
+
+
+def group_last(groups, within):
+    """
+    Порядок строк по группам (главный ключ - последний), внутри группы - по
+    within, и маска последней строки каждой группы в этом порядке
+    """
+    order = np.lexsort((*within, *groups))
+    last = np.ones(order.size, dtype=bool)
+    if order.size:
+        ordered = [key[order] for key in groups]
+        last[:-1] = np.any([key[1:] != key[:-1] for key in ordered], axis=0)
+    return order, last
+
+
+def service_intervals(machines, types, days, hours):
+    """Вид ТО -> медиана наработки между соседними ТО этого вида на машине"""
+    order, _ = group_last((types, machines), (hours, days))
+    machines, types, hours = machines[order], types[order], hours[order]
+    same = (machines[1:] == machines[:-1]) & (types[1:] == types[:-1])
+    gaps = np.diff(hours)[same]
+    gap_types = types[1:][same]
+    keep = gaps > 0
+    gaps, gap_types = gaps[keep], gap_types[keep]
+
+    # Медиана по группам: сортировка по (вид, промежуток) и середина каждой группы
+    order = np.lexsort((gaps, gap_types))
+    gaps, gap_types = gaps[order], gap_types[order]
+    keys, starts, counts = np.unique(gap_types, return_index=True, return_counts=True)
+    medians = (gaps[starts + (counts - 1) // 2] + gaps[starts + counts // 2]) / 2
+    return {int(key): int(round(median)) for key, median in zip(keys, medians)}
+
+
+def forecast_rows(fleet, services, intervals):
+    """Строки прогноза (кортежи значений FORECAST_COLUMNS) для машин fleet по их ТО services"""
+    ids, shipped, clients, companies = fleet
+    machines, types, days, hours = services
+    if not machines.size:
+        return []
+    position = np.searchsorted(ids, machines)
+
+    # Наклон прямой по точкам ТО и отгрузки, суммы по машинам через bincount
+    base = shipped.min()
+    x = np.concatenate([days, shipped]) - base
+    y = np.concatenate([hours, np.zeros(ids.size, dtype=np.int64)]).astype(float)
+    group = np.concatenate([position, np.arange(ids.size)])
+    n = np.bincount(group, minlength=ids.size)
+    sx = np.bincount(group, weights=x, minlength=ids.size)
+    sy = np.bincount(group, weights=y, minlength=ids.size)
+    sxx = np.bincount(group, weights=x * x, minlength=ids.size)
+    sxy = np.bincount(group, weights=x * y, minlength=ids.size)
+    denominator = n * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = np.where(denominator > 0, (n * sxy - sx * sy) / denominator, 0.0)
+
+    # Последнее ТО машины - точка отсчёта
+    order, last = group_last((position,), (hours, days))
+    anchor_day = np.zeros(ids.size, dtype=np.int64)
+    anchor_hours = np.zeros(ids.size, dtype=np.int64)
+    anchor_day[position[order][last]] = days[order][last]
+    anchor_hours[position[order][last]] = hours[order][last]
+
+    # Последнее ТО каждого вида на машине
+    order, last = group_last((types, position), (hours, days))
+    pick = order[last]
+    machine_at, type_at = position[pick], types[pick]
+    last_day, last_hours = days[pick], hours[pick]
+    interval = np.array([intervals.get(int(key), 0) for key in type_at], dtype=np.int64)
+    next_hours = last_hours + interval
+    machine_rate = rate[machine_at]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_left = (next_hours - anchor_hours[machine_at]) / machine_rate
+    keep = (interval > 0) & (machine_rate > 0) & (days_left <= HORIZON_DAYS)
+    # ТО не может понадобиться раньше, чем прошло последнее ТО этого вида
+    due = np.maximum(anchor_day[machine_at] + np.ceil(np.where(keep, days_left, 0)), last_day + 1).astype(np.int64)
+
+    adapt_date = connection.ops.adapt_datefield_value
+    return [
+        (
+            int(ids[machine]),
+            int(type_at[index]),
+            int(clients[machine]),
+            int(companies[machine]) or None,
+            round(float(machine_rate[index]), 2),
+            adapt_date(date.fromordinal(int(last_day[index]))),
+            int(last_hours[index]),
+            int(interval[index]),
+            int(next_hours[index]),
+            adapt_date(date.fromordinal(int(due[index]))),
+        )
+        for index, machine in zip(np.flatnonzero(keep), machine_at[keep])
+    ]
+
+
+def write_rows(rows):
+    """
+    Вставка строк прогноза одним executemany на пакет: сотни тысяч
+    экземпляров модели для bulk_create стоили бы в разы дороже расчёта
+    """
+    table = connection.ops.quote_name(MaintenanceForecast._meta.db_table)
+    columns = ', '.join(
+        connection.ops.quote_name(MaintenanceForecast._meta.get_field(name).column) for name in FORECAST_COLUMNS
+    )
+    placeholders = ', '.join(['%s'] * len(FORECAST_COLUMNS))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), BATCH_SIZE):
+            cursor.executemany(
+                f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', rows[start:start + BATCH_SIZE]
+            )
+
+
+def stored_intervals():
+    """Периодичности последней пересборки; без неё - посчитать по парку"""
+    intervals = cache.get(INTERVALS_CACHE_KEY)
+    if intervals is None:
+        intervals = service_intervals(*load_services(TechnicalService.objects.all()))
+        cache.set(INTERVALS_CACHE_KEY, intervals, None)
+    return intervals
+
+
+def refresh_forecasts(machine_ids):
+    """Пересчитать прогноз для указанных машин"""
+    machine_ids = sorted({pk for pk in machine_ids if pk is not None})
+    if not machine_ids:
+        return
+    intervals = stored_intervals()
+    with transaction.atomic():
+        for start in range(0, len(machine_ids), BATCH_SIZE):
+            batch = machine_ids[start:start + BATCH_SIZE]
+            MaintenanceForecast.objects.filter(machine_id__in=batch).delete()
+            rows = forecast_rows(
+                load_fleet(Machine.objects.filter(pk__in=batch)),
+                load_services(TechnicalService.objects.filter(machine_id__in=batch)),
+                intervals,
+            )
+            write_rows(rows)
+
+
+def rebuild_forecasts():
+    """Пересчитать периодичности и весь прогноз; возвращает число строк"""
+    services = load_services(TechnicalService.objects.all())
+    intervals = service_intervals(*services)
+    rows = forecast_rows(load_fleet(Machine.objects.all()), services, intervals)
+    with transaction.atomic():
+        MaintenanceForecast.objects.all().delete()
+        write_rows(rows)
+    cache.set(INTERVALS_CACHE_KEY, intervals, None)
+    return len(rows)
+
+
+def schedule_forecast_refresh(*machine_ids):
+    """Пересчёт после фиксации текущей транзакции (или сразу в autocommit)"""
+    transaction.on_commit(lambda: refresh_forecasts(machine_ids))
+
+
+def due_within(forecasts, days):
+    """ТО, ожидаемые в ближайшие days дней, вместе с просроченными; раньше - первые"""
+    return forecasts.filter(due_date__lte=timezone.localdate() + timedelta(days=days)).order_by('due_date', 'id')
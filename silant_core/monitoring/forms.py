@@ -1,10 +1,57 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.utils.choices import BaseChoiceIterator
 from .models import Machine, TechnicalService, Reclamation, Reference
+from .references import CACHED_REFERENCES, get_reference, reference_names
+
+class ReferenceChoiceIterator(BaseChoiceIterator):
+    """Варианты выбора справочника из кеша процесса, перечитываются при каждом выводе"""
+    def __init__(self, field):
+        self.field = field
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        yield from reference_names(self.field.queryset.model).items()
+
+    def __len__(self):
+        return len(reference_names(self.field.queryset.model)) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(reference_names(self.field.queryset.model))
+
+class CachedReferenceChoiceField(forms.ModelChoiceField):
+    """Выбор из справочника без запросов к БД: варианты и проверка значения - по кешу"""
+    iterator = ReferenceChoiceIterator
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        self.validate_no_null_characters(value)
+        model = self.queryset.model
+        try:
+            obj = get_reference(model, value.pk if isinstance(value, model) else int(value))
+        except (ValueError, TypeError):
+            obj = None
+        if obj is None:
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+        return obj
+
+def reference_formfield(db_field, **kwargs):
+    """formfield_callback форм: поля справочников - из кеша, остальные - как обычно"""
+    if db_field.is_relation and db_field.related_model in CACHED_REFERENCES:
+        kwargs['form_class'] = CachedReferenceChoiceField
+    return db_field.formfield(**kwargs)
 
 class MachineForm(forms.ModelForm):
     class Meta:
         model = Machine
         fields = '__all__'
+        formfield_callback = reference_formfield
         widgets = {
             'shipment_date': forms.DateInput(attrs={'type': 'date'}),
             'created_at': forms.DateTimeInput(attrs={'disabled': True}),
@@ -15,6 +62,7 @@ class TechnicalServiceForm(forms.ModelForm):
     class Meta:
         model = TechnicalService
         fields = '__all__'
+        formfield_callback = reference_formfield
         widgets = {
             'service_date': forms.DateInput(attrs={'type': 'date'}),
             'work_order_date': forms.DateInput(attrs={'type': 'date'}),
@@ -40,11 +88,28 @@ class ReclamationForm(forms.ModelForm):
             'recovery_date',
             'service_company',
         ]
+        formfield_callback = reference_formfield
         widgets = {
             'failure_date': forms.DateInput(attrs={'type': 'date'}),
             'recovery_date': forms.DateInput(attrs={'type': 'date'}),
         }
 
+    def clean(self):
+        """
+        Машины нет среди полей формы, поэтому Django не проверяет ограничение
+        unique_machine_failure_date - проверяем здесь, иначе сохранение упадёт
+        с IntegrityError
+        """
+        cleaned_data = super().clean()
+        failure_date = cleaned_data.get('failure_date')
+        if failure_date and self.instance.machine_id:
+            duplicate = Reclamation.objects.filter(
+                machine_id=self.instance.machine_id, failure_date=failure_date
+            ).exclude(pk=self.instance.pk)
+            if duplicate.exists():
+                self.add_error('failure_date', "У этой машины уже есть рекламация с такой датой отказа")
+        return cleaned_data
+
 class ReferenceForm(forms.ModelForm):
     class Meta:
         model = Reference
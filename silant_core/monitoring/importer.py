@@ -0,0 +1,726 @@
+"""
+Импорт данных из выгрузки завода.
+
+Чтение листа превращается в список словарей с уже очищенными значениями
+(frame_records), а запись идёт пакетами через BulkImporter: справочники и
+пользователи загружаются в память одним запросом на таблицу, недостающие
+создаются bulk_create, машины, ТО и рекламации - upsert'ом
+(bulk_create(update_conflicts=True)). Число запросов не зависит от числа строк.
+
+Для каждой записанной строки хранится хэш содержимого (ImportedRow), и при
+повторном импорте строки с тем же хэшем не перезаписываются.
+
+Кроме книги Excel, те же данные читаются из CSV или Parquet (source_tables):
+колонки там однотипные и очищаются целиком, без разбора по ячейкам.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # нужен только для Parquet
+    pq = None
+
+from .models import (
+    DriveAxleModel, EngineModel, FailureNode, ImportedRow, Machine, MachineModel, Reclamation,
+    RecoveryMethod, ServiceOrganization, ServiceType, SteeringAxleModel,
+    TechnicalService, TransmissionModel, User
+)
+from .references import reference_ids as cached_reference_ids, schedule_version_bump
+
+BATCH_SIZE = 500
+
+# (поле записи, варианты заголовка, обязательная колонка, тип значения)
+MACHINE_COLUMNS = [
+    ('serial_number', ['Зав. № машины'], True, 'text'),
+    ('machine_model', ['Модель техники'], True, 'text'),
+    ('engine_model', ['Модель двигателя'], True, 'text'),
+    ('engine_serial', ['Зав. № двигателя'], False, 'text'),
+    ('transmission_model', ['Модель трансмиссии (производитель, артикул)'], True, 'text'),
+    ('transmission_serial', ['Зав. № трансмиссии'], False, 'text'),
+    ('drive_axle_model', ['Модель ведущего моста'], True, 'text'),
+    ('drive_axle_serial', ['Зав. № ведущего моста'], False, 'text'),
+    ('steering_axle_model', ['Модель управляемого моста'], True, 'text'),
+    ('steering_axle_serial', ['Зав. № управляемого моста'], False, 'text'),
+    ('shipment_date', ['Дата отгрузки с завода'], True, 'date'),
+    ('client', ['Покупатель'], True, 'text'),
+    ('consignee', ['Грузополучатель (конечный потребитель)'], False, 'text'),
+    ('delivery_address', ['Адрес поставки (эксплуатации)'], False, 'text'),
+    ('equipment', ['Комплектация (доп. опции)'], False, 'text'),
+    ('service_company', ['Сервисная компания'], False, 'text'),
+]
+
+SERVICE_COLUMNS = [
+    ('serial_number', ['Зав. № машины'], True, 'text'),
+    ('service_type', ['Вид ТО'], True, 'text'),
+    ('service_date', ['Дата проведения ТО'], True, 'date'),
+    ('operating_hours', ['Наработка, м/час'], True, 'int'),
+    ('work_order_number', ['№ заказ-наряда'], False, 'text'),
+    ('work_order_date', ['Дата заказ-наряда'], False, 'date'),
+    ('service_organization', ['Организация, проводившая ТО'], False, 'text'),
+]
+
+RECLAMATION_COLUMNS = [
+    ('serial_number', ['Зав. № машины'], True, 'text'),
+    ('failure_date', ['Дата отказа'], True, 'date'),
+    ('operating_hours', ['Наработка, м/час'], True, 'int'),
+    ('failure_node', ['Узел отказа'], False, 'text'),
+    ('failure_description', ['Описание отказа'], False, 'text'),
+    ('recovery_method', ['Способ восстановления'], False, 'text'),
+    ('spare_parts_used', ['Используемые запасные части'], False, 'text'),
+    ('recovery_date', ['Дата восстановления'], False, 'date'),
+    ('service_company', ['Сервисная компания'], False, 'text'),
+]
+
+# Лист книги: (имя или индекс листа, строка заголовка, колонки)
+SHEETS = {
+    'machines': (0, 2, MACHINE_COLUMNS),
+    'services': ('ТО output', 0, SERVICE_COLUMNS),
+    'reclamations': ('рекламация output', 1, RECLAMATION_COLUMNS),
+}
+
+# Выгрузка из ERP: файлы machines, services, reclamations с теми же заголовками, что в книге
+TABLE_SUFFIXES = ('.parquet', '.csv')
+
+MACHINE_REFERENCES = {
+    'machine_model': MachineModel,
+    'engine_model': EngineModel,
+    'transmission_model': TransmissionModel,
+    'drive_axle_model': DriveAxleModel,
+    'steering_axle_model': SteeringAxleModel,
+}
+
+ORGANIZATION_DEFAULTS = {'address': '', 'contact_person': '', 'contact_phone': ''}
+
+
+def get_column(columns, possible_names, required=True):
+    for name in possible_names:
+        for col in columns:
+            if str(col).strip().lower() == name.strip().lower():
+                return col
+    if required:
+        raise ValueError(f"Не найдена обязательная колонка: {possible_names}")
+    return None
+
+
+def clean_text(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        # Заводские номера Excel отдаёт числами: 45.0 -> '45'
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def map_unique(series, convert):
+    """
+    convert(значения) для каждого различного значения один раз: даты, номера машин
+    и виды ТО в выгрузке повторяются, и разбор по уникальным в разы быстрее.
+    """
+    codes, uniques = pd.factorize(series)
+    # Код -1 у пропусков попадает на добавленный в конец None
+    values = np.array([*convert(np.asarray(uniques, dtype=object)), None], dtype=object)
+    return values[codes].tolist()
+
+
+def clean_texts(series):
+    return map_unique(series, lambda values: [clean_text(value) for value in values])
+
+
+def parse_dates(values):
+    dates = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce', dayfirst=True)
+    return dates.dt.date.astype(object).where(dates.notna(), None)
+
+
+def clean_dates(series):
+    return map_unique(series, parse_dates)
+
+
+def clean_ints(series):
+    return pd.to_numeric(series, errors='coerce').fillna(0).astype('int64').clip(lower=0).tolist()
+
+
+CLEANERS = {
+    'text': clean_texts,
+    'date': clean_dates,
+    'int': clean_ints,
+}
+
+
+def build_records(raw, size, columns):
+    """{поле: сырые значения колонки или None} -> список очищенных записей"""
+    data = {}
+    for field, _, _, kind in columns:
+        values = raw.get(field)
+        if values is None:
+            data[field] = [0 if kind == 'int' else None] * size
+        else:
+            if not isinstance(values, pd.Series):
+                values = pd.Series(values, dtype=object)
+            data[field] = CLEANERS[kind](values)
+    return [
+        record for record in (dict(zip(data, values)) for values in zip(*data.values()))
+        if record['serial_number']
+    ]
+
+
+def frame_records(df, columns, typed=False):
+    """
+    DataFrame листа -> список словарей {поле: очищенное значение}.
+    typed - колонки уже однотипные (CSV, Parquet) и чистятся целиком, без разбора по ячейкам.
+    """
+    df.columns = [str(col).strip() for col in df.columns]
+    raw = {}
+    for field, names, required, _ in columns:
+        col = get_column(df.columns, names, required)
+        if col is not None:
+            raw[field] = df[col] if typed else df[col].astype(object)
+    return build_records(raw, len(df), columns)
+
+
+def read_sheet(file_path, name):
+    sheet_name, header, columns = SHEETS[name]
+    df = pd.read_excel(file_path, sheet_name=sheet_name, header=header)
+    return frame_records(df, columns)
+
+
+def iter_sheet_chunks(file_path, name, chunk_size):
+    """
+    Потоковое чтение листа через openpyxl read_only: в памяти держится только
+    текущий пакет из chunk_size строк, а не весь лист.
+    """
+    sheet_name, header, columns = SHEETS[name]
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = open_sheet(workbook, sheet_name).iter_rows(values_only=True)
+        for _ in range(header):
+            next(rows, None)
+        titles = ['' if value is None else str(value).strip() for value in next(rows, ())]
+
+        positions = {}
+        for field, names, required, _ in columns:
+            col = get_column(titles, names, required)
+            if col is not None:
+                positions[field] = titles.index(col)
+
+        def chunk_records(chunk):
+            raw = {
+                field: [row[index] if index < len(row) else None for row in chunk]
+                for field, index in positions.items()
+            }
+            return build_records(raw, len(chunk), columns)
+
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk_records(chunk)
+                chunk = []
+        if chunk:
+            yield chunk_records(chunk)
+    finally:
+        workbook.close()
+
+
+# Ключ строки для хэшей и чекпоинтов: машина - по номеру, ТО и рекламация - по машине и дате
+RECORD_KEYS = {
+    'machines': lambda record: record['serial_number'],
+    'services': lambda record: f"{record['serial_number']}|{record['service_date']}",
+    'reclamations': lambda record: f"{record['serial_number']}|{record['failure_date']}",
+}
+
+
+def open_sheet(workbook, sheet_name):
+    if isinstance(sheet_name, int):
+        return workbook.worksheets[sheet_name]
+    return workbook[sheet_name]
+
+
+def sheet_size(file_path, name):
+    """Число строк данных по размерности листа, без чтения самих строк"""
+    sheet_name, header, _ = SHEETS[name]
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        max_row = open_sheet(workbook, sheet_name).max_row or 0
+    finally:
+        workbook.close()
+    return max(max_row - header - 1, 0)
+
+
+def table_path(directory, name):
+    for suffix in TABLE_SUFFIXES:
+        path = os.path.join(directory, name + suffix)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def source_tables(file_path):
+    """
+    {лист: файл} для выгрузки в CSV/Parquet: каталог с файлами machines, services,
+    reclamations или один такой файл. None - источник является книгой Excel.
+    """
+    if os.path.isdir(file_path):
+        tables = {name: table_path(file_path, name) for name in SHEETS}
+        return {name: path for name, path in tables.items() if path}
+    stem, suffix = os.path.splitext(os.path.basename(file_path))
+    if suffix.lower() not in TABLE_SUFFIXES:
+        return None
+    if stem not in SHEETS:
+        raise ValueError(f"Файл {file_path} должен называться одним из: {', '.join(SHEETS)}")
+    return {stem: file_path}
+
+
+def parquet_file(path):
+    if pq is None:
+        raise ValueError("Для чтения Parquet нужен пакет pyarrow")
+    return pq.ParquetFile(path)
+
+
+def csv_options(path, columns):
+    """Разделитель по строке заголовка и только нужные колонки, все как строки"""
+    with open(path, encoding='utf-8-sig') as file:
+        header = file.readline()
+    wanted = {name.strip().lower() for _, names, _, _ in columns for name in names}
+    return {
+        'sep': ';' if header.count(';') > header.count(',') else ',',
+        'encoding': 'utf-8-sig',
+        'dtype': 'string',
+        'usecols': lambda col: col.strip().lower() in wanted,
+    }
+
+
+def parquet_columns(parquet, columns):
+    wanted = {name.strip().lower() for _, names, _, _ in columns for name in names}
+    return [col for col in parquet.schema_arrow.names if col.strip().lower() in wanted]
+
+
+def iter_table_frames(path, columns, chunk_size=None):
+    if path.lower().endswith('.parquet'):
+        parquet = parquet_file(path)
+        selected = parquet_columns(parquet, columns)
+        if chunk_size is None:
+            yield parquet.read(columns=selected).to_pandas().convert_dtypes()
+            return
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=selected):
+            # convert_dtypes: строки -> string, целые float -> Int64 - для векторной очистки
+            yield batch.to_pandas().convert_dtypes()
+    elif chunk_size is None:
+        yield pd.read_csv(path, **csv_options(path, columns))
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, **csv_options(path, columns))
+
+
+def read_table(path, name):
+    columns = SHEETS[name][2]
+    return frame_records(next(iter_table_frames(path, columns)), columns, typed=True)
+
+
+def iter_table_chunks(path, name, chunk_size):
+    columns = SHEETS[name][2]
+    for df in iter_table_frames(path, columns, chunk_size):
+        yield frame_records(df, columns, typed=True)
+
+
+def table_size(path):
+    if path.lower().endswith('.parquet'):
+        return parquet_file(path).metadata.num_rows
+    lines = 0
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            lines += block.count(b'\n')
+    return max(lines - 1, 0)
+
+
+# Общий вход для книги Excel и CSV/Parquet
+def source_sheets(file_path):
+    tables = source_tables(file_path)
+    return list(SHEETS) if tables is None else list(tables)
+
+
+def read_records(file_path, name):
+    tables = source_tables(file_path)
+    if tables is None:
+        return read_sheet(file_path, name)
+    return read_table(tables[name], name)
+
+
+def iter_record_chunks(file_path, name, chunk_size):
+    tables = source_tables(file_path)
+    if tables is None:
+        return iter_sheet_chunks(file_path, name, chunk_size)
+    return iter_table_chunks(tables[name], name, chunk_size)
+
+
+def count_records(file_path, name):
+    tables = source_tables(file_path)
+    if tables is None:
+        return sheet_size(file_path, name)
+    return table_size(tables[name])
+
+
+def row_digest(record, extra=None):
+    payload = json.dumps([*record.values(), extra], default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def parse_sheet(file_path, name):
+    """
+    Разбор листа для пула процессов: записи в виде кортежей в порядке колонок
+    SHEETS[name] - так результат компактнее при передаче между процессами.
+    """
+    fields = [field for field, *_ in SHEETS[name][2]]
+    return [tuple(record[field] for field in fields) for record in read_records(file_path, name)]
+
+
+def unpack_records(name, rows):
+    """Обратное преобразование записей из parse_sheet в список словарей"""
+    fields = [field for field, *_ in SHEETS[name][2]]
+    return [dict(zip(fields, row)) for row in rows]
+
+
+class BulkImporter:
+    """Пакетная запись очищенных записей в БД; вызывать внутри transaction.atomic()"""
+
+    def __init__(self, warn=None, batch_size=BATCH_SIZE, incremental=True):
+        self.warn = warn or (lambda message: None)
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.references = {}
+        self.users_by_username = None
+        self.service_by_company = None
+        self.machines = None
+        # Хэши строк прошлых импортов, увиденные ключи и счётчики - по листам
+        self.digests = {}
+        self.seen = {}
+        self.stats = {}
+        self.touched_serials = set()
+        # {id машины: (прежняя модель, новая)} - для пересчёта свёртки в обеих моделях
+        self.moved_machines = {}
+
+    # ---------- хэши строк ----------
+    def sheet_digests(self, sheet):
+        if sheet not in self.digests:
+            self.digests[sheet] = dict(
+                ImportedRow.objects.filter(sheet=sheet).values_list('key', 'digest')
+            )
+            self.seen[sheet] = set()
+            self.stats[sheet] = dict.fromkeys(('inserted', 'updated', 'skipped'), 0)
+        return self.digests[sheet]
+
+    def changed_records(self, sheet, records, extra=None):
+        """(ключ, хэш, запись) для строк, изменившихся с прошлого импорта"""
+        digests = self.sheet_digests(sheet)
+        key = RECORD_KEYS[sheet]
+        changed = []
+        for record in records:
+            record_key = key(record)
+            digest = row_digest(record, extra(record) if extra else None)
+            self.seen[sheet].add(record_key)
+            if self.incremental and digests.get(record_key) == digest:
+                self.stats[sheet]['skipped'] += 1
+                continue
+            changed.append((record_key, digest, record))
+        return changed
+
+    def skip_records(self, sheet, records):
+        """Строки, уже записанные в прерванном запуске: только учитываем их в счётчиках"""
+        self.sheet_digests(sheet)
+        key = RECORD_KEYS[sheet]
+        self.seen[sheet].update(key(record) for record in records)
+        self.stats[sheet]['skipped'] += len(records)
+
+    def save_digests(self, sheet, written):
+        """written: {ключ: хэш} реально записанных строк"""
+        digests = self.digests[sheet]
+        for key in written:
+            self.stats[sheet]['updated' if key in digests else 'inserted'] += 1
+        ImportedRow.objects.bulk_create(
+            [ImportedRow(sheet=sheet, key=key, digest=digest) for key, digest in written.items()],
+            batch_size=self.batch_size,
+            update_conflicts=True,
+            unique_fields=['sheet', 'key'],
+            update_fields=['digest', 'imported_at'],
+        )
+        digests.update(written)
+
+    def summary(self, sheet):
+        """Счётчики листа: новые, изменённые, пропущенные и строки, которых нет в файле"""
+        digests = self.sheet_digests(sheet)
+        return {**self.stats[sheet], 'orphaned': len(digests.keys() - self.seen[sheet])}
+
+    def pop_touched_machine_ids(self):
+        """Машины, у которых что-то записано с прошлого вызова"""
+        if self.machines is None:
+            self.load_machines()
+        touched = {
+            self.machines[serial][0] for serial in self.touched_serials if serial in self.machines
+        }
+        self.touched_serials = set()
+        return touched
+
+    def pop_moved_machines(self):
+        """Машины, сменившие модель с прошлого вызова: {id: (прежняя модель, новая)}"""
+        moved, self.moved_machines = self.moved_machines, {}
+        return moved
+
+    # ---------- справочники и пользователи ----------
+    def reference_ids(self, model, names, defaults=None):
+        """name -> id; недостающие названия создаются одним bulk_create"""
+        cache = self.references.get(model)
+        if cache is None:
+            cache = self.references[model] = dict(cached_reference_ids(model))
+        missing = sorted({name for name in names if name and name not in cache})
+        if missing:
+            model.objects.bulk_create(
+                [model(name=name, **(defaults or {})) for name in missing],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+            cache.update(model.objects.filter(name__in=missing).values_list('name', 'id'))
+            # bulk_create не вызывает сигналы - новую версию справочников ставим сами
+            schedule_version_bump()
+        return cache
+
+    def load_users(self):
+        self.users_by_username = {}
+        self.service_by_company = {}
+        for pk, username, role, company in User.objects.order_by('pk').values_list(
+            'pk', 'username', 'role', 'company'
+        ):
+            self.users_by_username[username] = pk
+            if role == 'service' and company:
+                self.service_by_company.setdefault(company.lower(), pk)
+
+    def service_user_id(self, company):
+        if not company:
+            return None
+        return self.service_by_company.get(company.lower())
+
+    def ensure_users(self, records):
+        """Создаёт покупателей и сервисные компании, которых ещё нет"""
+        if self.users_by_username is None:
+            self.load_users()
+        new_users = {}
+        for record in records:
+            client = record['client']
+            if client and client not in self.users_by_username:
+                new_users.setdefault(client, User(username=client, role='client'))
+            company = record['service_company']
+            if company and not self.service_user_id(company) and company not in self.users_by_username:
+                new_users.setdefault(company, User(username=company, role='service', company=company))
+        if new_users:
+            User.objects.bulk_create(new_users.values(), batch_size=self.batch_size, ignore_conflicts=True)
+            self.load_users()
+
+    def load_machines(self):
+        self.machines = {
+            serial: (pk, service_company_id, client_id)
+            for serial, pk, service_company_id, client_id in Machine.objects.values_list(
+                'serial_number', 'pk', 'service_company_id', 'client_id'
+            )
+        }
+
+    # ---------- машины ----------
+    def import_machines(self, records):
+        reference_ids = {
+            field: self.reference_ids(model, [record[field] for record in records])
+            for field, model in MACHINE_REFERENCES.items()
+        }
+        self.ensure_users(records)
+
+        machines = {}
+        written = {}
+        for serial, digest, record in self.changed_records('machines', records):
+            missing = [
+                field for field in (*MACHINE_REFERENCES, 'shipment_date', 'client')
+                if not record[field]
+            ]
+            if missing:
+                self.warn(f"Машина {serial} пропущена: не заполнено {', '.join(missing)}")
+                continue
+            company = record['service_company']
+            machines[serial] = Machine(
+                serial_number=serial,
+                **{
+                    f'{field}_id': reference_ids[field][record[field]]
+                    for field in MACHINE_REFERENCES
+                },
+                engine_serial=record['engine_serial'] or '',
+                transmission_serial=record['transmission_serial'] or '',
+                drive_axle_serial=record['drive_axle_serial'] or '',
+                steering_axle_serial=record['steering_axle_serial'] or '',
+                shipment_date=record['shipment_date'],
+                client_id=self.users_by_username[record['client']],
+                consignee=record['consignee'] or '',
+                delivery_address=record['delivery_address'] or '',
+                equipment=record['equipment'] or '',
+                service_company_id=(
+                    self.service_user_id(company) or self.users_by_username[company]
+                ) if company else None,
+            )
+            written[serial] = digest
+
+        serials = list(machines)
+        for start in range(0, len(serials), self.batch_size):
+            for pk, serial, machine_model_id in Machine.objects.filter(
+                serial_number__in=serials[start:start + self.batch_size]
+            ).values_list('pk', 'serial_number', 'machine_model_id'):
+                if machine_model_id != machines[serial].machine_model_id:
+                    self.moved_machines[pk] = (machine_model_id, machines[serial].machine_model_id)
+
+        Machine.objects.bulk_create(
+            machines.values(),
+            batch_size=self.batch_size,
+            update_conflicts=True,
+            unique_fields=['serial_number'],
+            update_fields=[
+                *MACHINE_REFERENCES,
+                'engine_serial', 'transmission_serial', 'drive_axle_serial', 'steering_axle_serial',
+                'shipment_date', 'client', 'consignee', 'delivery_address', 'equipment',
+                'service_company', 'updated_at',
+            ],
+        )
+        self.save_digests('machines', written)
+        self.touched_serials.update(machines)
+        self.machines = None
+        return len(machines)
+
+    def machine(self, serial, what=None):
+        if self.machines is None:
+            self.load_machines()
+        machine = self.machines.get(serial)
+        if machine is None and what is not None:
+            self.warn(f"Машина с номером {serial} не найдена{what}")
+        return machine
+
+    def dated_changes(self, sheet, records):
+        """
+        Сервисная компания машины входит в хэш: от неё зависит значение по умолчанию в записи.
+        Клиента машины в хэше нет - его смену переносит в записи триггер
+        """
+        def machine_company(record):
+            machine = self.machine(record['serial_number'])
+            return machine and machine[:2]
+
+        return self.changed_records(sheet, records, extra=machine_company)
+
+    # ---------- ТО ----------
+    def import_services(self, records):
+        if self.users_by_username is None:
+            self.load_users()
+        service_types = self.reference_ids(ServiceType, [record['service_type'] for record in records])
+        organizations = self.reference_ids(
+            ServiceOrganization,
+            [record['service_organization'] for record in records],
+            defaults=ORGANIZATION_DEFAULTS,
+        )
+
+        services = {}
+        written = {}
+        for key, digest, record in self.dated_changes('services', records):
+            machine = self.machine(record['serial_number'], '')
+            if machine is None:
+                continue
+            machine_id, company_id, client_id = machine
+            if not (record['service_date'] and record['service_type'] and record['work_order_date']):
+                self.warn(
+                    f"ТО машины {record['serial_number']} от {record['service_date']} пропущено: "
+                    f"не заполнены дата, вид ТО или дата заказ-наряда"
+                )
+                continue
+
+            organization = record['service_organization']
+            organization_text = ''
+            if organization:
+                # Организация - сервисная компания из пользователей или просто текст
+                service_user = self.service_user_id(organization)
+                if service_user:
+                    company_id = service_user
+                else:
+                    organization_text = organization
+
+            services[key] = TechnicalService(
+                machine_id=machine_id,
+                service_date=record['service_date'],
+                service_type_id=service_types[record['service_type']],
+                operating_hours=record['operating_hours'],
+                work_order_number=record['work_order_number'] or '',
+                work_order_date=record['work_order_date'],
+                service_organization_id=organizations[organization] if organization else None,
+                service_organization_name=organization_text,
+                service_company_id=company_id,
+                client_id=client_id,
+            )
+            written[key] = digest
+
+        TechnicalService.objects.bulk_create(
+            services.values(),
+            batch_size=self.batch_size,
+            update_conflicts=True,
+            unique_fields=['machine', 'service_date'],
+            update_fields=[
+                'service_type', 'operating_hours', 'work_order_number', 'work_order_date',
+                'service_organization', 'service_organization_name', 'service_company', 'updated_at',
+            ],
+        )
+        self.save_digests('services', written)
+        self.touched_serials.update(key.rsplit('|', 1)[0] for key in written)
+        return len(services)
+
+    # ---------- рекламации ----------
+    def import_reclamations(self, records):
+        if self.users_by_username is None:
+            self.load_users()
+        failure_nodes = self.reference_ids(FailureNode, [record['failure_node'] for record in records])
+        recovery_methods = self.reference_ids(RecoveryMethod, [record['recovery_method'] for record in records])
+
+        reclamations = {}
+        written = {}
+        for key, digest, record in self.dated_changes('reclamations', records):
+            machine = self.machine(record['serial_number'], ' для рекламации')
+            if machine is None:
+                continue
+            machine_id, company_id, client_id = machine
+            if not all(record[field] for field in (
+                'failure_date', 'failure_node', 'recovery_method', 'recovery_date'
+            )):
+                self.warn(
+                    f"Рекламация машины {record['serial_number']} от {record['failure_date']} пропущена: "
+                    f"не заполнены даты, узел отказа или способ восстановления"
+                )
+                continue
+
+            reclamations[key] = Reclamation(
+                machine_id=machine_id,
+                failure_date=record['failure_date'],
+                operating_hours=record['operating_hours'],
+                failure_node_id=failure_nodes[record['failure_node']],
+                failure_description=record['failure_description'] or '',
+                recovery_method_id=recovery_methods[record['recovery_method']],
+                spare_parts_used=record['spare_parts_used'] or '',
+                recovery_date=record['recovery_date'],
+                service_company_id=self.service_user_id(record['service_company']) or company_id,
+                client_id=client_id,
+            )
+            written[key] = digest
+
+        Reclamation.objects.bulk_create(
+            reclamations.values(),
+            batch_size=self.batch_size,
+            update_conflicts=True,
+            unique_fields=['machine', 'failure_date'],
+            update_fields=[
+                'operating_hours', 'failure_node', 'failure_description', 'recovery_method',
+                'spare_parts_used', 'recovery_date', 'service_company', 'updated_at',
+            ],
+        )
+        self.save_digests('reclamations', written)
+        self.touched_serials.update(key.rsplit('|', 1)[0] for key in written)
+        return len(reclamations)
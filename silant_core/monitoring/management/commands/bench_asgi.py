@@ -0,0 +1,156 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import clear_url_caches
+from rest_framework.authtoken.models import Token
+
+from monitoring.models import User
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение WSGI (пул потоков) и ASGI (один цикл событий) на медленных клиентах: '
+        'ответ "передаётся" со скоростью --bandwidth, и всё это время клиент занимает '
+        'поток WSGI, а под ASGI - только корутину'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Логин, от имени которого идут запросы')
+        parser.add_argument('--path', default='/api/machines/', help='Адрес запроса')
+        parser.add_argument('--clients', type=int, default=100, help='Одновременных клиентов')
+        parser.add_argument('--requests', type=int, default=3, help='Запросов на клиента')
+        parser.add_argument('--threads', type=int, default=8, help='Потоков WSGI-сервера')
+        parser.add_argument('--bandwidth', type=float, default=64, help='Скорость клиента, КБ/с')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['user']} не найден")
+        token = Token.objects.get_or_create(user=user)[0].key
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {token}'}
+        self.options = options
+
+        path, _, query = options['path'].partition('?')
+        self.stdout.write(
+            f"{options['clients']} клиентов x {options['requests']} запросов, {options['path']}, "
+            f"{options['bandwidth']:.0f} КБ/с на клиента"
+        )
+        for label, run, urlconf in (
+            (f"WSGI, {options['threads']} потоков", self.run_wsgi, 'silant_core.urls'),
+            ('ASGI, 1 цикл событий', self.run_asgi, 'silant_core.urls_asgi'),
+        ):
+            self.use_urlconf(urlconf)
+            started = time.monotonic()
+            latencies, statuses, threads = run(path, query)
+            elapsed = time.monotonic() - started
+            self.report(label, latencies, statuses, threads, elapsed)
+        self.use_urlconf(settings.ROOT_URLCONF)
+
+    def use_urlconf(self, urlconf):
+        self.urlconf = urlconf
+        clear_url_caches()
+
+    def transfer_time(self, size):
+        return size / (self.options['bandwidth'] * 1024)
+
+    # ---------------- WSGI ----------------
+    def run_wsgi(self, path, query):
+        """Клиенты - потоки, а потоков сервера --threads: лишние клиенты ждут свободного"""
+        handler = WSGIHandler()
+        settings.ROOT_URLCONF = self.urlconf
+        server_threads = threading.Semaphore(self.options['threads'])
+
+        def one():
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'wsgi.url_scheme': 'http',
+                'wsgi.input': BytesIO(), 'wsgi.errors': BytesIO(), **self.headers,
+            }
+            status = []
+            started = time.monotonic()
+            with server_threads:
+                response = handler(environ, lambda code, headers, exc_info=None: status.append(code))
+                size = sum(len(block) for block in response)
+                # Поток сервера занят, пока клиент не дочитает ответ
+                time.sleep(self.transfer_time(size))
+                response.close()
+            return time.monotonic() - started, int(status[0].split()[0])
+
+        def client():
+            return [one() for _ in range(self.options['requests'])]
+
+        with ThreadPoolExecutor(max_workers=self.options['clients']) as pool:
+            batches = list(pool.map(lambda _: client(), range(self.options['clients'])))
+        results = [result for batch in batches for result in batch]
+        return [latency for latency, _ in results], [code for _, code in results], self.options['threads']
+
+    # ---------------- ASGI ----------------
+    def run_asgi(self, path, query):
+        handler = ASGIHandler()
+        settings.ROOT_URLCONF = self.urlconf
+        headers = [
+            (name[5:].lower().replace('_', '-').encode(), value.encode())
+            for name, value in self.headers.items()
+        ]
+        peak = [threading.active_count()]
+
+        async def one():
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'root_path': '', 'headers': headers, 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+            }
+            status = []
+            requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+            async def receive():
+                if requests:
+                    return requests.pop()
+                # Клиент не отключается: Django ждёт этого, пока готовит ответ
+                await asyncio.Event().wait()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif message['type'] == 'http.response.body':
+                    # Корутина ждёт медленного клиента, цикл событий свободен
+                    await asyncio.sleep(self.transfer_time(len(message.get('body', b''))))
+
+            started = time.monotonic()
+            await handler(scope, receive, send)
+            peak[0] = max(peak[0], threading.active_count())
+            return time.monotonic() - started, status[0]
+
+        async def client():
+            return [await one() for _ in range(self.options['requests'])]
+
+        async def main():
+            batches = await asyncio.gather(*(client() for _ in range(self.options['clients'])))
+            return [result for batch in batches for result in batch]
+
+        results = asyncio.run(main())
+        return [latency for latency, _ in results], [code for _, code in results], peak[0]
+
+    def report(self, label, latencies, statuses, threads, elapsed):
+        errors = sum(1 for code in statuses if code >= 400)
+        self.stdout.write(
+            f'{label}: {len(latencies) / elapsed:.1f} запр/с, время {elapsed:.1f} с, '
+            f'задержка p50 {statistics.median(latencies) * 1000:.0f} мс, '
+            f'p95 {percentile(latencies, 0.95) * 1000:.0f} мс, '
+            f'p99 {percentile(latencies, 0.99) * 1000:.0f} мс, '
+            f'потоков до {threads}, ошибок {errors}'
+        )
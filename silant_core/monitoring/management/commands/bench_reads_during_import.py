@@ -0,0 +1,131 @@
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.authtoken.models import Token
+
+from monitoring.models import User
+
+from .bench_asgi import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        'Пропускная способность чтения во время импорта: --readers потоков читают --path, '
+        'сначала --warmup секунд без записи, затем пока import_data --full пишет в ту же БД '
+        'из отдельного процесса. Профили сравниваются запуском с разными --settings, '
+        'например silant_core.settings и silant_core.settings_production'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_path', help='Файл или каталог для import_data')
+        parser.add_argument('--user', required=True, help='Логин, от имени которого идут запросы')
+        parser.add_argument('--path', default='/api/machines/', help='Адрес запроса')
+        parser.add_argument('--readers', type=int, default=4, help='Потоков-читателей')
+        parser.add_argument('--warmup', type=float, default=5, help='Секунд чтения без импорта')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['user']} не найден")
+        token = Token.objects.get_or_create(user=user)[0].key
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {token}'}
+        self.options = options
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        connection.close()
+        self.stdout.write(
+            f"{os.environ.get('DJANGO_SETTINGS_MODULE')}: journal_mode={journal_mode}, "
+            f"CONN_MAX_AGE={connection.settings_dict['CONN_MAX_AGE']}, "
+            f"{options['readers']} читателей, {options['path']}"
+        )
+
+        # Ошибки считаются в отчёте, трассировка каждой в консоли не нужна
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            idle = self.read_while(lambda started: time.monotonic() - started < options['warmup'])
+            self.report('Без импорта', *idle)
+
+            importer = subprocess.Popen(
+                [sys.executable, '-m', 'django', 'import_data', options['file_path'], '--full'],
+                cwd=settings.BASE_DIR,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            import_started = time.monotonic()
+            busy = self.read_while(lambda started: importer.poll() is None)
+            import_time = time.monotonic() - import_started
+            stderr = importer.stderr.read()
+            self.report('Во время импорта', *busy)
+        finally:
+            request_logger.setLevel(level)
+
+        if importer.returncode:
+            raise CommandError(f'Импорт завершился с кодом {importer.returncode}:\n{stderr[-2000:]}')
+        self.stdout.write(f'Импорт: {import_time:.1f} с')
+
+    def read_while(self, running):
+        """Читатели запрашивают path, пока running(started); -> (задержки, статусы, время)"""
+        handler = WSGIHandler()
+        path, _, query = self.options['path'].partition('?')
+        stop = threading.Event()
+        results = []
+
+        def reader():
+            own = []
+            while not stop.is_set():
+                environ = {
+                    'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+                    'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'wsgi.url_scheme': 'http',
+                    'wsgi.input': BytesIO(), 'wsgi.errors': BytesIO(), **self.headers,
+                }
+                status = []
+                started = time.monotonic()
+                response = handler(environ, lambda code, headers, exc_info=None: status.append(code))
+                for _ in response:
+                    pass
+                # Закрытие ответа шлёт request_finished - Django решает, закрыть ли соединение
+                response.close()
+                own.append((time.monotonic() - started, int(status[0].split()[0])))
+            connection.close()
+            results.extend(own)
+
+        threads = [threading.Thread(target=reader) for _ in range(self.options['readers'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        while running(started):
+            time.sleep(0.05)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        return [latency for latency, _ in results], [code for _, code in results], elapsed
+
+    def report(self, label, latencies, statuses, elapsed):
+        if not latencies:
+            self.stdout.write(f'{label}: нет ответов за {elapsed:.1f} с')
+            return
+        errors = sum(1 for code in statuses if code >= 400)
+        self.stdout.write(
+            f'{label}: {len(latencies) / elapsed:.1f} запр/с за {elapsed:.1f} с, '
+            f'задержка p50 {statistics.median(latencies) * 1000:.0f} мс, '
+            f'p95 {percentile(latencies, 0.95) * 1000:.0f} мс, '
+            f'p99 {percentile(latencies, 0.99) * 1000:.0f} мс, '
+            f'макс {max(latencies) * 1000:.0f} мс, ошибок {errors}'
+        )
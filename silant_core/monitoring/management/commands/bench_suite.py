@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+
+from monitoring.benchmark import SIZES, compare, run_size
+
+from .import_data import peak_rss_mb
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеры списков машин (с фильтром и без), карточки, ТО, рекламаций, поиска, списков '
+        'админки и import_data на синтетических парках по ролям. Парки создаются в отдельной '
+        'тестовой БД; результаты - в JSON, с --baseline - сравнение с сохранённым прогоном'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', choices=SIZES, default=list(SIZES),
+            help=', '.join(f'{name} - {machines} машин' for name, machines in SIZES.items()),
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора парка')
+        parser.add_argument('--repeat', type=int, default=20, help='Замеров на каждый запрос')
+        parser.add_argument('--import-repeat', type=int, default=1, help='Замеров импорта')
+        parser.add_argument('--output', default='bench_results.json', help='Файл результатов')
+        parser.add_argument('--baseline', help='Результаты прошлого прогона для сравнения')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help='Допустимый рост медианы задержки и пика памяти относительно baseline (доля); '
+                 'число запросов к БД расти не должно',
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Не удалось прочитать {options['baseline']}: {exc}")
+
+        results = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'settings': os.environ.get('DJANGO_SETTINGS_MODULE'),
+            'seed': options['seed'],
+            'repeat': options['repeat'],
+            'sizes': {},
+        }
+        setup_test_environment()
+        databases = setup_databases(verbosity=0, interactive=False, serialized_aliases=set())
+        try:
+            for size in options['sizes']:
+                machines = SIZES[size]
+                self.stdout.write(f'{size}: {machines} машин')
+                call_command('flush', interactive=False, verbosity=0)
+                with tempfile.TemporaryDirectory() as directory:
+                    try:
+                        results['sizes'][size] = run_size(
+                            machines, directory, seed=options['seed'], repeat=options['repeat'],
+                            import_repeat=options['import_repeat'], progress=self.report,
+                        )
+                    except ValueError as exc:
+                        raise CommandError(str(exc))
+        finally:
+            teardown_databases(databases, verbosity=0)
+            teardown_test_environment()
+        results['peak_rss_mb'] = peak_rss_mb()
+
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f"Результаты: {options['output']}")
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['tolerance'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f"Регрессий относительно {options['baseline']}: {len(regressions)}")
+            self.stdout.write(self.style.SUCCESS(f"Регрессий относительно {options['baseline']} нет"))
+
+    def report(self, case, role, result):
+        self.stdout.write(
+            f"  {case:<32} {role:<9} p50 {result['p50_ms']:>9.1f} мс  p95 {result['p95_ms']:>9.1f} мс  "
+            f"запросов {result['queries']:>4}  пик {result['peak_kb']:>7} КБ"
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from monitoring.forecast import rebuild_forecasts
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт прогноза ТО (MaintenanceForecast) и периодичностей видов ТО по всему парку'
+
+    def handle(self, *args, **kwargs):
+        total = rebuild_forecasts()
+        self.stdout.write(self.style.SUCCESS(f'Прогноз ТО пересчитан: {total} строк'))
@@ -0,0 +1,67 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring.models import Machine, User
+from monitoring.synthetic import FleetGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Синтетический парк для нагрузочных тестов: --machines машин с комплектующими, ТО, '
+        'рекламациями и ремонтами, клиенты и сервисные компании. Один --seed - один и тот же парк'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--machines', type=int, required=True, help='Сколько машин создать')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора')
+        parser.add_argument(
+            '--prefix',
+            default='SYN',
+            help='Префикс зав. номеров и логинов; в БД не должно быть машин с таким префиксом',
+        )
+        parser.add_argument('--clients', type=int, help='Клиентов (по умолчанию машин / 40)')
+        parser.add_argument('--service-companies', type=int, help='Сервисных компаний (по умолчанию машин / 400)')
+        parser.add_argument(
+            '--password',
+            help='Пароль всех созданных пользователей; без него вход по паролю закрыт',
+        )
+        parser.add_argument(
+            '--today',
+            type=date.fromisoformat,
+            help='Дата, от которой отсчитывается история (ГГГГ-ММ-ДД, по умолчанию сегодня) - '
+                 'чтобы повторный запуск в другой день дал тот же парк',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пакета bulk_create')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['machines'] < 1:
+            raise CommandError('--machines должно быть больше нуля')
+        if (
+            Machine.objects.filter(serial_number__startswith=prefix).exists()
+            or User.objects.filter(username__startswith=f'{prefix.lower()}-').exists()
+        ):
+            raise CommandError(f'В БД уже есть парк с префиксом {prefix!r} - укажите другой --prefix')
+
+        generator = FleetGenerator(
+            seed=options['seed'],
+            prefix=prefix,
+            clients=options['clients'],
+            service_companies=options['service_companies'],
+            password=options['password'],
+            batch_size=options['batch_size'],
+            today=options['today'],
+        )
+        started = time.monotonic()
+
+        def progress(done, total):
+            self.stdout.write(f'  {done}/{total} машин, {time.monotonic() - started:.0f} с')
+
+        counts = generator.generate(options['machines'], progress=progress if options['verbosity'] > 1 else None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Парк создан за {time.monotonic() - started:.1f} с: машин {counts['machines']}, "
+            f"комплектующих {counts['components']}, ТО {counts['services']}, "
+            f"рекламаций {counts['reclamations']}, ремонтов {counts['maintenance']}"
+        ))
@@ -1,177 +1,248 @@
-import pandas as pd
-from django.core.management.base import BaseCommand
-from monitoring.models import *
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from monitoring.forecast import refresh_forecasts
+from monitoring.importer import (
+    BulkImporter, count_records, iter_record_chunks, parse_sheet, read_records, source_sheets,
+    unpack_records
+)
+from monitoring.models import ImportChunk, ImportRowError, ImportRun
+from monitoring.rollup import machine_scopes, refresh_rollup
+from monitoring.summary import refresh_machine_summaries
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SHEET_LABELS = {
+    'machines': 'Машины',
+    'services': 'ТО',
+    'reclamations': 'Рекламации',
+}
+
+# От этих параметров зависит разбиение листов на пакеты - при --resume они берутся из запуска
+RUN_OPTIONS = ('stream', 'chunk_size', 'batch_size', 'full')
+
+# Процесс-разборщик отдаёт лист целиком одним результатом - с --stream это весь лист в памяти дважды
+STREAM_WORKERS_ERROR = '--workers и --stream несовместимы: при --stream лист читается пакетами в одном процессе'
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS - байты
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
 
 
 class Command(BaseCommand):
-    help = 'Импорт данных из Excel файла'
+    help = 'Импорт данных из Excel файла или выгрузки CSV/Parquet'
 
     def add_arguments(self, parser):
-        parser.add_argument('file_path', type=str, help='Путь к Excel файлу')
+        parser.add_argument(
+            'file_path',
+            type=str,
+            nargs='?',
+            help='Путь к Excel файлу, к файлу machines/services/reclamations (.csv, .parquet) '
+                 'или к каталогу с такими файлами',
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пакета записи в БД')
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Читать данные пакетами по --chunk-size строк (Excel - через openpyxl read_only)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Строк в пакете при --stream')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Разбирать листы параллельно в N процессах (запись в БД остаётся в одном); без --stream',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Перезаписать все строки, включая не изменившиеся с прошлого импорта',
+        )
+        parser.add_argument(
+            '--resume',
+            type=int,
+            metavar='RUN_ID',
+            help='Продолжить прерванный запуск с первого незаписанного пакета',
+        )
 
     def handle(self, *args, **kwargs):
-        file_path = kwargs['file_path']
-
-        def get_column(df, possible_names, required=True):
-            for name in possible_names:
-                for col in df.columns:
-                    if col.strip().lower() == name.strip().lower():
-                        return col
-            if required:
-                raise ValueError(f"Не найдена обязательная колонка: {possible_names}")
-            return None
-
-        # --- Импорт машин ---
-        df_machines = pd.read_excel(file_path, sheet_name=0, header=2)
-        df_machines.columns = df_machines.columns.str.strip()
-
-        for _, row in df_machines.iterrows():
-            machine_model = self.get_or_create_model(MachineModel, row.get('Модель техники'))
-            engine_model = self.get_or_create_model(EngineModel, row.get('Модель двигателя'))
-            transmission_model = self.get_or_create_model(
-                TransmissionModel, row.get('Модель трансмиссии (производитель, артикул)')
+        if kwargs['workers'] > 1 and kwargs['stream']:
+            raise CommandError(STREAM_WORKERS_ERROR)
+        run = self.get_run(kwargs)
+        options = run.options
+        file_path = run.file_path
+        try:
+            sheets = source_sheets(file_path)
+        except ValueError as exc:
+            raise CommandError(exc)
+        done_chunks = set(run.chunks.values_list('sheet', 'index'))
+        self.stdout.write(f'Запуск импорта #{run.pk}: {file_path}')
+
+        importer = BulkImporter(
+            warn=self.collect_warning,
+            batch_size=options['batch_size'],
+            incremental=not options['full'],
+        )
+
+        started = time.monotonic()
+        pool = None
+        if kwargs['workers'] > 1:
+            # Дочерним процессам БД не нужна, а унаследованные соединения лучше не делить
+            connections.close_all()
+            pool = ProcessPoolExecutor(
+                max_workers=min(kwargs['workers'], len(sheets)),
+                initializer=django.setup,
             )
-            drive_axle_model = self.get_or_create_model(DriveAxleModel, row.get('Модель ведущего моста'))
-            steering_axle_model = self.get_or_create_model(SteeringAxleModel, row.get('Модель управляемого моста'))
-
-            client = User.objects.get_or_create(username=row.get('Покупатель'), defaults={'role': 'client'})[0]
-            service_company = User.objects.filter(role='service', company__iexact=row.get('Сервисная компания')).first()
-            if not service_company:
-                service_company, _ = User.objects.get_or_create(
-                    username=row.get('Сервисная компания'),
-                    defaults={'role': 'service', 'company': row.get('Сервисная компания')}
+            parsed = {name: pool.submit(parse_sheet, file_path, name) for name in sheets}
+
+        def chunks(name):
+            """(число строк листа, пакеты записей)"""
+            if pool:
+                # Ждём только свой лист: машины пишутся, пока ТО ещё разбираются
+                rows = parsed[name].result()
+                return len(rows), [unpack_records(name, rows)]
+            if options['stream']:
+                return (
+                    count_records(file_path, name),
+                    iter_record_chunks(file_path, name, options['chunk_size']),
                 )
+            records = read_records(file_path, name)
+            return len(records), [records]
 
-            Machine.objects.update_or_create(
-                serial_number=row.get('Зав. № машины'),
-                defaults={
-                    'machine_model': machine_model,
-                    'engine_model': engine_model,
-                    'engine_serial': row.get('Зав. № двигателя'),
-                    'transmission_model': transmission_model,
-                    'transmission_serial': row.get('Зав. № трансмиссии'),
-                    'drive_axle_model': drive_axle_model,
-                    'drive_axle_serial': row.get('Зав. № ведущего моста'),
-                    'steering_axle_model': steering_axle_model,
-                    'steering_axle_serial': row.get('Зав. № управляемого моста'),
-                    'shipment_date': row.get('Дата отгрузки с завода'),
-                    'client': client,
-                    'consignee': row.get('Грузополучатель (конечный потребитель)'),
-                    'delivery_address': row.get('Адрес поставки (эксплуатации)'),
-                    'equipment': row.get('Комплектация (доп. опции)'),
-                    'service_company': service_company
-                }
+        try:
+            rows = sum(
+                self.import_sheet(run, importer, name, chunks, done_chunks) for name in sheets
             )
-        self.stdout.write(self.style.SUCCESS(f'Импортировано/обновлено {len(df_machines)} машин'))
-
-        # --- Импорт ТО ---
-        df_to = pd.read_excel(file_path, sheet_name='ТО output', header=0)
-        df_to.columns = df_to.columns.str.strip()
-
-        serial_col = get_column(df_to, ['Зав. № машины'])
-        service_type_col = get_column(df_to, ['Вид ТО'])
-        service_date_col = get_column(df_to, ['Дата проведения ТО'])
-        operating_hours_col = get_column(df_to, ['Наработка, м/час'])
-        work_order_number_col = get_column(df_to, ['№ заказ-наряда'], required=False)
-        work_order_date_col = get_column(df_to, ['Дата заказ-наряда'], required=False)
-        service_org_col = get_column(df_to, ['Организация, проводившая ТО'], required=False)
-
-        for _, row in df_to.iterrows():
-            try:
-                machine = Machine.objects.get(serial_number=row[serial_col])
-            except Machine.DoesNotExist:
-                self.stdout.write(self.style.WARNING(f"Машина с номером {row[serial_col]} не найдена"))
-                continue
-
-            ts_type = self.get_or_create_model(ServiceType, row[service_type_col])
-
-            # --- Определяем организацию ТО ---
-            service_org_value = row[service_org_col] if service_org_col and pd.notna(row[service_org_col]) else None
-            service_org_obj = None
-            service_org_text = ''
-            ts_company = machine.service_company
-
-            if service_org_value:
-                service_org_value = service_org_value.strip()
-                # Если совпадает с сервисной компанией машины, используем её
-                service_user = User.objects.filter(role='service', company__iexact=service_org_value).first()
-                if service_user:
-                    ts_company = service_user
-                    # Также создаём ServiceOrganization, если нужно
-                    service_org_obj, _ = ServiceOrganization.objects.get_or_create(
-                        name=service_org_value,
-                        defaults={'address': '', 'contact_person': '', 'contact_phone': ''}
-                    )
-                else:
-                    # Это просто текст — создаём ServiceOrganization с текстом
-                    service_org_obj, _ = ServiceOrganization.objects.get_or_create(
-                        name=service_org_value,
-                        defaults={'address': '', 'contact_person': '', 'contact_phone': ''}
-                    )
-                    service_org_text = service_org_value
-
-            TechnicalService.objects.update_or_create(
-                machine=machine,
-                service_date=row[service_date_col],
-                defaults={
-                    'service_type': ts_type,
-                    'operating_hours': row[operating_hours_col] if pd.notna(row[operating_hours_col]) else 0,
-                    'work_order_number': row[work_order_number_col] if work_order_number_col and pd.notna(row[work_order_number_col]) else '',
-                    'work_order_date': row[work_order_date_col] if work_order_date_col and pd.notna(row[work_order_date_col]) else None,
-                    'service_organization': service_org_obj,
-                    'service_organization_name': service_org_text,
-                    'service_company': ts_company
-                }
+        except BaseException as exc:
+            run.status = ImportRun.FAILED
+            run.error = repr(exc)
+            run.finished_at = timezone.now()
+            run.save(update_fields=['status', 'error', 'finished_at'])
+            self.stderr.write(f'Импорт прерван, продолжить: import_data --resume {run.pk}')
+            raise
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+        run.status = ImportRun.DONE
+        run.error = ''
+        run.finished_at = timezone.now()
+        run.save(update_fields=['status', 'error', 'finished_at'])
+
+        elapsed = time.monotonic() - started
+        report = f'Строк: {rows}, время: {elapsed:.1f} с, {rows / elapsed if elapsed else 0:.0f} строк/с'
+        peak = peak_rss_mb()
+        if peak is not None:
+            report += f', пик памяти: {peak:.0f} МБ'
+        self.stdout.write(report)
+
+    def get_run(self, kwargs):
+        if kwargs['resume'] is None:
+            if not kwargs['file_path']:
+                raise CommandError('Укажите путь к файлу или --resume RUN_ID')
+            return ImportRun.objects.create(
+                file_path=kwargs['file_path'],
+                options={option: kwargs[option] for option in RUN_OPTIONS},
             )
-        self.stdout.write(self.style.SUCCESS(f'Импортировано/обновлено {len(df_to)} ТО'))
-
-        # --- Импорт рекламаций ---
-        df_rec = pd.read_excel(file_path, sheet_name='рекламация output', header=1)
-        df_rec.columns = df_rec.columns.str.strip()
-
-        serial_col_rec = get_column(df_rec, ['Зав. № машины'])
-        failure_date_col = get_column(df_rec, ['Дата отказа'])
-        operating_hours_col_rec = get_column(df_rec, ['Наработка, м/час'])
-        failure_node_col = get_column(df_rec, ['Узел отказа'], required=False)
-        failure_desc_col = get_column(df_rec, ['Описание отказа'], required=False)
-        recovery_method_col = get_column(df_rec, ['Способ восстановления'], required=False)
-        used_parts_col = get_column(df_rec, ['Используемые запасные части'], required=False)
-        recovery_date_col = get_column(df_rec, ['Дата восстановления'], required=False)
-        service_company_col = get_column(df_rec, ['Сервисная компания'], required=False)
-
-        for _, row in df_rec.iterrows():
-            try:
-                machine = Machine.objects.get(serial_number=row[serial_col_rec])
-            except Machine.DoesNotExist:
-                self.stdout.write(self.style.WARNING(f"Машина с номером {row[serial_col_rec]} не найдена для рекламации"))
-                continue
 
-            failure_node = self.get_or_create_model(FailureNode, row[failure_node_col]) if failure_node_col else None
-            recovery_method = self.get_or_create_model(RecoveryMethod, row[recovery_method_col]) if recovery_method_col else None
-
-            service_user = None
-            if service_company_col and pd.notna(row[service_company_col]):
-                service_user = User.objects.filter(role='service', company__iexact=row[service_company_col].strip()).first()
-            if not service_user:
-                service_user = machine.service_company  # fallback
-
-            Reclamation.objects.update_or_create(
-                machine=machine,
-                failure_date=row[failure_date_col],
-                defaults={
-                    'operating_hours': row[operating_hours_col_rec] if pd.notna(row[operating_hours_col_rec]) else 0,
-                    'failure_node': failure_node,
-                    'failure_description': row[failure_desc_col] if failure_desc_col and pd.notna(row[failure_desc_col]) else '',
-                    'recovery_method': recovery_method,
-                    'spare_parts_used': row[used_parts_col] if used_parts_col and pd.notna(row[used_parts_col]) else '',
-                    'recovery_date': row[recovery_date_col] if recovery_date_col and pd.notna(row[recovery_date_col]) else None,
-                    'service_company': service_user
-                }
-            )
-        self.stdout.write(self.style.SUCCESS(f'Импортировано/обновлено {len(df_rec)} рекламаций'))
+        try:
+            run = ImportRun.objects.get(pk=kwargs['resume'])
+        except ImportRun.DoesNotExist:
+            raise CommandError(f"Запуск импорта #{kwargs['resume']} не найден")
+        if run.status == ImportRun.DONE:
+            raise CommandError(f'Запуск импорта #{run.pk} уже завершён')
+        if kwargs['workers'] > 1 and run.options['stream']:
+            raise CommandError(STREAM_WORKERS_ERROR)
+        run.status = ImportRun.RUNNING
+        run.save(update_fields=['status'])
+        return run
+
+    def collect_warning(self, message):
+        self.chunk_warnings.append(message)
+        self.stdout.write(self.style.WARNING(message))
+
+    def import_sheet(self, run, importer, name, chunks, done_chunks):
+        """
+        Каждый пакет пишется в своей транзакции вместе с отметкой ImportChunk,
+        поэтому после сбоя --resume пропускает ровно те пакеты, что уже в БД.
+        """
+        write = {
+            'machines': importer.import_machines,
+            'services': importer.import_services,
+            'reclamations': importer.import_reclamations,
+        }[name]
+        label = SHEET_LABELS[name]
+        total, sheet_chunks = chunks(name)
+        started = time.monotonic()
+        processed = 0
+
+        for index, records in enumerate(sheet_chunks):
+            processed += len(records)
+            if (name, index) in done_chunks:
+                importer.skip_records(name, records)
+                continue
 
-    def get_or_create_model(self, model_class, name):
-        if pd.isna(name) or not name:
-            return None
-        obj, _ = model_class.objects.get_or_create(name=name.strip())
-        return obj
+            chunk_started = time.monotonic()
+            self.chunk_warnings = []
+            with transaction.atomic():
+                written = write(records)
+                # bulk_create не вызывает сигналы, поэтому витрину и свёртку обновляем здесь
+                touched = importer.pop_touched_machine_ids()
+                refresh_machine_summaries(touched)
+                if name != 'reclamations':
+                    # Прогноз - только затронутых машин; периодичности по парку обновляет forecast_maintenance
+                    refresh_forecasts(touched)
+                if name != 'services':
+                    scopes = machine_scopes(touched)
+                    # Рекламации машины, сменившей модель, уходят из строк прежней модели
+                    for machine_id, models in importer.pop_moved_machines().items():
+                        scopes |= machine_scopes([machine_id], models)
+                    refresh_rollup(scopes)
+                ImportRowError.objects.bulk_create([
+                    ImportRowError(run=run, sheet=name, chunk_index=index, message=message)
+                    for message in self.chunk_warnings
+                ])
+                ImportChunk.objects.create(
+                    run=run,
+                    sheet=name,
+                    index=index,
+                    rows=len(records),
+                    written=written,
+                    errors=len(self.chunk_warnings),
+                    duration=time.monotonic() - chunk_started,
+                )
+                run.rows += len(records)
+                run.save(update_fields=['rows'])
+            self.report_progress(label, processed, total, started)
+
+        stats = importer.summary(name)
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: новых {stats['inserted']}, изменено {stats['updated']}, "
+            f"без изменений {stats['skipped']}, нет в файле {stats['orphaned']}"
+        ))
+        return processed
+
+    def report_progress(self, label, processed, total, started):
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else 0
+        line = f'{label}: {processed}'
+        if total:
+            line += f' из {total} ({min(processed / total, 1):.0%})'
+        line += f', {rate:.0f} строк/с'
+        if total and rate and processed < total:
+            line += f', осталось ~{timedelta(seconds=round((total - processed) / rate))}'
+        self.stdout.write(line)
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring.changes import RETENTION, prune_changes
+
+
+class Command(BaseCommand):
+    help = (
+        'Удалить из журнала ленты изменений записи старше --days дней. Клиенты с курсором '
+        'старше оставшегося журнала получат 410 resync_required и синхронизируются заново'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=RETENTION.days, help='Сколько дней хранить журнал')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days должно быть больше нуля')
+        deleted = prune_changes(timedelta(days=options['days']))
+        self.stdout.write(f'Удалено записей журнала: {deleted}')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from monitoring.summary import rebuild_machine_summaries
+
+
+class Command(BaseCommand):
+    help = 'Полная пересборка витрины машин (MachineSummary)'
+
+    def handle(self, *args, **kwargs):
+        total = rebuild_machine_summaries()
+        self.stdout.write(self.style.SUCCESS(f'Витрина пересобрана: {total} машин'))
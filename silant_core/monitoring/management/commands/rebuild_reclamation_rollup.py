@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from monitoring.rollup import rebuild_rollup
+
+
+class Command(BaseCommand):
+    help = 'Полная пересборка свёртки рекламаций (ReclamationRollup)'
+
+    def handle(self, *args, **kwargs):
+        total = rebuild_rollup()
+        self.stdout.write(self.style.SUCCESS(f'Свёртка пересобрана: {total} строк'))
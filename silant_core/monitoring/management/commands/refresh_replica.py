@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring.replica import REFRESH_MODES, REPLICA_DB, refresh_replica
+
+
+class Command(BaseCommand):
+    help = 'Снимок основной БД в реплику для чтения; с --interval - периодически, до остановки'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            choices=REFRESH_MODES,
+            help='backup - онлайн-бэкап поверх реплики, copy - VACUUM INTO и подмена файла '
+                 '(по умолчанию REPLICA_REFRESH_MODE)',
+        )
+        parser.add_argument('--interval', type=float, default=0, help='Секунд между снимками; 0 - один снимок')
+
+    def handle(self, *args, **options):
+        if REPLICA_DB not in settings.DATABASES:
+            raise CommandError(f'В DATABASES нет алиаса {REPLICA_DB!r} (профиль silant_core.settings_replica)')
+        mode = options['mode'] or getattr(settings, 'REPLICA_REFRESH_MODE', 'backup')
+        while True:
+            try:
+                elapsed = refresh_replica(mode)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(f'Реплика обновлена ({mode}) за {elapsed:.2f} с')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,43 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from monitoring.models import Machine
+from monitoring.reliability import DIMENSIONS, compute_report, reliability_report
+
+
+class Command(BaseCommand):
+    help = 'Наработка на отказ (MTBF) и параметры Вейбулла по всему парку'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--by', choices=list(DIMENSIONS), default='machine_model', help='Разрез отчёта')
+        parser.add_argument('--json', action='store_true', help='Вывести отчёт в JSON')
+        parser.add_argument('--no-cache', action='store_true', help='Пересчитать, не заглядывая в кеш')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['no_cache']:
+            report = compute_report(options['by'], Machine.objects.all())
+        else:
+            report = reliability_report(options['by'])
+        elapsed = time.monotonic() - started
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(f"{'Группа':<30} {'машин':>7} {'отказов':>8} {'MTBF, м/ч':>10} {'форма':>7} {'масштаб':>9} {'B10':>8}")
+        for row in report['results']:
+            self.stdout.write(
+                f"{str(row['name'])[:30]:<30} {row['machines']:>7} {row['failures']:>8} "
+                f"{fmt(row['mtbf_hours']):>10} {fmt(row['weibull_shape']):>7} "
+                f"{fmt(row['weibull_scale']):>9} {fmt(row['b10_hours']):>8}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['machines']} машин, {report['failures']} отказов, {elapsed:.2f} с"
+        ))
+
+
+def fmt(value):
+    return '-' if value is None else f'{value:g}'
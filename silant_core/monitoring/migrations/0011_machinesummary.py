@@ -0,0 +1,113 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Count, Exists, F, IntegerField, Max, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Least
+
+
+def fill_summary(apps, schema_editor):
+    Machine = apps.get_model('monitoring', 'Machine')
+    MachineSummary = apps.get_model('monitoring', 'MachineSummary')
+    Component = apps.get_model('monitoring', 'Component')
+    Maintenance = apps.get_model('monitoring', 'Maintenance')
+    TechnicalService = apps.get_model('monitoring', 'TechnicalService')
+    Reclamation = apps.get_model('monitoring', 'Reclamation')
+
+    def per_machine(model, aggregate):
+        return Subquery(
+            model.objects.filter(machine=OuterRef('pk')).order_by().values('machine').annotate(
+                value=aggregate
+            ).values('value')
+        )
+
+    def display_name(user):
+        if user is None:
+            return ''
+        return f"{user.first_name} {user.last_name}".strip() or user.username
+
+    wear = Case(
+        When(lifetime_hours=0, then=Value(0)),
+        default=Least(Value(100), F('current_hours') * 100 / F('lifetime_hours')),
+        output_field=IntegerField(),
+    )
+    machines = Machine.objects.select_related(
+        'machine_model', 'engine_model', 'transmission_model', 'drive_axle_model',
+        'steering_axle_model', 'client', 'service_company',
+    ).annotate(
+        in_service_flag=Exists(Maintenance.objects.filter(machine=OuterRef('pk'), end_date__isnull=True)),
+        max_wear_value=Coalesce(per_machine(Component, Max(wear)), 0),
+        last_service=per_machine(TechnicalService, Max('service_date')),
+        reclamation_total=Coalesce(per_machine(Reclamation, Count('pk')), 0),
+    )
+    MachineSummary.objects.bulk_create(
+        (
+            MachineSummary(
+                machine_id=machine.pk,
+                serial_number=machine.serial_number,
+                shipment_date=machine.shipment_date,
+                current_hours=machine.current_hours,
+                machine_model_name=machine.machine_model.name,
+                engine_model_name=machine.engine_model.name,
+                transmission_model_name=machine.transmission_model.name,
+                drive_axle_model_name=machine.drive_axle_model.name,
+                steering_axle_model_name=machine.steering_axle_model.name,
+                engine_serial=machine.engine_serial,
+                transmission_serial=machine.transmission_serial,
+                drive_axle_serial=machine.drive_axle_serial,
+                steering_axle_serial=machine.steering_axle_serial,
+                client_id=machine.client_id,
+                client_name=display_name(machine.client),
+                service_company_id=machine.service_company_id,
+                service_company_name=display_name(machine.service_company),
+                in_service=machine.in_service_flag,
+                max_wear=machine.max_wear_value,
+                last_service_date=machine.last_service,
+                reclamation_count=machine.reclamation_total,
+            )
+            for machine in machines.iterator(chunk_size=1000)
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0010_technicalservice_service_organization_name_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MachineSummary',
+            fields=[
+                ('machine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='monitoring.machine')),
+                ('serial_number', models.CharField(max_length=50, unique=True)),
+                ('shipment_date', models.DateField()),
+                ('current_hours', models.PositiveIntegerField(default=0)),
+                ('machine_model_name', models.CharField(max_length=100)),
+                ('engine_model_name', models.CharField(max_length=100)),
+                ('transmission_model_name', models.CharField(max_length=100)),
+                ('drive_axle_model_name', models.CharField(max_length=100)),
+                ('steering_axle_model_name', models.CharField(max_length=100)),
+                ('engine_serial', models.CharField(max_length=50)),
+                ('transmission_serial', models.CharField(max_length=50)),
+                ('drive_axle_serial', models.CharField(max_length=50)),
+                ('steering_axle_serial', models.CharField(max_length=50)),
+                ('client_name', models.CharField(max_length=300)),
+                ('service_company_name', models.CharField(blank=True, max_length=300)),
+                ('in_service', models.BooleanField(default=False)),
+                ('max_wear', models.PositiveSmallIntegerField(default=0)),
+                ('last_service_date', models.DateField(blank=True, null=True)),
+                ('reclamation_count', models.PositiveIntegerField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('service_company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-shipment_date'],
+                'indexes': [models.Index(fields=['-shipment_date', 'machine'], name='summary_shipment_idx'), models.Index(fields=['client', '-shipment_date', 'machine'], name='summary_client_idx'), models.Index(fields=['service_company', '-shipment_date', 'machine'], name='summary_service_idx')],
+            },
+        ),
+        migrations.RunPython(fill_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:11
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# Сколько повторов перечислить в сообщении об ошибке
+REPORT_LIMIT = 20
+
+
+def check_duplicates(apps, schema_editor):
+    """
+    Прежние формы позволяли внести вторую запись машины на ту же дату. Такие
+    записи сливать автоматически нельзя - в них могут быть разные данные,
+    поэтому миграция останавливается до ограничений и перечисляет повторы.
+    """
+    problems = []
+    for model_name, date_field, label in (
+        ('TechnicalService', 'service_date', 'ТО'),
+        ('Reclamation', 'failure_date', 'рекламации'),
+    ):
+        model = apps.get_model('monitoring', model_name)
+        groups = (
+            model.objects.values('machine_id', 'machine__serial_number', date_field)
+            .annotate(count=Count('pk'))
+            .filter(count__gt=1)
+            .order_by('machine_id', date_field)
+        )
+        for group in groups:
+            ids = model.objects.filter(
+                machine_id=group['machine_id'], **{date_field: group[date_field]}
+            ).order_by('pk').values_list('pk', flat=True)
+            problems.append(
+                f"{label}: машина {group['machine__serial_number']}, {group[date_field]} - "
+                f"id {', '.join(map(str, ids))}"
+            )
+    if problems:
+        shown = '\n'.join(problems[:REPORT_LIMIT])
+        more = f'\n... и ещё {len(problems) - REPORT_LIMIT}' if len(problems) > REPORT_LIMIT else ''
+        raise RuntimeError(
+            'Есть несколько записей одной машины на одну дату - удалите или исправьте лишние '
+            f'и повторите migrate:\n{shown}{more}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0011_machinesummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reclamation',
+            constraint=models.UniqueConstraint(fields=('machine', 'failure_date'), name='unique_machine_failure_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='technicalservice',
+            constraint=models.UniqueConstraint(fields=('machine', 'service_date'), name='unique_machine_service_date'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0012_unique_service_and_reclamation_dates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sheet', models.CharField(choices=[('machines', 'Машины'), ('services', 'ТО'), ('reclamations', 'Рекламации')], max_length=20)),
+                ('key', models.CharField(max_length=100, verbose_name='Ключ строки')),
+                ('digest', models.CharField(max_length=40, verbose_name='Хэш содержимого')),
+                ('imported_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('sheet', 'key'), name='unique_imported_row')],
+            },
+        ),
+    ]
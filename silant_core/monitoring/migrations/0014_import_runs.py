@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0013_importedrow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_path', models.CharField(max_length=500, verbose_name='Файл')),
+                ('options', models.JSONField(default=dict, verbose_name='Параметры')),
+                ('status', models.CharField(choices=[('running', 'Выполняется'), ('failed', 'Прерван с ошибкой'), ('done', 'Завершён')], default='running', max_length=20)),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('rows', models.PositiveIntegerField(default=0, verbose_name='Обработано строк')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportRowError',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sheet', models.CharField(choices=[('machines', 'Машины'), ('services', 'ТО'), ('reclamations', 'Рекламации')], max_length=20)),
+                ('chunk_index', models.PositiveIntegerField(verbose_name='№ пакета')),
+                ('message', models.TextField(verbose_name='Сообщение')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='row_errors', to='monitoring.importrun')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImportChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sheet', models.CharField(choices=[('machines', 'Машины'), ('services', 'ТО'), ('reclamations', 'Рекламации')], max_length=20)),
+                ('index', models.PositiveIntegerField(verbose_name='№ пакета')),
+                ('rows', models.PositiveIntegerField(verbose_name='Строк')),
+                ('written', models.PositiveIntegerField(verbose_name='Записано')),
+                ('errors', models.PositiveIntegerField(default=0, verbose_name='Ошибок')),
+                ('duration', models.FloatField(verbose_name='Длительность, с')),
+                ('committed_at', models.DateTimeField(auto_now_add=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='monitoring.importrun')),
+            ],
+            options={
+                'ordering': ['run', 'committed_at'],
+                'constraints': [models.UniqueConstraint(fields=('run', 'sheet', 'index'), name='unique_import_chunk')],
+            },
+        ),
+    ]
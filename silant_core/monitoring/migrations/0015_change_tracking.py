@@ -0,0 +1,196 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:54
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+CLIENT_OF_MACHINE = '(SELECT client_id FROM monitoring_machine WHERE id = {row}.machine_id)'
+SERVICE_OF_MACHINE = '(SELECT service_company_id FROM monitoring_machine WHERE id = {row}.machine_id)'
+
+# Лента -> (таблица, покупатель строки, сервисная компания строки); {row} - NEW или OLD.
+# Видимость - как в get_visible_to_user: ТО и рекламации сервисная компания видит
+# по своему полю, покупатель - по машине; компоненты оба видят по машине
+FEED_TABLES = {
+    'machines': ('monitoring_machine', '{row}.client_id', '{row}.service_company_id'),
+    'technical-services': ('monitoring_technicalservice', CLIENT_OF_MACHINE, '{row}.service_company_id'),
+    'reclamations': ('monitoring_reclamation', CLIENT_OF_MACHINE, '{row}.service_company_id'),
+    'components': ('monitoring_component', CLIENT_OF_MACHINE, SERVICE_OF_MACHINE),
+    'machine-models': ('monitoring_machinemodel', 'NULL', 'NULL'),
+    'engine-models': ('monitoring_enginemodel', 'NULL', 'NULL'),
+    'transmission-models': ('monitoring_transmissionmodel', 'NULL', 'NULL'),
+    'drive-axle-models': ('monitoring_driveaxlemodel', 'NULL', 'NULL'),
+    'steering-axle-models': ('monitoring_steeringaxlemodel', 'NULL', 'NULL'),
+    'service-types': ('monitoring_servicetype', 'NULL', 'NULL'),
+    'service-organizations': ('monitoring_serviceorganization', 'NULL', 'NULL'),
+    'failure-nodes': ('monitoring_failurenode', 'NULL', 'NULL'),
+    'recovery-methods': ('monitoring_recoverymethod', 'NULL', 'NULL'),
+    'references': ('monitoring_reference', 'NULL', 'NULL'),
+}
+
+
+def entry(feed, object_id, kind, client, service, source=''):
+    return (
+        'INSERT INTO monitoring_change (feed, object_id, kind, client_id, service_company_id) '
+        f"SELECT '{feed}', {object_id}, '{kind}', {client}, {service} {source};"
+    )
+
+
+def lost(feed, client, service):
+    """Отметки прежним покупателю и компании, если строка ушла от них"""
+    old_client, new_client = client.format(row='OLD'), client.format(row='NEW')
+    old_service, new_service = service.format(row='OLD'), service.format(row='NEW')
+    return (
+        entry(feed, 'OLD.id', 'hidden', old_client, 'NULL',
+              f'WHERE {old_client} IS NOT NULL AND {old_client} IS NOT {new_client}')
+        + entry(feed, 'OLD.id', 'hidden', 'NULL', old_service,
+                f'WHERE {old_service} IS NOT NULL AND {old_service} IS NOT {new_service}')
+    )
+
+
+def machine_children():
+    """
+    Смена покупателя машины уводит к новому и её ТО, рекламации и компоненты,
+    смена сервисной компании - компоненты
+    """
+    client_changed = 'OLD.client_id IS NOT NEW.client_id'
+    service_changed = 'OLD.service_company_id IS NOT NEW.service_company_id'
+    statements = []
+    for feed, table, service, changed in (
+        ('technical-services', 'monitoring_technicalservice', 'service_company_id', client_changed),
+        ('reclamations', 'monitoring_reclamation', 'service_company_id', client_changed),
+        ('components', 'monitoring_component', 'NEW.service_company_id', f'({client_changed} OR {service_changed})'),
+    ):
+        source = f'FROM {table} WHERE machine_id = NEW.id'
+        statements.append(entry(
+            feed, 'id', 'hidden', 'OLD.client_id', 'NULL',
+            f'{source} AND OLD.client_id IS NOT NULL AND {client_changed}',
+        ))
+        if feed == 'components':
+            statements.append(entry(
+                feed, 'id', 'hidden', 'NULL', 'OLD.service_company_id',
+                f'{source} AND OLD.service_company_id IS NOT NULL AND {service_changed}',
+            ))
+        statements.append(entry(feed, 'id', 'saved', 'NEW.client_id', service, f'{source} AND {changed}'))
+    return (
+        'CREATE TRIGGER change_monitoring_machine_children '
+        'AFTER UPDATE OF client_id, service_company_id ON monitoring_machine '
+        f'WHEN {client_changed} OR {service_changed} BEGIN {" ".join(statements)} END;'
+    )
+
+
+def create_triggers():
+    statements = []
+    for feed, (table, client, service) in FEED_TABLES.items():
+        new_client, new_service = client.format(row='NEW'), service.format(row='NEW')
+        old_client, old_service = client.format(row='OLD'), service.format(row='OLD')
+        saved = entry(feed, 'NEW.id', 'saved', new_client, new_service)
+        update = saved + (lost(feed, client, service) if client != 'NULL' else '')
+        statements += [
+            f'CREATE TRIGGER change_{table}_insert AFTER INSERT ON {table} BEGIN {saved} END;',
+            f'CREATE TRIGGER change_{table}_update AFTER UPDATE ON {table} BEGIN {update} END;',
+            f'CREATE TRIGGER change_{table}_delete AFTER DELETE ON {table} BEGIN '
+            f"{entry(feed, 'OLD.id', 'deleted', old_client, old_service)} END;",
+        ]
+    return statements + [machine_children()]
+
+
+def drop_triggers():
+    statements = ['DROP TRIGGER IF EXISTS change_monitoring_machine_children;']
+    for table, _, _ in FEED_TABLES.values():
+        statements += [f'DROP TRIGGER IF EXISTS change_{table}_{event};' for event in ('insert', 'update', 'delete')]
+    return statements
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0014_import_runs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='component',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='driveaxlemodel',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='enginemodel',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='failurenode',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='machinemodel',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='recoverymethod',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='reference',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='serviceorganization',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='servicetype',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='steeringaxlemodel',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='technicalservice',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='transmissionmodel',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='machine',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='reclamation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feed', models.CharField(max_length=50, verbose_name='Лента')),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('kind', models.CharField(choices=[('saved', 'Сохранение'), ('deleted', 'Удаление'), ('hidden', 'Потеря видимости')], max_length=10)),
+                ('client_id', models.BigIntegerField(blank=True, null=True)),
+                ('service_company_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(db_default=django.db.models.functions.datetime.Now())),
+            ],
+            options={
+                'indexes': [models.Index(fields=['client_id', 'id'], name='change_client_idx'), models.Index(fields=['service_company_id', 'id'], name='change_service_idx')],
+            },
+        ),
+        migrations.RunSQL(create_triggers(), drop_triggers()),
+    ]
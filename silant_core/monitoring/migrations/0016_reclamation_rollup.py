@@ -0,0 +1,77 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def percentile(values, share):
+    """Линейная интерполяция, как у numpy/pandas по умолчанию"""
+    values = sorted(values)
+    position = (len(values) - 1) * share
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def fill_rollup(apps, schema_editor):
+    Reclamation = apps.get_model('monitoring', 'Reclamation')
+    ReclamationRollup = apps.get_model('monitoring', 'ReclamationRollup')
+
+    groups = {}
+    rows = Reclamation.objects.values_list(
+        'failure_node_id', 'recovery_method_id', 'machine__machine_model_id', 'service_company_id',
+        'failure_date', 'recovery_date', 'operating_hours',
+    )
+    for failure_node, recovery_method, machine_model, service_company, failure, recovery, hours in rows.iterator():
+        key = (failure_node, recovery_method, machine_model, service_company, failure.replace(day=1))
+        downtimes, hours_list = groups.setdefault(key, ([], []))
+        downtimes.append((recovery - failure).days)
+        hours_list.append(hours)
+
+    ReclamationRollup.objects.bulk_create([
+        ReclamationRollup(
+            failure_node_id=failure_node,
+            recovery_method_id=recovery_method,
+            machine_model_id=machine_model,
+            service_company_id=service_company,
+            month=month,
+            reclamation_count=len(downtimes),
+            total_downtime=sum(downtimes),
+            mean_downtime=sum(downtimes) / len(downtimes),
+            p95_downtime=percentile(downtimes, 0.95),
+            mean_operating_hours=sum(hours_list) / len(hours_list),
+        )
+        for (failure_node, recovery_method, machine_model, service_company, month), (downtimes, hours_list)
+        in groups.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0015_change_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReclamationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('reclamation_count', models.PositiveIntegerField()),
+                ('total_downtime', models.IntegerField(verbose_name='Простой, дней')),
+                ('mean_downtime', models.FloatField()),
+                ('p95_downtime', models.FloatField()),
+                ('mean_operating_hours', models.FloatField()),
+                ('failure_node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='monitoring.failurenode')),
+                ('machine_model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='monitoring.machinemodel')),
+                ('recovery_method', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='monitoring.recoverymethod')),
+                ('service_company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['machine_model', 'month'], name='rollup_scope_idx'), models.Index(fields=['month'], name='rollup_month_idx')],
+            },
+        ),
+        migrations.RunPython(fill_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0016_reclamation_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaintenanceForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hours_per_day', models.FloatField(verbose_name='Наработка в сутки, м/час')),
+                ('last_service_date', models.DateField(verbose_name='Последнее ТО этого вида')),
+                ('last_service_hours', models.PositiveIntegerField(verbose_name='Наработка на последнем ТО, м/час')),
+                ('interval_hours', models.PositiveIntegerField(verbose_name='Периодичность, м/час')),
+                ('next_service_hours', models.PositiveIntegerField(verbose_name='Наработка следующего ТО, м/час')),
+                ('due_date', models.DateField(verbose_name='Ожидаемая дата ТО')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='maintenance_forecasts', to='monitoring.machine')),
+                ('service_company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('service_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='monitoring.servicetype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['due_date', 'id'], name='forecast_due_idx'), models.Index(fields=['client', 'due_date', 'id'], name='forecast_client_idx'), models.Index(fields=['service_company', 'due_date', 'id'], name='forecast_service_idx')],
+                'constraints': [models.UniqueConstraint(fields=('machine', 'service_type'), name='unique_machine_forecast')],
+            },
+        ),
+    ]
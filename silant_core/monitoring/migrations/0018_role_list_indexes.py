@@ -0,0 +1,89 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+ROW_TABLES = ('monitoring_technicalservice', 'monitoring_reclamation')
+
+# Клиент машины сменился - её ТО и рекламации переходят к новому (в т.ч. при upsert импорта)
+MACHINE_CLIENT_TRIGGER = (
+    'CREATE TRIGGER row_client_monitoring_machine AFTER UPDATE OF client_id ON monitoring_machine '
+    'WHEN OLD.client_id IS NOT NEW.client_id BEGIN '
+    + ' '.join(f'UPDATE {table} SET client_id = NEW.client_id WHERE machine_id = NEW.id;' for table in ROW_TABLES)
+    + ' END;'
+)
+
+
+def fill_row_client(apps, schema_editor):
+    Change = apps.get_model('monitoring', 'Change')
+    Machine = apps.get_model('monitoring', 'Machine')
+    last = Change.objects.aggregate(last=Max('pk'))['last'] or 0
+    client = Subquery(Machine.objects.filter(pk=OuterRef('machine_id')).values('client_id'))
+    for name in ('TechnicalService', 'Reclamation'):
+        apps.get_model('monitoring', name).objects.update(client_id=client)
+    # Для API строки не изменились - отметки триггеров ленты изменений не нужны
+    Change.objects.filter(pk__gt=last).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0017_maintenance_forecast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reclamation',
+            name='client',
+            field=models.ForeignKey(db_constraint=False, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='technicalservice',
+            name='client',
+            field=models.ForeignKey(db_constraint=False, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(fill_row_client, migrations.RunPython.noop),
+        migrations.RunSQL(MACHINE_CLIENT_TRIGGER, 'DROP TRIGGER IF EXISTS row_client_monitoring_machine;'),
+        migrations.AddIndex(
+            model_name='machine',
+            index=models.Index(fields=['-shipment_date', 'id'], name='machine_shipment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='machine',
+            index=models.Index(fields=['client', '-shipment_date', 'id'], name='machine_client_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='machine',
+            index=models.Index(fields=['service_company', '-shipment_date', 'id'], name='machine_service_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenance',
+            index=models.Index(condition=models.Q(('end_date__isnull', True)), fields=['machine'], name='maintenance_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reclamation',
+            index=models.Index(fields=['-failure_date', 'id'], name='reclamation_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reclamation',
+            index=models.Index(fields=['service_company', '-failure_date', 'id'], name='reclamation_service_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='technicalservice',
+            index=models.Index(fields=['-service_date', 'id'], name='technical_service_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='technicalservice',
+            index=models.Index(fields=['service_company', '-service_date', 'id'], name='technical_service_company_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reclamation',
+            index=models.Index(fields=['client', '-failure_date', 'id'], name='reclamation_client_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='technicalservice',
+            index=models.Index(fields=['client', '-service_date', 'id'], name='technical_service_client_idx'),
+        ),
+    ]
@@ -1,10 +1,12 @@
 from django.db import models
+from django.db.models.functions import Now
 from django.contrib.auth.models import AbstractUser
 
 # Базовый класс для справочников (чтобы не дублировать __str__)
 class BaseReference(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         abstract = True
@@ -37,6 +39,7 @@ class SteeringAxleModel(BaseReference):
 class ServiceType(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name="Название")
     description = models.TextField(blank=True, verbose_name="Описание")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -47,6 +50,7 @@ class ServiceOrganization(models.Model):
     address = models.TextField(verbose_name="Адрес")
     contact_person = models.CharField(max_length=255, verbose_name="Контактное лицо")
     contact_phone = models.CharField(max_length=20, verbose_name="Контактный телефон")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -55,6 +59,7 @@ class ServiceOrganization(models.Model):
 class FailureNode(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name="Название")
     description = models.TextField(blank=True, verbose_name="Описание")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -63,6 +68,7 @@ class FailureNode(models.Model):
 class RecoveryMethod(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name="Название")
     description = models.TextField(blank=True, verbose_name="Описание")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -96,17 +102,34 @@ class User(AbstractUser):
             return Machine.objects.all()
         return Machine.objects.none()
 
+    def can_edit_technical_services(self):
+        """Может ли пользователь вносить ТО"""
+        return self.role in ['service', 'manager']
+
     def can_edit_reclamations(self):
         """Может ли пользователь редактировать рекламации"""
         return self.role in ['service', 'manager']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        # Логин на момент загрузки - чтобы save() не перечитывал строку ради сравнения
+        if 'username' in field_names:
+            user._loaded_username = user.username
+        return user
+
     def save(self, *args, **kwargs):
         """Запрет изменения username после создания"""
-        if self.pk:
-            orig = User.objects.get(pk=self.pk)
-            if orig.username != self.username:
+        update_fields = kwargs.get('update_fields')
+        if self.pk and (update_fields is None or 'username' in update_fields):
+            orig_username = getattr(self, '_loaded_username', None)
+            if orig_username is None:
+                # Объект собран не из БД - сравнить не с чем
+                orig_username = User.objects.filter(pk=self.pk).values_list('username', flat=True).first()
+            if orig_username is not None and orig_username != self.username:
                 raise ValueError("Изменение логина запрещено")
         super().save(*args, **kwargs)
+        self._loaded_username = self.username
 
     def set_password_restricted(self, raw_password):
         """Специальный метод, чтобы запретить пользователю менять пароль"""
@@ -116,6 +139,35 @@ class User(AbstractUser):
         return user.role == 'manager'
 
 
+class MachineQuerySet(models.QuerySet):
+    def with_status(self):
+        """Справочники, клиент и сервисная компания одним JOIN, статусы - подзапросами"""
+        worn_components = Component.objects.alias(
+            wear=models.F('current_hours') * 100
+        ).filter(
+            machine=models.OuterRef('pk'),
+            lifetime_hours__gt=0,
+            # wear_percentage > 85 при целочисленном округлении
+            wear__gte=models.F('lifetime_hours') * 86,
+        )
+        open_maintenance = Maintenance.objects.filter(
+            machine=models.OuterRef('pk'),
+            end_date__isnull=True,
+        )
+        return self.select_related(
+            'machine_model',
+            'engine_model',
+            'transmission_model',
+            'drive_axle_model',
+            'steering_axle_model',
+            'client',
+            'service_company',
+        ).annotate(
+            is_in_service=models.Exists(open_maintenance),
+            needs_maintenance=models.Exists(worn_components),
+        )
+
+
 class Machine(models.Model):
     # Основная информация
     serial_number = models.CharField(max_length=50, unique=True, verbose_name="Зав. № машины")
@@ -190,7 +242,9 @@ class Machine(models.Model):
 
     # Дополнительные поля
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = MachineQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.machine_model.name} ({self.serial_number})"
@@ -198,11 +252,15 @@ class Machine(models.Model):
     @property
     def requires_maintenance(self):
         """Проверяет, требуется ли обслуживание машине"""
+        if hasattr(self, 'needs_maintenance'):
+            return self.needs_maintenance
         return any(comp.wear_percentage > 85 for comp in self.components.all())
 
     @property
     def in_service(self):
         """Проверяет, находится ли машина в сервисе"""
+        if hasattr(self, 'is_in_service'):
+            return self.is_in_service
         return self.maintenance_history.filter(end_date__isnull=True).exists()
 
     @property
@@ -239,6 +297,12 @@ class Machine(models.Model):
 
     class Meta:
         ordering = ['-shipment_date']
+        indexes = [
+            # Списки по ролям: владелец и порядок keyset-пагинации
+            models.Index(fields=['-shipment_date', 'id'], name='machine_shipment_idx'),
+            models.Index(fields=['client', '-shipment_date', 'id'], name='machine_client_idx'),
+            models.Index(fields=['service_company', '-shipment_date', 'id'], name='machine_service_idx'),
+        ]
 
 
 class Component(models.Model):
@@ -250,6 +314,7 @@ class Component(models.Model):
 
     # Связь с машиной через компонентную модель
     machine = models.ForeignKey(Machine, on_delete=models.CASCADE, related_name='components')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     @property
     def wear_percentage(self):
@@ -264,7 +329,7 @@ class Component(models.Model):
         if user.role == 'manager':
             return True
         elif user.role == 'service':
-            return self.machine.service_company == user
+            return self.machine.service_company_id == user.pk
         return False
 
 
@@ -294,9 +359,17 @@ class Maintenance(models.Model):
         if user.role == 'manager':
             return True
         elif user.role == 'service':
-            return self.service_company == user
+            return self.service_company_id == user.pk
         return False
 
+    class Meta:
+        indexes = [
+            # Статус "в ремонте": открытые работы - малая часть истории
+            models.Index(
+                fields=['machine'], condition=models.Q(end_date__isnull=True), name='maintenance_open_idx'
+            ),
+        ]
+
 
 class TechnicalService(models.Model):
     machine = models.ForeignKey(
@@ -334,15 +407,28 @@ class TechnicalService(models.Model):
         limit_choices_to={'role': 'service'},
         verbose_name="Сервисная компания"
     )
+    # Клиент машины - копия для списков клиента по индексу (client, дата);
+    # при смене клиента машины обновляется триггером (миграция 0018).
+    # Целостность держит Machine.client, так что без своего индекса и FK в БД:
+    # колонка меняется без пересборки таблицы, которая сломала бы триггеры ленты
+    client = models.ForeignKey(
+        User, on_delete=models.PROTECT, null=True, editable=False, related_name='+',
+        db_index=False, db_constraint=False
+    )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"ТО {self.service_type} для {self.machine} ({self.service_date})"
 
+    def save(self, *args, **kwargs):
+        self.client_id = self.machine.client_id
+        super().save(*args, **kwargs)
+
     @classmethod
     def get_visible_to_user(cls, user):
         """Получить ТО, видимые пользователю"""
         if user.role == 'client':
-            return cls.objects.filter(machine__client=user)
+            return cls.objects.filter(client=user)
         elif user.role == 'service':
             return cls.objects.filter(service_company=user)
         elif user.role == 'manager':
@@ -354,11 +440,19 @@ class TechnicalService(models.Model):
         if user.role == 'manager':
             return True
         elif user.role == 'service':
-            return self.service_company == user
+            return self.service_company_id == user.pk
         return False
 
     class Meta:
         ordering = ['-service_date']
+        constraints = [
+            models.UniqueConstraint(fields=['machine', 'service_date'], name='unique_machine_service_date'),
+        ]
+        indexes = [
+            models.Index(fields=['-service_date', 'id'], name='technical_service_date_idx'),
+            models.Index(fields=['service_company', '-service_date', 'id'], name='technical_service_company_idx'),
+            models.Index(fields=['client', '-service_date', 'id'], name='technical_service_client_idx'),
+        ]
 
 
 # Основная модель рекламаций
@@ -392,12 +486,24 @@ class Reclamation(models.Model):
         limit_choices_to={'role': 'service'},
         verbose_name="Сервисная компания"
     )
+    # Клиент машины - копия для списков клиента по индексу (client, дата);
+    # при смене клиента машины обновляется триггером (миграция 0018).
+    # Целостность держит Machine.client, так что без своего индекса и FK в БД:
+    # колонка меняется без пересборки таблицы, которая сломала бы триггеры ленты
+    client = models.ForeignKey(
+        User, on_delete=models.PROTECT, null=True, editable=False, related_name='+',
+        db_index=False, db_constraint=False
+    )
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Рекламация по {self.machine} ({self.failure_date})"
 
+    def save(self, *args, **kwargs):
+        self.client_id = self.machine.client_id
+        super().save(*args, **kwargs)
+
     @property
     def downtime(self):
         """Расчет времени простоя техники в днях"""
@@ -409,7 +515,7 @@ class Reclamation(models.Model):
     def get_visible_to_user(cls, user):
         """Получить рекламации, видимые пользователю"""
         if user.role == 'client':
-            return cls.objects.filter(machine__client=user)
+            return cls.objects.filter(client=user)
         elif user.role == 'service':
             return cls.objects.filter(service_company=user)
         elif user.role == 'manager':
@@ -421,16 +527,25 @@ class Reclamation(models.Model):
         if user.role == 'manager':
             return True
         elif user.role == 'service':
-            return self.service_company == user
+            return self.service_company_id == user.pk
         return False
 
     class Meta:
         ordering = ['-failure_date']
+        constraints = [
+            models.UniqueConstraint(fields=['machine', 'failure_date'], name='unique_machine_failure_date'),
+        ]
+        indexes = [
+            models.Index(fields=['-failure_date', 'id'], name='reclamation_date_idx'),
+            models.Index(fields=['service_company', '-failure_date', 'id'], name='reclamation_service_idx'),
+            models.Index(fields=['client', '-failure_date', 'id'], name='reclamation_client_idx'),
+        ]
 
 
 class Reference(models.Model):
     name = models.CharField(max_length=255, unique=True)
     description = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         verbose_name = "Справочник"
@@ -438,3 +553,263 @@ class Reference(models.Model):
 
     def __str__(self):
         return self.name
+
+
+# Денормализованная витрина для списка и поиска машин (см. monitoring/summary.py)
+class MachineSummary(models.Model):
+    machine = models.OneToOneField(
+        Machine,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='summary'
+    )
+    serial_number = models.CharField(max_length=50, unique=True)
+    shipment_date = models.DateField()
+    current_hours = models.PositiveIntegerField(default=0)
+
+    machine_model_name = models.CharField(max_length=100)
+    engine_model_name = models.CharField(max_length=100)
+    transmission_model_name = models.CharField(max_length=100)
+    drive_axle_model_name = models.CharField(max_length=100)
+    steering_axle_model_name = models.CharField(max_length=100)
+
+    engine_serial = models.CharField(max_length=50)
+    transmission_serial = models.CharField(max_length=50)
+    drive_axle_serial = models.CharField(max_length=50)
+    steering_axle_serial = models.CharField(max_length=50)
+
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    client_name = models.CharField(max_length=300)
+    service_company = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    service_company_name = models.CharField(max_length=300, blank=True)
+
+    in_service = models.BooleanField(default=False)
+    max_wear = models.PositiveSmallIntegerField(default=0)
+    last_service_date = models.DateField(null=True, blank=True)
+    reclamation_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.machine_model_name} ({self.serial_number})"
+
+    @property
+    def requires_maintenance(self):
+        return self.max_wear > 85
+
+    @classmethod
+    def get_visible_to_user(cls, user):
+        """Получить строки витрины по машинам, доступным пользователю"""
+        if user.role == 'client':
+            return cls.objects.filter(client=user)
+        elif user.role == 'service':
+            return cls.objects.filter(service_company=user)
+        elif user.role == 'manager':
+            return cls.objects.all()
+        return cls.objects.none()
+
+    class Meta:
+        ordering = ['-shipment_date']
+        indexes = [
+            models.Index(fields=['-shipment_date', 'machine'], name='summary_shipment_idx'),
+            models.Index(fields=['client', '-shipment_date', 'machine'], name='summary_client_idx'),
+            models.Index(fields=['service_company', '-shipment_date', 'machine'], name='summary_service_idx'),
+        ]
+
+
+# Хэш содержимого строки выгрузки, чтобы повторный импорт пропускал неизменённые строки
+class ImportedRow(models.Model):
+    SHEET_CHOICES = (
+        ('machines', 'Машины'),
+        ('services', 'ТО'),
+        ('reclamations', 'Рекламации'),
+    )
+    sheet = models.CharField(max_length=20, choices=SHEET_CHOICES)
+    key = models.CharField(max_length=100, verbose_name="Ключ строки")
+    digest = models.CharField(max_length=40, verbose_name="Хэш содержимого")
+    imported_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.get_sheet_display()}: {self.key}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sheet', 'key'], name='unique_imported_row'),
+        ]
+
+
+# Журнал запусков import_data: чекпоинты по пакетам и строки с ошибками
+class ImportRun(models.Model):
+    RUNNING, FAILED, DONE = 'running', 'failed', 'done'
+    STATUS_CHOICES = (
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Прерван с ошибкой'),
+        (DONE, 'Завершён'),
+    )
+    file_path = models.CharField(max_length=500, verbose_name="Файл")
+    options = models.JSONField(default=dict, verbose_name="Параметры")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=RUNNING)
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    rows = models.PositiveIntegerField(default=0, verbose_name="Обработано строк")
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Импорт #{self.pk} ({self.get_status_display()})"
+
+    class Meta:
+        ordering = ['-started_at']
+
+
+class ImportChunk(models.Model):
+    run = models.ForeignKey(ImportRun, on_delete=models.CASCADE, related_name='chunks')
+    sheet = models.CharField(max_length=20, choices=ImportedRow.SHEET_CHOICES)
+    index = models.PositiveIntegerField(verbose_name="№ пакета")
+    rows = models.PositiveIntegerField(verbose_name="Строк")
+    written = models.PositiveIntegerField(verbose_name="Записано")
+    errors = models.PositiveIntegerField(default=0, verbose_name="Ошибок")
+    duration = models.FloatField(verbose_name="Длительность, с")
+    committed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.run}: {self.get_sheet_display()} #{self.index}"
+
+    class Meta:
+        ordering = ['run', 'committed_at']
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'sheet', 'index'], name='unique_import_chunk'),
+        ]
+
+
+class ImportRowError(models.Model):
+    run = models.ForeignKey(ImportRun, on_delete=models.CASCADE, related_name='row_errors')
+    sheet = models.CharField(max_length=20, choices=ImportedRow.SHEET_CHOICES)
+    chunk_index = models.PositiveIntegerField(verbose_name="№ пакета")
+    message = models.TextField(verbose_name="Сообщение")
+
+    def __str__(self):
+        return self.message
+
+
+# Журнал ленты изменений (см. monitoring/changes.py). Строки пишут триггеры БД
+# (миграция 0015) - при любой записи, в том числе bulk_create и update()
+class Change(models.Model):
+    SAVED = 'saved'
+    DELETED = 'deleted'
+    # Запись осталась, но ушла к другому покупателю или сервисной компании
+    HIDDEN = 'hidden'
+    KIND_CHOICES = (
+        (SAVED, 'Сохранение'),
+        (DELETED, 'Удаление'),
+        (HIDDEN, 'Потеря видимости'),
+    )
+
+    feed = models.CharField(max_length=50, verbose_name="Лента")
+    object_id = models.PositiveBigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Кому видна запись: покупатель машины и сервисная компания записи на момент
+    # изменения. У справочников оба пустые - их изменения видны всем
+    client_id = models.BigIntegerField(null=True, blank=True)
+    service_company_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(db_default=Now())
+
+    def __str__(self):
+        return f"{self.feed} #{self.object_id}: {self.kind}"
+
+    @classmethod
+    def get_visible_to_user(cls, user):
+        """Получить изменения, видимые пользователю"""
+        public = models.Q(client_id__isnull=True, service_company_id__isnull=True)
+        if user.role == 'client':
+            return cls.objects.filter(public | models.Q(client_id=user.pk))
+        elif user.role == 'service':
+            return cls.objects.filter(public | models.Q(service_company_id=user.pk))
+        elif user.role == 'manager':
+            # Менеджер видит все записи - смена покупателя или компании для него не удаление
+            return cls.objects.exclude(kind=cls.HIDDEN)
+        return cls.objects.none()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['client_id', 'id'], name='change_client_idx'),
+            models.Index(fields=['service_company_id', 'id'], name='change_service_idx'),
+        ]
+
+
+# Свёртка рекламаций для аналитики простоев (см. monitoring/rollup.py)
+class ReclamationRollup(models.Model):
+    failure_node = models.ForeignKey(FailureNode, on_delete=models.CASCADE, related_name='+')
+    recovery_method = models.ForeignKey(RecoveryMethod, on_delete=models.CASCADE, related_name='+')
+    machine_model = models.ForeignKey(MachineModel, on_delete=models.CASCADE, related_name='+')
+    service_company = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    # Первое число месяца отказа
+    month = models.DateField()
+
+    reclamation_count = models.PositiveIntegerField()
+    total_downtime = models.IntegerField(verbose_name="Простой, дней")
+    mean_downtime = models.FloatField()
+    p95_downtime = models.FloatField()
+    mean_operating_hours = models.FloatField()
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}: {self.reclamation_count}"
+
+    @classmethod
+    def get_visible_to_user(cls, user):
+        """Сервисная компания видит свои рекламации, менеджер - все"""
+        if user.role == 'service':
+            return cls.objects.filter(service_company=user)
+        elif user.role == 'manager':
+            return cls.objects.all()
+        return cls.objects.none()
+
+    class Meta:
+        indexes = [
+            # Пересчёт идёт по (модель техники, месяц), отчёты - по периоду
+            models.Index(fields=['machine_model', 'month'], name='rollup_scope_idx'),
+            models.Index(fields=['month'], name='rollup_month_idx'),
+        ]
+
+
+# Прогноз следующего ТО каждого вида по машине (см. monitoring/forecast.py)
+class MaintenanceForecast(models.Model):
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE, related_name='maintenance_forecasts')
+    service_type = models.ForeignKey(ServiceType, on_delete=models.CASCADE, related_name='+')
+    # Владельцы машины - копия из Machine, чтобы список видимого шёл по индексу
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    service_company = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    hours_per_day = models.FloatField(verbose_name="Наработка в сутки, м/час")
+    last_service_date = models.DateField(verbose_name="Последнее ТО этого вида")
+    last_service_hours = models.PositiveIntegerField(verbose_name="Наработка на последнем ТО, м/час")
+    interval_hours = models.PositiveIntegerField(verbose_name="Периодичность, м/час")
+    next_service_hours = models.PositiveIntegerField(verbose_name="Наработка следующего ТО, м/час")
+    due_date = models.DateField(verbose_name="Ожидаемая дата ТО")
+
+    def __str__(self):
+        return f"{self.service_type} для {self.machine_id}: {self.due_date}"
+
+    @classmethod
+    def get_visible_to_user(cls, user):
+        """Получить прогнозы по машинам, доступным пользователю"""
+        if user.role == 'client':
+            return cls.objects.filter(client=user)
+        elif user.role == 'service':
+            return cls.objects.filter(service_company=user)
+        elif user.role == 'manager':
+            return cls.objects.all()
+        return cls.objects.none()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['machine', 'service_type'], name='unique_machine_forecast'),
+        ]
+        indexes = [
+            models.Index(fields=['due_date', 'id'], name='forecast_due_idx'),
+            models.Index(fields=['client', 'due_date', 'id'], name='forecast_client_idx'),
+            models.Index(fields=['service_company', 'due_date', 'id'], name='forecast_service_idx'),
+        ]
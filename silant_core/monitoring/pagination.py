@@ -0,0 +1,256 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .references import attach_references
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def bounded_count(queryset, limit):
+    """COUNT, который останавливается на limit + 1 строке (None - точный подсчёт)"""
+    queryset = queryset.order_by()
+    if limit is None:
+        return queryset.count()
+    return queryset[:limit + 1].count()
+
+
+async def abounded_count(queryset, limit):
+    queryset = queryset.order_by()
+    if limit is None:
+        return await queryset.acount()
+    return await queryset[:limit + 1].acount()
+
+
+class CursorPage:
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    @property
+    def next_cursor(self):
+        if not self.has_next_page:
+            return None
+        return self.paginator.encode_cursor('next', self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous_page:
+            return None
+        return self.paginator.encode_cursor('prev', self.object_list[0])
+
+    @property
+    def last_cursor(self):
+        return self.paginator.encode_cursor('prev', None)
+
+
+class CursorPaginator:
+    """
+    Keyset-пагинация: страница выбирается условием по ключу сортировки,
+    а не OFFSET, поэтому любая страница стоит столько же, сколько первая.
+    ordering - поля ключа, например ('-shipment_date', 'id'); последнее поле
+    должно быть уникальным.
+    """
+
+    def __init__(self, queryset, ordering, per_page, count_limit=1000):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = int(per_page)
+        self.count_limit = count_limit
+        self.fields = [
+            (key.lstrip('-'), key.startswith('-')) for key in self.ordering
+        ]
+
+    @cached_property
+    def count(self):
+        return bounded_count(self.queryset, self.count_limit)
+
+    @property
+    def count_is_exact(self):
+        return self.count_limit is None or self.count <= self.count_limit
+
+    def encode_cursor(self, direction, obj):
+        position = None
+        if obj is not None:
+            position = [str(getattr(obj, name)) for name, _ in self.fields]
+        payload = json.dumps([direction, position], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if direction not in ('next', 'prev'):
+                raise ValueError(direction)
+            if position is not None:
+                if len(position) != len(self.fields):
+                    raise ValueError(position)
+                opts = self.queryset.model._meta
+                position = [
+                    opts.get_field(name).to_python(value)
+                    for (name, _), value in zip(self.fields, position)
+                ]
+        except Exception as exc:
+            raise InvalidCursor(cursor) from exc
+        return direction, position
+
+    def _beyond(self, position, reverse):
+        """
+        Условие "строго после позиции" для составного ключа. Нестрогая
+        граница по первому полю дублирует OR-условие, но даёт планировщику
+        один диапазон индекса: без неё SQLite может разбить OR на несколько
+        поисков по индексу и сортировать их объединение.
+        """
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.fields, position):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        (name, descending), value = self.fields[0], position[0]
+        return Q(**{f"{name}__{'lte' if descending != reverse else 'gte'}": value}) & condition
+
+    def _order_by(self, reverse):
+        return [
+            f'-{name}' if descending != reverse else name
+            for name, descending in self.fields
+        ]
+
+    def _page_query(self, cursor):
+        """(запрос строк страницы с одной лишней, позиция курсора, назад ли)"""
+        direction, position = 'next', None
+        if cursor:
+            direction, position = self.decode_cursor(cursor)
+        reverse = direction == 'prev'
+
+        queryset = self.queryset.order_by(*self._order_by(reverse))
+        if position is not None:
+            queryset = queryset.filter(self._beyond(position, reverse))
+        return queryset[:self.per_page + 1], position, reverse
+
+    def page(self, cursor=None):
+        queryset, position, reverse = self._page_query(cursor)
+        return self._make_page(list(queryset), position, reverse)
+
+    async def apage(self, cursor=None):
+        queryset, position, reverse = self._page_query(cursor)
+        return self._make_page([row async for row in queryset], position, reverse)
+
+    def _make_page(self, rows, position, reverse):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if reverse:
+            rows.reverse()
+            return CursorPage(rows, self, has_next=position is not None, has_previous=has_more)
+        return CursorPage(rows, self, has_next=has_more, has_previous=position is not None)
+
+
+class CursorPaginationMixin:
+    """
+    Подменяет OFFSET-пагинацию ListView на keyset-пагинацию по cursor_ordering.
+    cached_references - связи со справочниками, которые подставляются в
+    записи страницы из кеша справочников (см. attach_references).
+    """
+    paginate_by = 10
+    cursor_ordering = None
+    cursor_kwarg = 'cursor'
+    count_limit = 1000
+    cached_references = ()
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(queryset, self.cursor_ordering, page_size, self.count_limit)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404("Некорректный курсор страницы")
+        attach_references(page.object_list, *self.cached_references)
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class ApiCursorPagination(BasePagination):
+    """
+    Та же keyset-пагинация для API: ключ берётся из cursor_ordering view.
+    Общее число записей не считается, поэтому страница - это один запрос.
+    """
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = CursorPaginator(queryset, view.cursor_ordering, self.get_page_size(request))
+        try:
+            self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound("Некорректный курсор страницы")
+        return self.page.object_list
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = CursorPaginator(queryset, view.cursor_ordering, self.get_page_size(request))
+        try:
+            self.page = await paginator.apage(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound("Некорректный курсор страницы")
+        return self.page.object_list
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_link(self.page.next_cursor),
+            'previous': self.get_link(self.page.previous_cursor),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,136 @@
+"""
+Кеш справочников в памяти процесса.
+
+Справочники маленькие и меняются редко, а читаются на каждой странице:
+варианты в формах, фильтры по названию, названия в списках и API, импорт.
+Процесс держит их целиком (id -> запись, название -> id) и сверяет общую
+версию в кеше Django не чаще раза в CHECK_INTERVAL. Сохранение или удаление
+справочника после фиксации транзакции ставит новую версию, и остальные
+процессы перечитывают справочники при следующей сверке.
+
+Кеш читают потоки WSGI и потоки sync_to_async: набор таблиц не меняется на
+месте, а собирается заново и подменяется под _lock одним присваиванием.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import (
+    DriveAxleModel, EngineModel, FailureNode, MachineModel, RecoveryMethod, Reference, ServiceOrganization,
+    ServiceType, SteeringAxleModel, TransmissionModel
+)
+
+CACHED_REFERENCES = (
+    MachineModel, EngineModel, TransmissionModel, DriveAxleModel, SteeringAxleModel,
+    ServiceType, FailureNode, RecoveryMethod, ServiceOrganization, Reference,
+)
+
+VERSION_KEY = 'references:version'
+CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_state = {'version': None, 'checked': None, 'tables': {}}
+
+
+class ReferenceTable:
+    def __init__(self, model):
+        # Из основной БД: кеш живёт до смены версии, отставшая реплика оставила бы в нём старые записи
+        self.objects = {obj.pk: obj for obj in model.objects.using(DEFAULT_DB_ALIAS).order_by('name')}
+        self.ids = {obj.name: pk for pk, obj in self.objects.items()}
+        self.names = {pk: obj.name for pk, obj in self.objects.items()}
+
+
+def _check_version():
+    now = time.monotonic()
+    if _state['checked'] is not None and now - _state['checked'] < CHECK_INTERVAL:
+        return
+    version = cache.get(VERSION_KEY)
+    with _lock:
+        if version != _state['version']:
+            _state['tables'] = {}
+            _state['version'] = version
+        _state['checked'] = now
+
+
+def reference_table(model):
+    _check_version()
+    tables = _state['tables']
+    table = tables.get(model)
+    if table is None:
+        table = ReferenceTable(model)
+        with _lock:
+            # Пока таблица читалась, набор могли сбросить - тогда она уже устарела и не сохраняется
+            if _state['tables'] is tables:
+                _state['tables'] = {**tables, model: table}
+    return table
+
+
+def reference_objects(model):
+    """id -> запись справочника; записи общие, менять их нельзя"""
+    return reference_table(model).objects
+
+
+def reference_names(model):
+    """id -> название"""
+    return reference_table(model).names
+
+
+def reference_ids(model):
+    """название -> id"""
+    return reference_table(model).ids
+
+
+def forget_reference(model):
+    """Перечитать справочник при следующем обращении"""
+    with _lock:
+        _state['tables'] = {key: table for key, table in _state['tables'].items() if key is not model}
+
+
+def get_reference(model, pk):
+    """
+    Запись справочника по id. Записи, созданной в другом процессе до
+    сверки версии, в кеше ещё нет - тогда справочник перечитывается.
+    """
+    obj = reference_objects(model).get(pk)
+    if obj is None:
+        forget_reference(model)
+        obj = reference_objects(model).get(pk)
+    return obj
+
+
+def matching_ids(model, text):
+    """id записей, в названии которых есть text (без учёта регистра)"""
+    text = text.casefold()
+    return [pk for pk, name in reference_names(model).items() if text in name.casefold()]
+
+
+def bump_version():
+    """Новая версия справочников для всех процессов, свой кеш сбрасывается сразу"""
+    cache.set(VERSION_KEY, time.time_ns(), None)
+    with _lock:
+        _state['tables'] = {}
+        _state['checked'] = None
+
+
+def schedule_version_bump():
+    """Новая версия после фиксации транзакции, чтобы другие процессы не прочли старые данные"""
+    transaction.on_commit(bump_version)
+
+
+def attach_references(objects, *paths):
+    """
+    Подставить справочники объектам из кеша вместо select_related:
+    attach_references(services, 'service_type', 'machine.machine_model').
+    Промежуточные связи (machine) должны быть уже загружены.
+    """
+    for path in paths:
+        *parents, name = path.split('.')
+        for obj in objects:
+            target = obj
+            for parent in parents:
+                target = getattr(target, parent)
+            field = target._meta.get_field(name)
+            pk = getattr(target, field.attname)
+            field.set_cached_value(target, None if pk is None else get_reference(field.related_model, pk))
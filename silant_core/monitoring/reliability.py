@@ -0,0 +1,229 @@
+"""
+Отчёт о надёжности: наработка на отказ (MTBF) и распределение Вейбулла.
+
+Машина после ремонта считается восстановленной до "как новая", поэтому
+наработки между отказами - выборка одного распределения, а интервал от
+последнего отказа до текущей наработки машины - цензурированное
+наблюдение. Для модели техники, двигателя, трансмиссии интервалы считаются
+по отказам машины, для узла отказа - по отказам этого узла на машине;
+узлу подвержен весь парк, так что машины без его отказов входят в
+выборку целиком.
+
+Колонки грузятся одним запросом в массивы NumPy, и всё дальше - операции
+над массивами: параметр формы Вейбулла для всех групп сразу находится
+бисекцией уравнения правдоподобия, суммы по группам - np.bincount.
+Готовый отчёт кешируется с ключом версии данных, которая меняется при
+любом изменении машин, рекламаций и справочника разреза.
+"""
+import hashlib
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import EngineModel, FailureNode, Machine, MachineModel, Reclamation, TransmissionModel
+
+# Разрез отчёта -> (справочник, поле машины; None - узел отказа из рекламации)
+DIMENSIONS = {
+    'machine_model': (MachineModel, 'machine_model_id'),
+    'engine_model': (EngineModel, 'engine_model_id'),
+    'transmission_model': (TransmissionModel, 'transmission_model_id'),
+    'failure_node': (FailureNode, None),
+}
+
+CACHE_TIMEOUT = 24 * 60 * 60
+CURVE_POINTS = 10
+# Границы поиска параметра формы: за ними оценке по данным парка не верим
+SHAPE_BOUNDS = (0.1, 10.0)
+BISECTIONS = 50
+
+
+def data_version(by):
+    """Версия данных отчёта: число и последнее изменение машин, рекламаций, справочника"""
+    reference_model = DIMENSIONS[by][0]
+    stamps = [
+        model.objects.aggregate(count=Count('pk'), changed=Max('updated_at'))
+        for model in (Machine, Reclamation, reference_model)
+    ]
+    raw = '|'.join(f"{stamp['count']}:{stamp['changed']}" for stamp in stamps)
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def load_fleet(machines):
+    """Колонки машин и их рекламаций -> массивы NumPy"""
+    fields = ['id', *(field for _, field in DIMENSIONS.values() if field), 'current_hours']
+    fleet = np.array(list(machines.order_by('id').values_list(*fields)), dtype=np.int64).reshape(-1, len(fields))
+    failures = np.array(
+        list(Reclamation.objects.filter(machine__in=machines.values('pk')).values_list(
+            'machine_id', 'failure_node_id', 'operating_hours'
+        )),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    columns = dict(zip(fields, fleet.T))
+    return columns, failures
+
+
+def fit_weibull(x, failed, group, groups, weight, common=None):
+    """
+    Оценка формы и масштаба Вейбулла по цензурированной выборке для всех
+    групп сразу. x - наработки, failed - 1 у отказа и 0 у цензуры, group -
+    номер группы, weight - вес строки (-1 вычитает строку из суммы).
+    common - наработки, которые входят цензурой в каждую группу.
+    Возвращает массивы формы и масштаба; NaN - данных для оценки мало.
+    """
+    # Нормировка к среднему, чтобы x ** k не переполнялся
+    norm = x.mean() if x.size else 1.0
+    x = x / norm
+    log_x = np.log(x)
+    failures = np.bincount(group, weights=failed * weight, minlength=groups)
+    mean_log = np.bincount(group, weights=failed * weight * log_x, minlength=groups) / np.maximum(failures, 1)
+    if common is not None:
+        common = common / norm
+        log_common = np.log(common)
+
+    def sums(shape):
+        power = x ** shape[group]
+        s0 = np.bincount(group, weights=weight * power, minlength=groups)
+        s1 = np.bincount(group, weights=weight * power * log_x, minlength=groups)
+        if common is not None:
+            common_power = common[:, None] ** shape[None, :]
+            s0 = s0 + common_power.sum(axis=0)
+            s1 = s1 + (common_power * log_common[:, None]).sum(axis=0)
+        return s0, s1
+
+    def equation(shape):
+        # Производная логарифма правдоподобия по форме; растёт с формой
+        s0, s1 = sums(shape)
+        return s1 / s0 - 1 / shape - mean_log
+
+    low = np.full(groups, np.log(SHAPE_BOUNDS[0]))
+    high = np.full(groups, np.log(SHAPE_BOUNDS[1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        solvable = (failures >= 2) & (equation(np.exp(low)) < 0) & (equation(np.exp(high)) > 0)
+        for _ in range(BISECTIONS):
+            middle = (low + high) / 2
+            above = equation(np.exp(middle)) > 0
+            high = np.where(above, middle, high)
+            low = np.where(above, low, middle)
+        shape = np.exp((low + high) / 2)
+        s0, _ = sums(shape)
+        scale = norm * (s0 / failures) ** (1 / shape)
+    return np.where(solvable, shape, np.nan), np.where(solvable, scale, np.nan)
+
+
+def renewal_intervals(unit, hours):
+    """
+    Наработки между отказами внутри единицы (машина или машина и узел).
+    Возвращает интервалы, единицы по порядку отказов и маску последнего
+    отказа каждой единицы.
+    """
+    order = np.lexsort((hours, unit))
+    unit, hours = unit[order], hours[order]
+    first = np.ones(unit.size, dtype=bool)
+    first[1:] = unit[1:] != unit[:-1]
+    last = np.ones(unit.size, dtype=bool)
+    last[:-1] = first[1:]
+    gaps = np.where(first, hours, np.diff(hours, prepend=0))
+    # Два отказа на одной наработке - счётчик меряет часы, меньше часа не бывает
+    return np.maximum(gaps, 1).astype(float), unit, hours, last
+
+
+def compute_report(by, machines):
+    """Отчёт по разрезу by для машин queryset machines"""
+    reference_model, field = DIMENSIONS[by]
+    columns, failures = load_fleet(machines)
+    machine_ids = columns['id']
+    failures = failures[np.isin(failures[:, 0], machine_ids)]
+    position = np.searchsorted(machine_ids, failures[:, 0])
+    failure_hours = failures[:, 2]
+
+    # Наработка машины - текущая, но не меньше наработки последнего отказа
+    exposure = columns['current_hours'].astype(float)
+    np.maximum.at(exposure, position, failure_hours)
+
+    if field:
+        keys, machine_group = np.unique(columns[field], return_inverse=True)
+        gaps, unit, hours, last = renewal_intervals(position, failure_hours)
+        failure_group = machine_group[unit]
+        censored = exposure.copy()
+        censored[unit[last]] -= hours[last]
+        keep = censored > 0
+        x = np.concatenate([gaps, censored[keep]])
+        failed = np.concatenate([np.ones(gaps.size), np.zeros(keep.sum())])
+        group = np.concatenate([failure_group, machine_group[keep]])
+        weight = np.ones(x.size)
+        common = None
+        machine_count = np.bincount(machine_group, minlength=keys.size)
+        group_exposure = np.bincount(machine_group, weights=exposure, minlength=keys.size)
+    else:
+        keys, node_group = np.unique(failures[:, 1], return_inverse=True)
+        gaps, unit, hours, last = renewal_intervals(position * keys.size + node_group, failure_hours)
+        failure_group = unit % keys.size
+        pair_machine = unit[last] // keys.size
+        # Пары (машина, узел) с отказами: хвост после последнего отказа вместо
+        # всей наработки машины, которая входит в common
+        tail = exposure[pair_machine] - hours[last]
+        keep = tail > 0
+        whole = exposure[pair_machine] > 0
+        x = np.concatenate([gaps, tail[keep], exposure[pair_machine][whole]])
+        failed = np.concatenate([np.ones(gaps.size), np.zeros(keep.sum() + whole.sum())])
+        group = np.concatenate([failure_group, failure_group[last][keep], failure_group[last][whole]])
+        weight = np.concatenate([np.ones(gaps.size + keep.sum()), -np.ones(whole.sum())])
+        common = exposure[exposure > 0]
+        machine_count = np.full(keys.size, machine_ids.size)
+        group_exposure = np.full(keys.size, exposure.sum())
+
+    failure_count = np.bincount(failure_group, minlength=keys.size)
+    shape, scale = fit_weibull(x, failed, group, keys.size, weight, common)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mtbf = group_exposure / failure_count
+        b10 = scale * (-np.log(0.9)) ** (1 / shape)
+        curve = np.linspace(0, exposure.max() if exposure.size else 0, CURVE_POINTS + 1)[1:]
+        # Интенсивность отказов h(t) = k/l * (t/l)^(k-1), на 1000 м/ч
+        rate = 1000 * shape[:, None] / scale[:, None] * (curve[None, :] / scale[:, None]) ** (shape[:, None] - 1)
+
+    names = dict(reference_model.objects.filter(pk__in=keys.tolist()).values_list('pk', 'name'))
+    results = [
+        {
+            'key': int(key),
+            'name': names.get(int(key)),
+            'machines': int(machine_count[index]),
+            'failures': int(failure_count[index]),
+            'exposure_hours': int(group_exposure[index]),
+            'mtbf_hours': finite(mtbf[index]),
+            'weibull_shape': finite(shape[index], 3),
+            'weibull_scale': finite(scale[index]),
+            'b10_hours': finite(b10[index]),
+            'failure_rate': [finite(value, 4) for value in rate[index]],
+        }
+        for index, key in enumerate(keys)
+    ]
+    results.sort(key=lambda row: (-row['failures'], row['name'] or ''))
+    return {
+        'by': by,
+        'machines': int(machine_ids.size),
+        'failures': int(failures.shape[0]),
+        'curve_hours': [int(point) for point in curve],
+        'results': results,
+    }
+
+
+def finite(value, digits=1):
+    return round(float(value), digits) if np.isfinite(value) else None
+
+
+def reliability_report(by, user=None):
+    """
+    Отчёт из кеша по версии данных. user - считать по его машинам, без
+    него и для менеджера - по всему парку.
+    """
+    if user is None or user.role == 'manager':
+        scope, machines = 'all', Machine.objects.all()
+    else:
+        scope, machines = f'user{user.pk}', user.get_accessible_machines()
+    key = f'reliability:{by}:{scope}:{data_version(by)}'
+    report = cache.get(key)
+    if report is None:
+        report = compute_report(by, machines)
+        cache.set(key, report, CACHE_TIMEOUT)
+    return report
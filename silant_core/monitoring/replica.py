@@ -0,0 +1,214 @@
+"""
+Чтение с реплики БД.
+
+Списки, карточки, поиск, выгрузки, аналитика и списки API (view с
+отметкой replica_reads) на GET читают модели monitoring с алиаса
+REPLICA_DB, если он есть в DATABASES и подключён ReplicaRouter. Запись
+всегда идёт в основную БД, и после первой записи в модели monitoring запрос
+дочитывает данные оттуда же. Тело потоковых ответов (выгрузки, NDJSON)
+читается с тем же состоянием запроса.
+
+Реплика - копия файла SQLite, которую обновляет команда refresh_replica:
+онлайн-бэкапом поверх реплики (backup) или копией через VACUUM INTO с
+подменой файла (copy). Время снимка лежит в кеше; реплика старше
+REPLICA_MAX_LAG секунд или старше последней записи пользователя не
+используется - запрос читает основную БД.
+"""
+import os
+import sqlite3
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB = 'replica'
+SYNCED_KEY = 'replica:synced_at'
+WROTE_KEY = 'replica:wrote:{}'
+REFRESH_MODES = ('backup', 'copy')
+
+_current = ContextVar('replica_request', default=None)
+
+
+def replica_reads(view):
+    """Отметка view (класса или функции), чьи GET-запросы можно читать с реплики"""
+    view.replica_reads = True
+    return view
+
+
+def max_lag():
+    return getattr(settings, 'REPLICA_MAX_LAG', 120)
+
+
+def replica_fresh_for(user):
+    """Реплика не старше REPLICA_MAX_LAG и снята после последней записи пользователя"""
+    synced = cache.get(SYNCED_KEY)
+    if synced is None or time.time() - synced > max_lag():
+        return False
+    if user is not None and user.is_authenticated:
+        wrote = cache.get(WROTE_KEY.format(user.pk))
+        if wrote is not None and wrote >= synced:
+            return False
+    return True
+
+
+class ReplicaRequest:
+    """Состояние запроса для роутера: можно ли читать реплику и была ли запись"""
+
+    def __init__(self, request):
+        self.request = request
+        self.eligible = False
+        self.written = False
+        self.fresh = None
+
+    def use_replica(self):
+        if not self.eligible or self.written or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return False
+        if self.fresh is None:
+            # Пользователь DRF известен только внутри view - проверка при первом чтении
+            self.fresh = replica_fresh_for(getattr(self.request, 'user', None))
+        return self.fresh
+
+    def stream(self, content):
+        """
+        Тело потокового ответа читается уже после выхода из middleware: каждый
+        следующий кусок берётся с состоянием запроса, чтобы его запросы тоже шли на реплику
+        """
+        iterator = iter(content)
+        while True:
+            token = _current.set(self)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield chunk
+
+    async def astream(self, content):
+        iterator = aiter(content)
+        while True:
+            token = _current.set(self)
+            try:
+                chunk = await anext(iterator)
+            except StopAsyncIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield chunk
+
+    def wrap(self, response):
+        if self.eligible and response.streaming:
+            content = response.streaming_content
+            response.streaming_content = self.astream(content) if response.is_async else self.stream(content)
+        return response
+
+    def finish(self):
+        """После запроса с записью реплика для пользователя устарела до следующего снимка"""
+        user = getattr(self.request, 'user', None)
+        if self.written and user is not None and user.is_authenticated:
+            cache.set(WROTE_KEY.format(user.pk), time.time(), max_lag())
+
+
+class ReplicaRouter:
+    """Чтение моделей monitoring (кроме пользователей) - с реплики, если запрос это допускает"""
+
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if (
+            state is not None
+            and model._meta.app_label == 'monitoring'
+            and model._meta.model_name != 'user'
+            and state.use_replica()
+        ):
+            return REPLICA_DB
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Сессии, токены и last_login пользователя данных monitoring не меняют
+        state = _current.get()
+        if state is not None and model._meta.app_label == 'monitoring' and model._meta.model_name != 'user':
+            state.written = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия основной БД, связи между ними допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return False if db == REPLICA_DB else None
+
+
+class ReplicaMiddleware:
+    """Состояние ReplicaRequest на время запроса; ставить после AuthenticationMiddleware"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = ReplicaRequest(request)
+        token = _current.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        state.finish()
+        return state.wrap(response)
+
+    async def __acall__(self, request):
+        state = ReplicaRequest(request)
+        token = _current.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        if state.written:
+            await sync_to_async(state.finish)()
+        return state.wrap(response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _current.get()
+        if state is not None:
+            # Класс view Django - view_class, вьюсета DRF - cls; у функций отметка на самой функции
+            view = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', view_func)
+            state.eligible = request.method in ('GET', 'HEAD') and getattr(view, 'replica_reads', False)
+
+
+def refresh_replica(mode='backup'):
+    """
+    Снять реплику с основной БД. backup - онлайн-бэкап поверх файла реплики:
+    реплика остаётся в WAL, читатели видят старый снимок до конца записи.
+    copy - VACUUM INTO во временный файл и подмена файла реплики: новые
+    соединения открывают новый файл (у реплики CONN_MAX_AGE = 0).
+    """
+    if mode not in REFRESH_MODES:
+        raise ValueError(mode)
+    target = str(settings.DATABASES[REPLICA_DB]['NAME'])
+    primary = connections[DEFAULT_DB_ALIAS]
+    started = time.time()
+    primary.ensure_connection()
+    if mode == 'backup':
+        destination = sqlite3.connect(target)
+        try:
+            primary.connection.backup(destination)
+        finally:
+            destination.close()
+    else:
+        if os.path.exists(f'{target}-wal'):
+            raise ValueError(f'{target} в режиме WAL: обновляйте её в режиме backup')
+        temporary = f'{target}.tmp'
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        with primary.cursor() as cursor:
+            cursor.execute('VACUUM INTO %s', [temporary])
+        os.replace(temporary, target)
+    cache.set(SYNCED_KEY, started, None)
+    return time.time() - started
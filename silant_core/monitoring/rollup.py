@@ -0,0 +1,190 @@
+"""
+Свёртка рекламаций для аналитики простоев.
+
+Строка ReclamationRollup - рекламации одной группы (узел отказа, способ
+восстановления, модель техники, сервисная компания, месяц): число, простой
+всего, средний и 95-й перцентиль, средняя наработка. Перцентиль не
+складывается из частей, поэтому свёртка пересчитывается не по разнице, а
+целиком для затронутой области (модель техники, месяц): при сохранении и
+удалении рекламации, смене модели машины и импорте. Область - пара строк
+индекса, так что пересчёт читает только её рекламации.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+
+import pandas as pd
+from django.db import transaction
+from django.db.models import F, FloatField, Max, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import Reclamation, ReclamationRollup
+
+BATCH_SIZE = 1000
+
+GROUP_FIELDS = ['failure_node_id', 'recovery_method_id', 'machine_model_id', 'service_company_id', 'month']
+
+# Разрез отчёта -> (поле свёртки, поле с названием)
+DIMENSIONS = {
+    'failure_node': ('failure_node', 'failure_node__name'),
+    'recovery_method': ('recovery_method', 'recovery_method__name'),
+    'machine_model': ('machine_model', 'machine_model__name'),
+    'service_company': ('service_company', 'service_company__username'),
+    'month': ('month', None),
+}
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def rollup_rows(reclamations):
+    """Строки свёртки для рекламаций; группировка и перцентили - в pandas"""
+    frame = pd.DataFrame.from_records(
+        reclamations.values_list(
+            'failure_node_id', 'recovery_method_id', 'machine__machine_model_id', 'service_company_id',
+            'failure_date', 'recovery_date', 'operating_hours',
+        ).iterator(chunk_size=BATCH_SIZE),
+        columns=[*GROUP_FIELDS[:4], 'failure_date', 'recovery_date', 'operating_hours'],
+    )
+    if frame.empty:
+        return []
+    failure = pd.to_datetime(frame.pop('failure_date'))
+    frame['downtime'] = (pd.to_datetime(frame.pop('recovery_date')) - failure).dt.days
+    frame['month'] = failure.dt.to_period('M').dt.start_time.dt.date
+    # groupby отбрасывает NaN в ключах, а пустая сервисная компания - тоже группа
+    frame['service_company_id'] = frame['service_company_id'].astype('Int64').fillna(0).astype('int64')
+
+    groups = frame.groupby(GROUP_FIELDS, sort=False)
+    stats = groups.agg(
+        reclamation_count=('downtime', 'size'),
+        total_downtime=('downtime', 'sum'),
+        mean_downtime=('downtime', 'mean'),
+        mean_operating_hours=('operating_hours', 'mean'),
+    )
+    stats['p95_downtime'] = groups['downtime'].quantile(0.95)
+
+    # Числа numpy драйвер БД не принимает - приводим к int/float
+    return [
+        ReclamationRollup(
+            failure_node_id=int(failure_node_id),
+            recovery_method_id=int(recovery_method_id),
+            machine_model_id=int(machine_model_id),
+            service_company_id=int(service_company_id) or None,
+            month=month,
+            reclamation_count=int(row.reclamation_count),
+            total_downtime=int(row.total_downtime),
+            mean_downtime=float(row.mean_downtime),
+            p95_downtime=float(row.p95_downtime),
+            mean_operating_hours=float(row.mean_operating_hours),
+        )
+        for (failure_node_id, recovery_method_id, machine_model_id, service_company_id, month), row
+        in zip(stats.index, stats.itertuples(index=False))
+    ]
+
+
+def refresh_rollup(scopes):
+    """Пересчитать свёртку для областей (модель техники, месяц)"""
+    months_by_model = defaultdict(set)
+    for machine_model_id, month in scopes:
+        if machine_model_id is not None and month is not None:
+            months_by_model[machine_model_id].add(month_start(month))
+
+    with transaction.atomic():
+        for machine_model_id, months in months_by_model.items():
+            months = sorted(months)
+            for start in range(0, len(months), BATCH_SIZE):
+                batch = months[start:start + BATCH_SIZE]
+                ReclamationRollup.objects.filter(machine_model_id=machine_model_id, month__in=batch).delete()
+                periods = Q()
+                for month in batch:
+                    periods |= Q(failure_date__gte=month, failure_date__lt=next_month(month))
+                reclamations = Reclamation.objects.filter(periods, machine__machine_model_id=machine_model_id)
+                ReclamationRollup.objects.bulk_create(rollup_rows(reclamations), batch_size=BATCH_SIZE)
+
+
+def rebuild_rollup():
+    """Полностью пересобрать свёртку; возвращает число строк"""
+    with transaction.atomic():
+        ReclamationRollup.objects.all().delete()
+        ReclamationRollup.objects.bulk_create(rollup_rows(Reclamation.objects.all()), batch_size=BATCH_SIZE)
+        return ReclamationRollup.objects.count()
+
+
+def reclamation_scopes(reclamations):
+    """Области (модель техники, месяц), которых касаются рекламации"""
+    return set(
+        reclamations.order_by().annotate(month=TruncMonth('failure_date')).values_list(
+            'machine__machine_model_id', 'month'
+        ).distinct()
+    )
+
+
+def machine_scopes(machine_ids, machine_model_ids=None):
+    """
+    Области рекламаций машин. machine_model_ids - модели, в которых
+    рекламации машин надо пересчитать вместо текущих (смена модели машины).
+    """
+    scopes = reclamation_scopes(Reclamation.objects.filter(machine_id__in=machine_ids))
+    if machine_model_ids is None:
+        return scopes
+    return {(machine_model_id, month) for _, month in scopes for machine_model_id in machine_model_ids}
+
+
+def schedule_rollup_refresh(scopes):
+    """Пересчёт после фиксации текущей транзакции (или сразу в autocommit)"""
+    scopes = set(scopes)
+    if scopes:
+        transaction.on_commit(lambda: refresh_rollup(scopes))
+
+
+def parse_month(value):
+    """'2024-03' -> date(2024, 3, 1)"""
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+def filter_rollup(rollup, params):
+    """
+    Фильтры отчёта из параметров запроса: from/to - месяцы вида 2024-03,
+    failure_node, recovery_method, machine_model, service_company - id.
+    Некорректное значение - ValueError.
+    """
+    if params.get('from'):
+        rollup = rollup.filter(month__gte=parse_month(params['from']))
+    if params.get('to'):
+        rollup = rollup.filter(month__lte=parse_month(params['to']))
+    for name in ('failure_node', 'recovery_method', 'machine_model', 'service_company'):
+        if params.get(name):
+            rollup = rollup.filter(**{f'{name}_id': int(params[name])})
+    return rollup
+
+
+def downtime_report(rollup, by):
+    """
+    Свёртка, сгруппированная по одному разрезу. Число и простой складываются
+    точно, p95 по нескольким строкам свёртки не восстановить - в отчёте его
+    верхняя оценка, максимум p95 по строкам.
+    """
+    field, name_field = DIMENSIONS[by]
+    values = [field] + ([name_field] if name_field else [])
+    rows = rollup.order_by().values(*values).annotate(
+        reclamations=Sum('reclamation_count'),
+        downtime=Sum('total_downtime'),
+        hours=Sum(F('mean_operating_hours') * F('reclamation_count'), output_field=FloatField()),
+        p95_max=Max('p95_downtime'),
+    ).order_by('-downtime', field)
+    return [
+        {
+            'key': row[field],
+            'name': row[name_field] if name_field else row[field].strftime('%Y-%m'),
+            'reclamation_count': row['reclamations'],
+            'total_downtime': row['downtime'],
+            'mean_downtime': round(row['downtime'] / row['reclamations'], 2),
+            'p95_downtime_max': row['p95_max'],
+            'mean_operating_hours': round(row['hours'] / row['reclamations'], 1),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,204 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+from .models import (
+    DriveAxleModel, EngineModel, FailureNode, Machine, MachineModel, MaintenanceForecast, Reclamation,
+    ReclamationRollup, RecoveryMethod, Reference, ServiceOrganization, ServiceType, SteeringAxleModel,
+    TechnicalService, TransmissionModel
+)
+from .references import get_reference
+
+
+def requested_fields(request):
+    """Поля из ?fields=a,b,c; None - параметр не передан"""
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    value = request.query_params.get('fields')
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def queryset_columns(queryset, serializer, extra=()):
+    """
+    select_related и only() по источникам полей сериализатора: из БД читаются
+    только колонки, которые попадут в ответ, а связанные записи - тем же
+    запросом. Поля-свойства модели перечисляют нужные колонки в Meta.column_sources,
+    extra - колонки, нужные помимо ответа (например, ключ пагинации).
+    """
+    column_sources = getattr(serializer.Meta, 'column_sources', {})
+    sources = list(extra)
+    for name, field in serializer.fields.items():
+        if name in column_sources:
+            sources.extend(column_sources[name])
+        elif field.source != '*':
+            sources.append(field.source)
+
+    columns = set()
+    relations = set()
+    for source in sources:
+        attrs = source.split('.')
+        model = queryset.model
+        path = []
+        for attr in attrs:
+            try:
+                model_field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                break
+            path.append(attr)
+            columns.add('__'.join(path))
+            if not model_field.is_relation:
+                break
+            model = model_field.related_model
+        if len(path) > 1:
+            relations.add('__'.join(path[:-1]))
+    queryset = queryset.select_related(*relations) if relations else queryset
+    return queryset.only(*columns)
+
+
+class ReferenceNameField(serializers.Field):
+    """Название записи справочника по id связи - из кеша справочников, без JOIN"""
+
+    def __init__(self, model, **kwargs):
+        self.reference_model = model
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        obj = get_reference(self.reference_model, value)
+        return None if obj is None else obj.name
+
+
+class SparseFieldsMixin:
+    """Ограничение набора полей ответа параметром ?fields="""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'))
+        if fields is None:
+            return
+        unknown = fields - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError({'fields': f"Неизвестные поля: {', '.join(sorted(unknown))}"})
+        for name in set(self.fields) - fields:
+            self.fields.pop(name)
+
+
+class MachineSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    machine_model_name = ReferenceNameField(MachineModel, source='machine_model_id')
+    engine_model_name = ReferenceNameField(EngineModel, source='engine_model_id')
+    transmission_model_name = ReferenceNameField(TransmissionModel, source='transmission_model_id')
+    drive_axle_model_name = ReferenceNameField(DriveAxleModel, source='drive_axle_model_id')
+    steering_axle_model_name = ReferenceNameField(SteeringAxleModel, source='steering_axle_model_id')
+    client_name = serializers.CharField(source='client.username', read_only=True)
+    service_company_name = serializers.CharField(
+        source='service_company.username', read_only=True, allow_null=True
+    )
+
+    class Meta:
+        model = Machine
+        fields = [
+            'id', 'serial_number',
+            'machine_model', 'machine_model_name', 'engine_model', 'engine_model_name', 'engine_serial',
+            'transmission_model', 'transmission_model_name', 'transmission_serial',
+            'drive_axle_model', 'drive_axle_model_name', 'drive_axle_serial',
+            'steering_axle_model', 'steering_axle_model_name', 'steering_axle_serial',
+            'supply_contract', 'shipment_date', 'consignee', 'delivery_address', 'equipment',
+            'client', 'client_name', 'service_company', 'service_company_name', 'current_hours',
+            'updated_at',
+        ]
+
+
+class TechnicalServiceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    machine_serial_number = serializers.CharField(source='machine.serial_number', read_only=True)
+    service_type_name = ReferenceNameField(ServiceType, source='service_type_id')
+    service_organization_title = ReferenceNameField(ServiceOrganization, source='service_organization_id')
+    service_company_name = serializers.CharField(
+        source='service_company.username', read_only=True, allow_null=True
+    )
+
+    class Meta:
+        model = TechnicalService
+        fields = [
+            'id', 'machine', 'machine_serial_number', 'service_type', 'service_type_name',
+            'service_date', 'operating_hours', 'work_order_number', 'work_order_date',
+            'service_organization', 'service_organization_title', 'service_organization_name',
+            'service_company', 'service_company_name', 'updated_at',
+        ]
+
+
+class ReclamationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    machine_serial_number = serializers.CharField(source='machine.serial_number', read_only=True)
+    failure_node_name = ReferenceNameField(FailureNode, source='failure_node_id')
+    recovery_method_name = ReferenceNameField(RecoveryMethod, source='recovery_method_id')
+    service_company_name = serializers.CharField(
+        source='service_company.username', read_only=True, allow_null=True
+    )
+    downtime = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Reclamation
+        fields = [
+            'id', 'machine', 'machine_serial_number', 'failure_date', 'operating_hours',
+            'failure_node', 'failure_node_name', 'failure_description',
+            'recovery_method', 'recovery_method_name', 'spare_parts_used', 'recovery_date',
+            'downtime', 'service_company', 'service_company_name', 'updated_at',
+        ]
+        column_sources = {'downtime': ['failure_date', 'recovery_date']}
+
+
+class ReclamationRollupSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    failure_node_name = ReferenceNameField(FailureNode, source='failure_node_id')
+    recovery_method_name = ReferenceNameField(RecoveryMethod, source='recovery_method_id')
+    machine_model_name = ReferenceNameField(MachineModel, source='machine_model_id')
+    service_company_name = serializers.CharField(
+        source='service_company.username', read_only=True, allow_null=True
+    )
+
+    class Meta:
+        model = ReclamationRollup
+        fields = [
+            'id', 'month', 'failure_node', 'failure_node_name', 'recovery_method', 'recovery_method_name',
+            'machine_model', 'machine_model_name', 'service_company', 'service_company_name',
+            'reclamation_count', 'total_downtime', 'mean_downtime', 'p95_downtime', 'mean_operating_hours',
+        ]
+
+
+class MaintenanceForecastSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    machine_serial_number = serializers.CharField(source='machine.serial_number', read_only=True)
+    service_type_name = ReferenceNameField(ServiceType, source='service_type_id')
+
+    class Meta:
+        model = MaintenanceForecast
+        fields = [
+            'id', 'machine', 'machine_serial_number', 'service_type', 'service_type_name',
+            'hours_per_day', 'last_service_date', 'last_service_hours', 'interval_hours',
+            'next_service_hours', 'due_date',
+        ]
+
+
+def reference_serializer(reference_model):
+    class Meta:
+        model = reference_model
+        fields = '__all__'
+
+    return type(
+        f'{reference_model.__name__}Serializer',
+        (SparseFieldsMixin, serializers.ModelSerializer),
+        {'Meta': Meta},
+    )
+
+
+# Справочники API: (префикс URL, модель)
+REFERENCE_MODELS = (
+    ('machine-models', MachineModel),
+    ('engine-models', EngineModel),
+    ('transmission-models', TransmissionModel),
+    ('drive-axle-models', DriveAxleModel),
+    ('steering-axle-models', SteeringAxleModel),
+    ('service-types', ServiceType),
+    ('service-organizations', ServiceOrganization),
+    ('failure-nodes', FailureNode),
+    ('recovery-methods', RecoveryMethod),
+    ('references', Reference),
+)
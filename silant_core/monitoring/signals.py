@@ -0,0 +1,150 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_token, forget_user
+from .forecast import schedule_forecast_refresh
+from .models import (
+    Component, DriveAxleModel, EngineModel, Machine, MachineModel, MachineSummary,
+    Maintenance, Reclamation, SteeringAxleModel, TechnicalService, TransmissionModel, User
+)
+from .references import CACHED_REFERENCES, schedule_version_bump
+from .rollup import machine_scopes, month_start, reclamation_scopes, schedule_rollup_refresh
+from .summary import schedule_refresh
+
+# Записи, по которым витрина считает статус, наработку и счётчики
+MACHINE_CHILDREN = (Component, Maintenance, TechnicalService, Reclamation)
+
+# Справочник -> поле с его названием в витрине
+REFERENCE_NAME_FIELDS = {
+    MachineModel: 'machine_model',
+    EngineModel: 'engine_model',
+    TransmissionModel: 'transmission_model',
+    DriveAxleModel: 'drive_axle_model',
+    SteeringAxleModel: 'steering_axle_model',
+}
+
+
+# ======================== ВИТРИНА МАШИН ========================
+@receiver(post_save, sender=Machine)
+def machine_saved(sender, instance, **kwargs):
+    schedule_refresh(instance.pk)
+
+
+def remember_previous_machine(sender, instance, **kwargs):
+    """Запись могли перенести на другую машину - пересчитать нужно обе"""
+    instance._previous_machine_id = None
+    if instance.pk:
+        instance._previous_machine_id = sender.objects.filter(pk=instance.pk).values_list(
+            'machine_id', flat=True
+        ).first()
+
+
+def machine_child_changed(sender, instance, **kwargs):
+    schedule_refresh(instance.machine_id, getattr(instance, '_previous_machine_id', None))
+
+
+for child in MACHINE_CHILDREN:
+    pre_save.connect(remember_previous_machine, sender=child, dispatch_uid=f'summary_pre_{child.__name__}')
+    post_save.connect(machine_child_changed, sender=child, dispatch_uid=f'summary_save_{child.__name__}')
+    post_delete.connect(machine_child_changed, sender=child, dispatch_uid=f'summary_delete_{child.__name__}')
+
+
+def reference_renamed(sender, instance, created, **kwargs):
+    if created:
+        return
+    field = REFERENCE_NAME_FIELDS[sender]
+    MachineSummary.objects.filter(**{f'machine__{field}': instance}).update(**{f'{field}_name': instance.name})
+
+
+for reference in REFERENCE_NAME_FIELDS:
+    post_save.connect(reference_renamed, sender=reference, dispatch_uid=f'summary_ref_{reference.__name__}')
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Вход в систему обновляет только last_login
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    name = instance.get_full_name() or instance.username
+    MachineSummary.objects.filter(client=instance).update(client_name=name)
+    MachineSummary.objects.filter(service_company=instance).update(service_company_name=name)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    schedule_refresh(*instance.serviced_machines.values_list('pk', flat=True))
+
+
+# ======================== СВЁРТКА РЕКЛАМАЦИЙ ========================
+@receiver(pre_save, sender=Reclamation)
+def remember_rollup_scope(sender, instance, **kwargs):
+    """Рекламацию могли перенести на другой месяц или машину - пересчитать нужно и старую область"""
+    instance._previous_rollup_scopes = set()
+    if instance.pk:
+        instance._previous_rollup_scopes = reclamation_scopes(Reclamation.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Reclamation)
+@receiver(post_delete, sender=Reclamation)
+def reclamation_changed(sender, instance, **kwargs):
+    scope = (instance.machine.machine_model_id, month_start(instance.failure_date))
+    schedule_rollup_refresh({scope, *getattr(instance, '_previous_rollup_scopes', ())})
+
+
+@receiver(pre_save, sender=Machine)
+def remember_machine_model(sender, instance, **kwargs):
+    instance._previous_machine_model_id = None
+    if instance.pk:
+        instance._previous_machine_model_id = Machine.objects.filter(pk=instance.pk).values_list(
+            'machine_model_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Machine)
+def machine_model_changed(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_machine_model_id', None)
+    if previous is not None and previous != instance.machine_model_id:
+        schedule_rollup_refresh(machine_scopes([instance.pk], [previous, instance.machine_model_id]))
+
+
+@receiver(pre_delete, sender=User)
+def service_company_deleted(sender, instance, **kwargs):
+    # Рекламации останутся без сервисной компании, а её строки свёртки удалятся каскадом
+    schedule_rollup_refresh(reclamation_scopes(Reclamation.objects.filter(service_company=instance)))
+
+
+# ======================== ПРОГНОЗ ТО ========================
+@receiver(post_save, sender=Machine)
+def machine_forecast_changed(sender, instance, **kwargs):
+    # Отгрузка и владельцы машины входят в прогноз
+    schedule_forecast_refresh(instance.pk)
+
+
+@receiver(post_save, sender=TechnicalService)
+@receiver(post_delete, sender=TechnicalService)
+def technical_service_forecast_changed(sender, instance, **kwargs):
+    # Прежнюю машину перенесённого ТО запоминает remember_previous_machine
+    schedule_forecast_refresh(instance.machine_id, getattr(instance, '_previous_machine_id', None))
+
+
+# ======================== КЕШ СПРАВОЧНИКОВ ========================
+def reference_changed(sender, **kwargs):
+    schedule_version_bump()
+
+
+for reference in CACHED_REFERENCES:
+    post_save.connect(reference_changed, sender=reference, dispatch_uid=f'references_save_{reference.__name__}')
+    post_delete.connect(reference_changed, sender=reference, dispatch_uid=f'references_delete_{reference.__name__}')
+
+
+# ======================== КЕШ ВХОДА ========================
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def forget_cached_token(sender, instance, **kwargs):
+    forget_token(instance.key)
@@ -0,0 +1,125 @@
+from django.db import transaction
+from django.db.models import Case, Count, Exists, F, IntegerField, Max, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Least
+
+from .models import Component, Machine, MachineSummary, Maintenance, Reclamation, TechnicalService
+
+BATCH_SIZE = 1000
+
+SUMMARY_FIELDS = [
+    'serial_number', 'shipment_date', 'current_hours',
+    'machine_model_name', 'engine_model_name', 'transmission_model_name',
+    'drive_axle_model_name', 'steering_axle_model_name',
+    'engine_serial', 'transmission_serial', 'drive_axle_serial', 'steering_axle_serial',
+    'client', 'client_name', 'service_company', 'service_company_name',
+    'in_service', 'max_wear', 'last_service_date', 'reclamation_count',
+]
+
+
+def _per_machine(queryset, aggregate):
+    """Скалярный подзапрос с агрегатом по строкам одной машины"""
+    return Subquery(
+        queryset.filter(machine=OuterRef('pk')).order_by().values('machine').annotate(
+            value=aggregate
+        ).values('value')
+    )
+
+
+def _display_name(first_name, last_name, username):
+    """То же, что get_full_name|default:username в шаблонах"""
+    return f"{first_name or ''} {last_name or ''}".strip() or username or ''
+
+
+def summary_rows(machines):
+    """Строки витрины для набора машин, одним запросом"""
+    wear = Case(
+        When(lifetime_hours=0, then=Value(0)),
+        default=Least(Value(100), F('current_hours') * 100 / F('lifetime_hours')),
+        output_field=IntegerField(),
+    )
+    rows = machines.order_by().annotate(
+        in_service_flag=Exists(Maintenance.objects.filter(machine=OuterRef('pk'), end_date__isnull=True)),
+        max_wear_value=Coalesce(_per_machine(Component.objects, Max(wear)), 0),
+        last_service=_per_machine(TechnicalService.objects, Max('service_date')),
+        reclamation_total=Coalesce(_per_machine(Reclamation.objects, Count('pk')), 0),
+    ).values(
+        'pk', 'serial_number', 'shipment_date', 'current_hours',
+        'machine_model__name', 'engine_model__name', 'transmission_model__name',
+        'drive_axle_model__name', 'steering_axle_model__name',
+        'engine_serial', 'transmission_serial', 'drive_axle_serial', 'steering_axle_serial',
+        'client_id', 'client__first_name', 'client__last_name', 'client__username',
+        'service_company_id', 'service_company__first_name', 'service_company__last_name',
+        'service_company__username',
+        'in_service_flag', 'max_wear_value', 'last_service', 'reclamation_total',
+    )
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        yield MachineSummary(
+            machine_id=row['pk'],
+            serial_number=row['serial_number'],
+            shipment_date=row['shipment_date'],
+            current_hours=row['current_hours'],
+            machine_model_name=row['machine_model__name'],
+            engine_model_name=row['engine_model__name'],
+            transmission_model_name=row['transmission_model__name'],
+            drive_axle_model_name=row['drive_axle_model__name'],
+            steering_axle_model_name=row['steering_axle_model__name'],
+            engine_serial=row['engine_serial'],
+            transmission_serial=row['transmission_serial'],
+            drive_axle_serial=row['drive_axle_serial'],
+            steering_axle_serial=row['steering_axle_serial'],
+            client_id=row['client_id'],
+            client_name=_display_name(
+                row['client__first_name'], row['client__last_name'], row['client__username']
+            ),
+            service_company_id=row['service_company_id'],
+            service_company_name=_display_name(
+                row['service_company__first_name'], row['service_company__last_name'],
+                row['service_company__username']
+            ) if row['service_company_id'] else '',
+            in_service=row['in_service_flag'],
+            max_wear=row['max_wear_value'],
+            last_service_date=row['last_service'],
+            reclamation_count=row['reclamation_total'],
+        )
+
+
+def _upsert(summaries):
+    batch = []
+    for summary in summaries:
+        batch.append(summary)
+        if len(batch) >= BATCH_SIZE:
+            _write_batch(batch)
+            batch = []
+    if batch:
+        _write_batch(batch)
+
+
+def _write_batch(batch):
+    MachineSummary.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=['machine'],
+        update_fields=SUMMARY_FIELDS,
+    )
+
+
+def refresh_machine_summaries(machine_ids):
+    """Пересчитать витрину для указанных машин"""
+    machine_ids = sorted({pk for pk in machine_ids if pk is not None})
+    with transaction.atomic():
+        for start in range(0, len(machine_ids), BATCH_SIZE):
+            batch = machine_ids[start:start + BATCH_SIZE]
+            _upsert(summary_rows(Machine.objects.filter(pk__in=batch)))
+
+
+def rebuild_machine_summaries():
+    """Полностью пересобрать витрину; возвращает число машин"""
+    with transaction.atomic():
+        MachineSummary.objects.all().delete()
+        _upsert(summary_rows(Machine.objects.all()))
+        return MachineSummary.objects.count()
+
+
+def schedule_refresh(*machine_ids):
+    """Пересчёт после фиксации текущей транзакции (или сразу в autocommit)"""
+    transaction.on_commit(lambda: refresh_machine_summaries(machine_ids))
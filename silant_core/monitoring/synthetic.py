@@ -0,0 +1,343 @@
+"""
+Синтетический парк для нагрузочных экспериментов.
+
+Машины, их комплектующие, ТО, рекламации и ремонты генерируются массивами
+NumPy пакетами по CHUNK_MACHINES машин и пишутся bulk_create. Генератор
+каждого пакета засевается парой (seed, номер первой машины пакета), так
+что один и тот же seed даёт тот же парк при любом --batch-size.
+
+Распределения:
+- модели техники и узлов - по убывающим весам, у модели техники свой
+  типовой двигатель, трансмиссия и мосты (15% машин - с другими);
+- машин у клиента - по закону Ципфа: несколько крупных парков и много
+  мелких, у клиента основная сервисная компания (90% его машин), 10%
+  машин обслуживаются своими силами;
+- отгрузок с годами больше, темп работы - логнормальный около 6 м/ч в сутки;
+- ТО по регламенту: ТО-0 на 50 м/ч, дальше каждые 200 м/ч, вид - по
+  наибольшей кратности (ТО-4 - 2000, ТО-3 - 1000, ТО-2 - 400, ТО-1 - 200),
+  3% пропущены;
+- отказы - пуассоновский поток с наработкой на отказ своей у модели
+  техники, простой - логнормальный с медианой 3 дня; незавершённый
+  ремонт - открытая запись Maintenance.
+"""
+from datetime import date, datetime, time, timezone
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .models import (
+    Component, DriveAxleModel, EngineModel, FailureNode, Machine, MachineModel, Maintenance, Reclamation,
+    RecoveryMethod, ServiceOrganization, ServiceType, SteeringAxleModel, TechnicalService, TransmissionModel,
+    User
+)
+from .forecast import rebuild_forecasts
+from .references import bump_version
+from .rollup import rebuild_rollup
+from .summary import rebuild_machine_summaries
+
+CHUNK_MACHINES = 1000
+HISTORY_YEARS = 8
+
+MACHINE_MODELS = ['ПД1,5', 'ПД2,0', 'ПД3,0', 'ПГ1,5', 'ПГ2,5', 'ПД5,0', 'ПЭ1,6', 'ПГ3,0']
+ENGINE_MODELS = ['Kubota D1803', 'ММЗ Д-245.5', 'Kubota V2403', 'Nissan K25', 'ММЗ Д-243', 'Yanmar 4TNE98']
+TRANSMISSION_MODELS = ['10VB-00106', 'HF50-VP010', 'HF40-PT030', '15VB-00205']
+DRIVE_AXLE_MODELS = ['20VB-00101', 'HA50-VP010', 'HL15-PT020', '25VB-00102']
+STEERING_AXLE_MODELS = ['VS20-00001', 'VS30-00001', 'ST15-00010']
+# (название, периодичность м/ч) - вид ТО выбирается по наибольшей кратности
+SERVICE_TYPES = [
+    ('ТО-0 (50 м/час)', 50), ('ТО-1 (200 м/час)', 200), ('ТО-2 (400 м/час)', 400),
+    ('ТО-3 (1000 м/час)', 1000), ('ТО-4 (2000 м/час)', 2000),
+]
+FAILURE_NODES = [
+    ('Двигатель', 0.24), ('Гидросистема', 0.22), ('Трансмиссия', 0.16), ('Электрооборудование', 0.15),
+    ('Ведущий мост', 0.1), ('Управляемый мост', 0.08), ('Рама и кабина', 0.05),
+]
+RECOVERY_METHODS = [
+    ('Ремонт узла', 0.45), ('Замена узла', 0.3), ('Регулировка', 0.15), ('Замена расходных материалов', 0.1),
+]
+# (название, префикс каталожного номера, ресурс м/ч)
+COMPONENTS = [
+    ('Гидронасос', 'HP', 6000), ('Стартер', 'ST', 4000), ('Генератор', 'GN', 5000),
+    ('Аккумулятор', 'AK', 3000), ('Шины', 'TR', 2500), ('Вилы', 'FK', 8000),
+]
+EQUIPMENT = ['Стандарт', 'Кабина с отоплением', 'Боковое смещение каретки', 'Позиционер вил', 'Светодиодные фары']
+CITIES = ['Москва', 'Санкт-Петербург', 'Екатеринбург', 'Новосибирск', 'Казань', 'Челябинск', 'Самара', 'Омск']
+SELF_SERVICE = 'Собственными силами'
+
+MEAN_HOURS_PER_DAY = 6
+MTBF_HOURS = 3000
+MEDIAN_DOWNTIME_DAYS = 3
+
+
+def falling_weights(count, power=1.0):
+    """Веса 1 / ранг^power, нормированные к единице"""
+    weights = 1 / np.arange(1, count + 1) ** power
+    return weights / weights.sum()
+
+
+def ensure_references(model, names):
+    """id записей справочника по названиям, недостающие создаются"""
+    existing = dict(model.objects.filter(name__in=names).values_list('name', 'pk'))
+    missing = [model(name=name) for name in names if name not in existing]
+    if missing:
+        model.objects.bulk_create(missing)
+        existing = dict(model.objects.filter(name__in=names).values_list('name', 'pk'))
+    return np.array([existing[name] for name in names], dtype=np.int64)
+
+
+def group_positions(counts):
+    """Номер строки внутри своей группы для групп длины counts"""
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.arange(counts.sum()) - starts
+
+
+def distinct_days(group, days):
+    """
+    Сдвинуть дни вперёд так, чтобы внутри группы они строго росли
+    (уникальность даты ТО и рекламации у машины); строки отсортированы по группе
+    """
+    if not days.size:
+        return days
+    counts = np.bincount(group)
+    position = group_positions(counts[counts > 0])
+    span = days.max() - days.min() + position.max() + 1
+    shifted = days - position + (group - group.min()) * span
+    return np.maximum.accumulate(shifted) - (group - group.min()) * span + position
+
+
+class FleetGenerator:
+    def __init__(self, seed=0, prefix='SYN', clients=None, service_companies=None, password=None,
+                 batch_size=5000, today=None):
+        self.seed = seed
+        self.prefix = prefix
+        self.clients = clients
+        self.service_companies = service_companies
+        self.password = make_password(password)
+        self.batch_size = batch_size
+        self.today = (today or date.today()).toordinal()
+        self.counts = dict.fromkeys(['machines', 'components', 'services', 'reclamations', 'maintenance'], 0)
+
+    def prepare(self, machines):
+        """Справочники, клиенты и сервисные компании под парк из machines машин"""
+        rng = np.random.default_rng([self.seed, 0])
+        self.machine_models = ensure_references(MachineModel, MACHINE_MODELS)
+        self.parts = [
+            ensure_references(model, names) for model, names in (
+                (EngineModel, ENGINE_MODELS), (TransmissionModel, TRANSMISSION_MODELS),
+                (DriveAxleModel, DRIVE_AXLE_MODELS), (SteeringAxleModel, STEERING_AXLE_MODELS),
+            )
+        ]
+        self.service_types = ensure_references(ServiceType, [name for name, _ in SERVICE_TYPES])
+        self.failure_nodes = ensure_references(FailureNode, [name for name, _ in FAILURE_NODES])
+        self.recovery_methods = ensure_references(RecoveryMethod, [name for name, _ in RECOVERY_METHODS])
+        # Наработка на отказ своя у каждой модели техники
+        self.model_mtbf = MTBF_HOURS * rng.lognormal(0, 0.3, len(MACHINE_MODELS))
+
+        client_count = self.clients or max(1, machines // 40)
+        company_count = self.service_companies or max(1, machines // 400)
+        tag = self.prefix.lower()
+        companies = self.create_users([
+            User(username=f'{tag}-service-{index:04}', role='service', password=self.password,
+                 company=f'ООО "Сервис-{self.prefix}-{index:04}"', first_name=f'Сервис-{self.prefix}-{index:04}')
+            for index in range(company_count)
+        ])
+        clients = self.create_users([
+            User(username=f'{tag}-client-{index:05}', role='client', password=self.password,
+                 first_name=f'ООО "Клиент-{self.prefix}-{index:05}"')
+            for index in range(client_count)
+        ])
+        ServiceOrganization.objects.bulk_create([
+            ServiceOrganization(name=company.company, address=CITIES[index % len(CITIES)],
+                                contact_person=company.first_name, contact_phone=f'+7 900 {index:07}')
+            for index, company in enumerate(companies)
+        ], ignore_conflicts=True)
+        organizations = dict(ServiceOrganization.objects.filter(
+            name__in=[company.company for company in companies]
+        ).values_list('name', 'pk'))
+
+        self.client_ids = np.array([user.pk for user in clients], dtype=np.int64)
+        self.client_names = [user.first_name for user in clients]
+        self.client_weights = falling_weights(client_count, 1.1)
+        self.company_ids = np.array([user.pk for user in companies], dtype=np.int64)
+        self.organization_ids = np.array([organizations[user.company] for user in companies], dtype=np.int64)
+        # Основная сервисная компания клиента
+        self.client_company = rng.integers(0, company_count, client_count)
+        bump_version()
+
+    def create_users(self, users):
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        return list(User.objects.filter(username__in=[user.username for user in users]).order_by('username'))
+
+    def generate(self, machines, progress=None):
+        self.prepare(machines)
+        for start in range(0, machines, CHUNK_MACHINES):
+            with transaction.atomic():
+                self.generate_chunk(start, min(CHUNK_MACHINES, machines - start))
+            if progress:
+                progress(min(start + CHUNK_MACHINES, machines), machines)
+        # bulk_create не шлёт сигналы - производные таблицы пересобираются целиком
+        rebuild_machine_summaries()
+        rebuild_rollup()
+        rebuild_forecasts()
+        return self.counts
+
+    def generate_chunk(self, start, count):
+        rng = np.random.default_rng([self.seed, start + 1])
+        today = self.today
+
+        # ---------------- машины ----------------
+        model = rng.choice(len(self.machine_models), count, p=falling_weights(len(self.machine_models)))
+        parts = []
+        for options in self.parts:
+            typical = model % len(options)
+            other = rng.integers(0, len(options), count)
+            parts.append(options[np.where(rng.random(count) < 0.85, typical, other)])
+        client = rng.choice(len(self.client_ids), count, p=self.client_weights)
+        own_company = rng.random(count) < 0.9
+        company = np.where(own_company, self.client_company[client], rng.integers(0, len(self.company_ids), count))
+        serviced = rng.random(count) < 0.9
+        # Отгрузок с годами больше: возраст машины смещён к молодым
+        age = (HISTORY_YEARS * 365 * (1 - np.sqrt(rng.random(count)))).astype(np.int64) + 1
+        shipped = today - age
+        rate = np.clip(rng.lognormal(np.log(MEAN_HOURS_PER_DAY), 0.5, count), 0.5, 20)
+        hours = (rate * age).astype(np.int64)
+
+        machine_objects = []
+        for index in range(count):
+            number = start + index
+            shipment = date.fromordinal(int(shipped[index]))
+            client_index = int(client[index])
+            options = [EQUIPMENT[0], *(
+                option for option, pick in zip(EQUIPMENT[1:], rng.random(len(EQUIPMENT) - 1)) if pick < 0.3
+            )]
+            machine_objects.append(Machine(
+                serial_number=f'{self.prefix}{number:07}',
+                machine_model_id=int(self.machine_models[model[index]]),
+                engine_model_id=int(parts[0][index]),
+                transmission_model_id=int(parts[1][index]),
+                drive_axle_model_id=int(parts[2][index]),
+                steering_axle_model_id=int(parts[3][index]),
+                engine_serial=f'{self.prefix}E{number:07}',
+                transmission_serial=f'{self.prefix}T{number:07}',
+                drive_axle_serial=f'{self.prefix}D{number:07}',
+                steering_axle_serial=f'{self.prefix}S{number:07}',
+                supply_contract=f'№{client_index:05}/{shipment.year} от {shipment:%d.%m.%Y}',
+                shipment_date=shipment,
+                consignee=self.client_names[client_index],
+                delivery_address=f'г. {CITIES[client_index % len(CITIES)]}',
+                equipment=', '.join(options),
+                client_id=int(self.client_ids[client_index]),
+                service_company_id=int(self.company_ids[company[index]]) if serviced[index] else None,
+                current_hours=int(hours[index]),
+            ))
+        Machine.objects.bulk_create(machine_objects, batch_size=self.batch_size)
+        ids = np.array([machine.pk for machine in machine_objects], dtype=np.int64)
+        company_ids = np.where(serviced, self.company_ids[company], 0)
+        client_ids = self.client_ids[client]
+        organization_ids = np.where(serviced, self.organization_ids[company], 0)
+        self.counts['machines'] += count
+
+        # ---------------- комплектующие ----------------
+        # 3-5 разных комплектующих: первые из случайной перестановки
+        picked = np.argsort(rng.random((count, len(COMPONENTS))), axis=1)
+        keep = np.arange(len(COMPONENTS))[None, :] < rng.integers(3, 6, count)[:, None]
+        machine_at, component_at = np.nonzero(keep)
+        component_at = picked[machine_at, component_at]
+        lifetime = np.array([life for _, _, life in COMPONENTS])[component_at]
+        # Комплектующее меняют по выработке ресурса: наработка - с последней замены
+        worn = hours[machine_at] % lifetime
+        installed = shipped[machine_at] + ((hours[machine_at] - worn) / rate[machine_at]).astype(np.int64)
+        Component.objects.bulk_create([
+            Component(
+                name=COMPONENTS[kind][0],
+                part_number=f'{COMPONENTS[kind][1]}-{kind:02}{machine % 1000:03}',
+                lifetime_hours=int(life),
+                install_date=date.fromordinal(int(day)),
+                current_hours=int(used),
+                machine_id=int(ids[machine]),
+            )
+            for machine, kind, life, day, used in zip(machine_at, component_at, lifetime, installed, worn)
+        ], batch_size=self.batch_size)
+        self.counts['components'] += int(machine_at.size)
+
+        # ---------------- ТО ----------------
+        points = np.where(hours >= 50, 1 + hours // 200, 0)
+        machine_at = np.repeat(np.arange(count), points)
+        step = group_positions(points)
+        planned = np.where(step == 0, 50, 200 * step)
+        kind = np.select(
+            [planned % 2000 == 0, planned % 1000 == 0, planned % 400 == 0, step == 0], [4, 3, 2, 0], default=1
+        )
+        actual = planned + rng.integers(0, 25, planned.size)
+        keep = (rng.random(planned.size) > 0.03) & (actual <= hours[machine_at])
+        machine_at, kind, actual = machine_at[keep], kind[keep], actual[keep]
+        days = shipped[machine_at] + np.ceil(actual / rate[machine_at] * rng.normal(1, 0.05, actual.size))
+        days = distinct_days(machine_at, np.maximum(days.astype(np.int64), shipped[machine_at] + 1))
+        keep = days <= today
+        machine_at, kind, actual, days = machine_at[keep], kind[keep], actual[keep], days[keep]
+        TechnicalService.objects.bulk_create([
+            TechnicalService(
+                machine_id=int(ids[machine]),
+                service_type_id=int(self.service_types[service_kind]),
+                service_date=date.fromordinal(int(day)),
+                operating_hours=int(at_hours),
+                work_order_number=f'{self.prefix}-{start + machine}-{number}',
+                work_order_date=date.fromordinal(int(day)),
+                service_organization_id=int(organization_ids[machine]) or None,
+                service_organization_name='' if organization_ids[machine] else SELF_SERVICE,
+                service_company_id=int(company_ids[machine]) or None,
+                client_id=int(client_ids[machine]),
+            )
+            for number, (machine, service_kind, at_hours, day) in enumerate(zip(machine_at, kind, actual, days))
+        ], batch_size=self.batch_size)
+        self.counts['services'] += int(machine_at.size)
+
+        # ---------------- отказы и ремонты ----------------
+        failures = rng.poisson(hours / self.model_mtbf[model])
+        machine_at = np.repeat(np.arange(count), failures)
+        at_hours = (rng.random(machine_at.size) * hours[machine_at]).astype(np.int64) + 1
+        order = np.lexsort((at_hours, machine_at))
+        machine_at, at_hours = machine_at[order], at_hours[order]
+        days = distinct_days(machine_at, shipped[machine_at] + np.ceil(at_hours / rate[machine_at]).astype(np.int64))
+        keep = days <= today
+        machine_at, at_hours, days = machine_at[keep], at_hours[keep], days[keep]
+        node = rng.choice(len(FAILURE_NODES), machine_at.size, p=[weight for _, weight in FAILURE_NODES])
+        method = rng.choice(len(RECOVERY_METHODS), machine_at.size, p=[weight for _, weight in RECOVERY_METHODS])
+        downtime = np.clip(np.round(rng.lognormal(np.log(MEDIAN_DOWNTIME_DAYS), 0.8, machine_at.size)), 1, 60)
+        recovered = days + downtime.astype(np.int64)
+
+        reclamations, repairs = [], []
+        for machine, failed_at, day, recovery, node_index, method_index in zip(
+            machine_at, at_hours, days, recovered, node, method
+        ):
+            node_name = FAILURE_NODES[node_index][0]
+            method_name = RECOVERY_METHODS[method_index][0]
+            failure_date = date.fromordinal(int(day))
+            recovery_date = date.fromordinal(int(recovery))
+            company_id = int(company_ids[machine]) or None
+            reclamations.append(Reclamation(
+                machine_id=int(ids[machine]),
+                failure_date=failure_date,
+                operating_hours=int(failed_at),
+                failure_node_id=int(self.failure_nodes[node_index]),
+                failure_description=f'{node_name}: неисправность на {failed_at} м/ч',
+                recovery_method_id=int(self.recovery_methods[method_index]),
+                spare_parts_used=f'Узел "{node_name}"' if method_index == 1 else '',
+                recovery_date=recovery_date,
+                service_company_id=company_id,
+                client_id=int(client_ids[machine]),
+            ))
+            # Ремонт ещё идёт, если дата восстановления впереди
+            repairs.append(Maintenance(
+                machine_id=int(ids[machine]),
+                type='repair',
+                start_date=datetime.combine(failure_date, time(8), timezone.utc),
+                end_date=datetime.combine(recovery_date, time(17), timezone.utc) if recovery <= today else None,
+                description=f'{method_name}: {node_name}',
+                service_company_id=company_id,
+            ))
+        Reclamation.objects.bulk_create(reclamations, batch_size=self.batch_size)
+        Maintenance.objects.bulk_create(repairs, batch_size=self.batch_size)
+        self.counts['reclamations'] += len(reclamations)
+        self.counts['maintenance'] += len(repairs)
@@ -1,3 +1,1696 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
\ No newline at end of file
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.db.models import Count, F, Sum
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+
+from . import views, views_api
+from .authentication import CachedAuthenticationBackend, CachedTokenAuthentication
+from .batch import TechnicalServiceBatchWriter
+from .benchmark import compare, export_tables, run_size
+from .changes import FEEDS, PAGE_SIZE, ResyncRequired, collect_changes, prune_changes
+from .dump import fleet_lines
+from .forecast import due_within, rebuild_forecasts
+from .importer import SHEETS, BulkImporter, count_records, iter_record_chunks, pq, read_records
+from .models import (
+    Change, Component, DriveAxleModel, EngineModel, FailureNode, ImportChunk, ImportRun, Machine, MachineModel,
+    Maintenance, MachineSummary, MaintenanceForecast, Reclamation, RecoveryMethod, ReclamationRollup,
+    ServiceOrganization, ServiceType, SteeringAxleModel, TechnicalService, TransmissionModel, User
+)
+from . import references
+from .pagination import CursorPaginator, InvalidCursor
+from .reliability import fit_weibull, reliability_report
+from .replica import REPLICA_DB, SYNCED_KEY, ReplicaMiddleware, ReplicaRouter, replica_reads
+from .summary import rebuild_machine_summaries
+from .synthetic import SERVICE_TYPES, FleetGenerator
+
+FULL_SCAN = re.compile(r'^SCAN \S+$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+def run_import(path, *args):
+    """import_data без вывода в консоль; -> текст отчёта"""
+    output = StringIO()
+    call_command('import_data', path, *args, stdout=output)
+    return output.getvalue()
+
+
+def edit_table(directory, name, edit):
+    """Переписать выгрузку name.csv: edit(DataFrame со строковыми колонками)"""
+    path = os.path.join(directory, f'{name}.csv')
+    frame = pd.read_csv(path, dtype='string')
+    edit(frame)
+    frame.to_csv(path, index=False)
+
+
+def query_plan(queryset):
+    """Строки EXPLAIN QUERY PLAN запроса"""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanTests(TestCase):
+    """
+    Планы запросов списков по ролям: первая и следующая страница keyset-
+    пагинации каждого списка должны идти по индексу - без полного
+    просмотра таблицы и без сортировки во временном B-дереве.
+    Статистики (ANALYZE) в тестовой БД нет, планировщик выбирает индексы
+    по своим правилам, так что размер данных на план не влияет.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        references = [
+            model.objects.create(name=f'{model.__name__}')
+            for model in (MachineModel, EngineModel, TransmissionModel, DriveAxleModel, SteeringAxleModel)
+        ]
+        service_types = [ServiceType.objects.create(name=f'ТО-{index}') for index in range(2)]
+        failure_node = FailureNode.objects.create(name='Двигатель')
+        recovery_method = RecoveryMethod.objects.create(name='Замена')
+        organization = ServiceOrganization.objects.create(
+            name='Сервис', address='-', contact_person='-', contact_phone='-'
+        )
+        cls.users = {
+            'client': User.objects.create_user('client', role='client'),
+            'service': User.objects.create_user('service', role='service'),
+            'manager': User.objects.create_user('manager', role='manager'),
+        }
+        for index in range(30):
+            machine = Machine.objects.create(
+                serial_number=f'M{index:03}',
+                machine_model=references[0],
+                engine_model=references[1],
+                transmission_model=references[2],
+                drive_axle_model=references[3],
+                steering_axle_model=references[4],
+                engine_serial='-', transmission_serial='-', drive_axle_serial='-', steering_axle_serial='-',
+                supply_contract='-', consignee='-', delivery_address='-', equipment='-',
+                shipment_date=date(2022, 1, 1) + timedelta(days=index),
+                client=cls.users['client'],
+                service_company=cls.users['service'],
+                current_hours=1000,
+            )
+            for number in range(4):
+                TechnicalService.objects.create(
+                    machine=machine, service_type=service_types[number % 2], operating_hours=100 * (number + 1),
+                    service_date=date(2022, 6, 1) + timedelta(days=index + 30 * number),
+                    work_order_number='-', work_order_date=date(2022, 6, 1),
+                    service_organization=organization, service_company=cls.users['service'],
+                )
+            Reclamation.objects.create(
+                machine=machine, failure_date=date(2023, 1, 1) + timedelta(days=index), operating_hours=500,
+                failure_node=failure_node, failure_description='-', recovery_method=recovery_method,
+                recovery_date=date(2023, 2, 1) + timedelta(days=index), service_company=cls.users['service'],
+            )
+            Maintenance.objects.create(
+                machine=machine, type='repair', description='-', service_company=cls.users['service'],
+                start_date=datetime(2023, 1, 1, tzinfo=timezone.utc),
+                end_date=None if index % 10 == 0 else datetime(2023, 1, 5, tzinfo=timezone.utc),
+            )
+        rebuild_machine_summaries()
+        rebuild_forecasts()
+
+    def html_queryset(self, view_class, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        view = view_class()
+        view.setup(request)
+        return view.get_queryset(), view.cursor_ordering
+
+    def api_queryset(self, viewset_class, user):
+        request = Request(RequestFactory().get('/'))
+        request.user = user
+        view = viewset_class(request=request, action='list', format_kwarg=None, args=(), kwargs={})
+        return view.get_queryset(), view.cursor_ordering
+
+    def page_queries(self, queryset, ordering):
+        """Запросы первой и второй страницы"""
+        paginator = CursorPaginator(queryset, ordering, 5)
+        cursor = paginator.page().next_cursor
+        self.assertIsNotNone(cursor)
+        return [paginator._page_query(None)[0], paginator._page_query(cursor)[0]]
+
+    def assertIndexedPlan(self, queryset):
+        plan = query_plan(queryset)
+        scans = [step for step in plan if FULL_SCAN.match(step)]
+        self.assertFalse(scans, f'Полный просмотр таблицы: {plan}')
+        self.assertFalse([step for step in plan if TEMP_SORT in step], f'Сортировка без индекса: {plan}')
+        return plan
+
+    def assertListPlans(self, get_queryset, view_classes):
+        for view_class in view_classes:
+            for role, user in self.users.items():
+                with self.subTest(view=view_class.__name__, role=role):
+                    queryset, ordering = get_queryset(view_class, user)
+                    for page_query in self.page_queries(queryset, ordering):
+                        self.assertIndexedPlan(page_query)
+
+    def test_html_lists(self):
+        self.assertListPlans(
+            self.html_queryset,
+            [views.MachineListView, views.TechnicalServiceListView, views.ReclamationListView,
+             views.MaintenanceDueView],
+        )
+
+    def test_api_lists(self):
+        self.assertListPlans(
+            self.api_queryset,
+            [views_api.MachineViewSet, views_api.TechnicalServiceViewSet, views_api.ReclamationViewSet,
+             views_api.MaintenanceForecastViewSet],
+        )
+
+    def test_client_lists_use_row_client(self):
+        # ТО и рекламации клиента идут по их собственному полю client, не через машины
+        client = self.users['client']
+        for queryset, index in [
+            (TechnicalService.get_visible_to_user(client).order_by('-service_date', 'id'),
+             'technical_service_client_idx'),
+            (Reclamation.get_visible_to_user(client).order_by('-failure_date', 'id'), 'reclamation_client_idx'),
+        ]:
+            with self.subTest(index=index):
+                plan = self.assertIndexedPlan(queryset)
+                self.assertTrue(any(index in step for step in plan), plan)
+                self.assertFalse(any('monitoring_machine' in step for step in plan), plan)
+
+    def test_machine_detail_lists(self):
+        machine = Machine.objects.first()
+        for role, user in self.users.items():
+            with self.subTest(role=role):
+                self.assertIndexedPlan(
+                    TechnicalService.get_visible_to_user(user).filter(machine=machine).order_by('-service_date')
+                )
+                self.assertIndexedPlan(
+                    Reclamation.get_visible_to_user(user).filter(machine=machine).order_by('-failure_date')
+                )
+
+    def test_open_maintenance_partial_index(self):
+        plan = self.assertIndexedPlan(Machine.objects.with_status().filter(pk=Machine.objects.first().pk))
+        self.assertTrue(any('maintenance_open_idx' in step for step in plan), plan)
+
+
+class BenchmarkSuiteTests(TestCase):
+    """Набор замеров на крошечном парке: все случаи отвечают, сравнение с baseline ловит рост запросов"""
+
+    def test_run_size(self):
+        with tempfile.TemporaryDirectory() as directory:
+            result = run_size(30, directory, seed=1, repeat=1)
+        cases = result['cases']
+        for role in ('client', 'service', 'manager'):
+            for case in ('machine_list', 'machine_list_filtered', 'machine_detail', 'technical_service_list',
+                         'reclamation_list'):
+                self.assertIn(f'{case}:{role}', cases)
+        self.assertIn('machine_search:anonymous', cases)
+        self.assertIn('admin_machine:manager', cases)
+        self.assertTrue(all(case['queries'] > 0 for case in cases.values()), cases)
+        # Выгрузка парка перечитана поверх него же: новых машин и ТО нет
+        self.assertEqual(Machine.objects.count(), result['fleet']['machines'])
+        self.assertEqual(TechnicalService.objects.count(), result['fleet']['services'])
+
+    def test_compare(self):
+        def results(queries, p50_ms):
+            case = {'runs': 1, 'p50_ms': p50_ms, 'p95_ms': p50_ms, 'p99_ms': p50_ms, 'max_ms': p50_ms,
+                    'queries': queries, 'peak_kb': 100}
+            return {'sizes': {'small': {'cases': {'machine_list:client': case}}}}
+
+        baseline = results(2, 10)
+        self.assertEqual(compare(results(2, 12), baseline), [])
+        self.assertEqual(len(compare(results(3, 10), baseline)), 1)
+        self.assertEqual(len(compare(results(2, 30), baseline)), 1)
+
+
+class RollupImportTests(TestCase):
+    """Свёртка рекламаций после импорта совпадает с живыми рекламациями"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=3, prefix='R').generate(40)
+
+    def assertRollupMatches(self):
+        for machine_model in MachineModel.objects.all():
+            with self.subTest(machine_model=machine_model.name):
+                rolled = ReclamationRollup.objects.filter(machine_model=machine_model).aggregate(
+                    total=Sum('reclamation_count')
+                )['total'] or 0
+                self.assertEqual(rolled, Reclamation.objects.filter(machine__machine_model=machine_model).count())
+
+    def test_import_moves_machine_to_other_model(self):
+        machine = Reclamation.objects.order_by('machine_id').first().machine
+        other = MachineModel.objects.exclude(pk=machine.machine_model_id).first()
+
+        def move(frame):
+            frame.loc[frame['Зав. № машины'] == machine.serial_number, 'Модель техники'] = other.name
+
+        with tempfile.TemporaryDirectory() as directory:
+            export_tables(directory)
+            edit_table(directory, 'machines', move)
+            run_import(directory)
+        machine.refresh_from_db()
+        self.assertEqual(machine.machine_model_id, other.pk)
+        self.assertRollupMatches()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ReplicaRoutingTests(SimpleTestCase):
+    """
+    Выбор БД роутером: реплика для отмеченных GET, основная БД при отставании
+    и после записи. Внутри транзакции реплика не читается, поэтому без TestCase:
+    роутеру БД не нужна
+    """
+    user = User(pk=1, username='reader', role='manager')
+
+    def setUp(self):
+        cache.clear()
+        cache.set(SYNCED_KEY, time.time(), None)
+        self.router = ReplicaRouter()
+
+    def respond(self, body, method='get', flagged=True):
+        """Запрос через ReplicaMiddleware к view, тело ответа - body(); -> ответ"""
+        def view(request):
+            return StreamingHttpResponse(body())
+
+        request = getattr(RequestFactory(), method)('/')
+        request.user = self.user
+        middleware = ReplicaMiddleware(
+            lambda request: middleware.process_view(request, view, (), {}) or view(request)
+        )
+        if flagged:
+            replica_reads(view)
+        return middleware(request)
+
+    def read_alias(self):
+        return self.router.db_for_read(Machine) or 'default'
+
+    def body(self, response):
+        return [chunk.decode() for chunk in response.streaming_content]
+
+    def test_flagged_get_reads_replica(self):
+        def body():
+            yield self.read_alias()
+            # Пользователи всегда читаются из основной БД
+            yield self.router.db_for_read(User) or 'default'
+
+        self.assertEqual(self.body(self.respond(body)), [REPLICA_DB, 'default'])
+
+    async def test_async_streaming_body_reads_replica(self):
+        async def body():
+            yield self.read_alias()
+
+        view = replica_reads(lambda request: StreamingHttpResponse(body()))
+
+        async def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = ReplicaMiddleware(get_response)
+        request = RequestFactory().get('/')
+        request.user = self.user
+        response = await middleware(request)
+        self.assertEqual([chunk async for chunk in response.streaming_content], [REPLICA_DB.encode()])
+
+    def test_unflagged_view_and_post_read_primary(self):
+        self.assertEqual(self.body(self.respond(lambda: iter([self.read_alias()]), flagged=False)), ['default'])
+        self.assertEqual(self.body(self.respond(lambda: iter([self.read_alias()]), method='post')), ['default'])
+
+    def test_stale_replica_falls_back(self):
+        cache.set(SYNCED_KEY, time.time() - 3600, None)
+        self.assertEqual(self.body(self.respond(lambda: iter([self.read_alias()]))), ['default'])
+        cache.delete(SYNCED_KEY)
+        self.assertEqual(self.body(self.respond(lambda: iter([self.read_alias()]))), ['default'])
+
+    def test_monitoring_write_pins_request(self):
+        def body():
+            yield self.read_alias()
+            self.router.db_for_write(Machine)
+            yield self.read_alias()
+
+        self.assertEqual(self.body(self.respond(body)), [REPLICA_DB, 'default'])
+
+    def test_write_pins_user_until_next_snapshot(self):
+        def write():
+            self.router.db_for_write(Reclamation)
+            return iter(['written'])
+
+        self.body(self.respond(write))
+        self.assertEqual(self.body(self.respond(lambda: iter([self.read_alias()]))), ['default'])
+        cache.set(SYNCED_KEY, time.time() + 1, None)
+        self.assertEqual(self.body(self.respond(lambda: iter([self.read_alias()]))), [REPLICA_DB])
+
+    def test_session_and_login_writes_keep_replica(self):
+        def body():
+            self.router.db_for_write(User)
+            self.router.db_for_write(Session)
+            yield self.read_alias()
+
+        self.assertEqual(self.body(self.respond(body)), [REPLICA_DB])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ReferenceCacheTests(TestCase):
+    """Кеш справочников: чтение без запросов, новая версия после сохранения, без устаревших таблиц"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.engine = EngineModel.objects.create(name='Д-245')
+        FleetGenerator(seed=1, prefix='C').generate(3)
+        cls.token = Token.objects.create(user=User.objects.create_user('cache-manager', role='manager'))
+
+    def setUp(self):
+        cache.clear()
+        references.bump_version()
+
+    def test_cached_reads_skip_db(self):
+        references.reference_names(EngineModel)
+        with self.assertNumQueries(0):
+            self.assertEqual(references.reference_ids(EngineModel)['Д-245'], self.engine.pk)
+            self.assertEqual(references.get_reference(EngineModel, self.engine.pk).name, 'Д-245')
+
+    def test_save_bumps_version_after_commit(self):
+        references.reference_names(EngineModel)
+        with self.captureOnCommitCallbacks(execute=True):
+            EngineModel.objects.filter(pk=self.engine.pk).update(name='Д-245.5')
+            self.engine.refresh_from_db()
+            self.engine.save()
+        self.assertEqual(references.reference_names(EngineModel)[self.engine.pk], 'Д-245.5')
+
+    def test_missing_id_reloads_table(self):
+        references.reference_names(EngineModel)
+        # Запись из другого процесса: версия ещё не сверена
+        EngineModel.objects.bulk_create([EngineModel(name='Kubota')])
+        other = EngineModel.objects.get(name='Kubota')
+        self.assertEqual(references.get_reference(EngineModel, other.pk).name, 'Kubota')
+
+    @override_settings(ROOT_URLCONF='silant_core.urls_asgi')
+    async def test_async_api_list_with_cold_cache(self):
+        # Названия справочников в сериализаторе читаются из кеша; холодный кеш идёт в БД не из цикла событий
+        response = await self.async_client.get(
+            '/api/technical-services/', headers={'Authorization': f'Token {self.token.key}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        names = {row['service_type_name'] for row in response.json()['results']}
+        self.assertTrue(names and names <= {name for name, _ in SERVICE_TYPES}, names)
+
+    def test_table_loaded_across_version_change_is_not_kept(self):
+        load = references.ReferenceTable
+
+        def load_then_bump(model):
+            table = load(model)
+            # Пока таблица читалась, другой процесс сменил версию, а другой поток её уже сверил
+            cache.set(references.VERSION_KEY, 'newer', None)
+            references._state['checked'] = None
+            references._check_version()
+            return table
+
+        with mock.patch.object(references, 'ReferenceTable', load_then_bump):
+            references.reference_names(EngineModel)
+        with CaptureQueriesContext(connection) as queries:
+            references.reference_names(EngineModel)
+        self.assertEqual(len(queries), 1)
+
+
+class BatchWriteTests(TestCase):
+    """Пакетная запись ТО: ошибки по номеру записи, права на существующие записи, одновременная вставка"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=5, prefix='B').generate(20)
+        cls.machine = Machine.objects.filter(service_company__isnull=False).order_by('pk').first()
+        cls.service = cls.machine.service_company
+        cls.other = User.objects.create_user('batch-other', role='service')
+        cls.service_type = ServiceType.objects.order_by('pk').first()
+
+    def record(self, day, **fields):
+        return {
+            'serial_number': self.machine.serial_number,
+            'service_type': self.service_type.name,
+            'service_date': day.isoformat(),
+            'operating_hours': 100,
+            'work_order_number': 'ЗН-1',
+            'work_order_date': day.isoformat(),
+            **fields,
+        }
+
+    def existing(self, day, service_company):
+        return TechnicalService.objects.create(
+            machine=self.machine, service_type=self.service_type, service_date=day, operating_hours=1,
+            work_order_number='ЗН-0', work_order_date=day, service_company=service_company,
+        )
+
+    def write(self, records):
+        return TechnicalServiceBatchWriter(self.service).write(records)
+
+    def test_errors_by_record_index(self):
+        day = date(2000, 1, 3)
+        result = self.write([
+            self.record(day),
+            self.record(date(2000, 1, 4), serial_number='нет такой'),
+            self.record(date(2000, 1, 5), service_type='нет такого'),
+            self.record(day),
+            {'serial_number': self.machine.serial_number},
+        ])
+        self.assertEqual((result['created'], result['updated']), (1, 0))
+        errors = {error['index']: error['errors'] for error in result['errors']}
+        self.assertEqual(set(errors), {1, 2, 3, 4})
+        self.assertIn('serial_number', errors[1])
+        self.assertIn('service_type', errors[2])
+        self.assertIn('service_date', errors[3])
+        created = TechnicalService.objects.get(machine=self.machine, service_date=day)
+        self.assertEqual(created.service_company, self.service)
+
+    def test_updates_only_editable_records(self):
+        own = self.existing(date(2000, 2, 1), self.service)
+        foreign = self.existing(date(2000, 2, 2), self.other)
+        result = self.write([self.record(own.service_date), self.record(foreign.service_date)])
+        self.assertEqual((result['created'], result['updated']), (0, 1))
+        self.assertEqual([error['index'] for error in result['errors']], [1])
+        own.refresh_from_db()
+        foreign.refresh_from_db()
+        self.assertEqual(own.operating_hours, 100)
+        self.assertEqual(foreign.operating_hours, 1)
+
+    def test_concurrently_created_record_is_not_overwritten(self):
+        day = date(2000, 3, 1)
+        load = TechnicalServiceBatchWriter.load_existing
+        calls = []
+
+        def load_before_insert(writer, keys):
+            # Первое чтение - до того, как другой запрос вставил запись с тем же ключом
+            calls.append(keys)
+            if len(calls) == 1:
+                rows = load(writer, keys)
+                self.existing(day, self.other)
+                return rows
+            return load(writer, keys)
+
+        with mock.patch.object(TechnicalServiceBatchWriter, 'load_existing', load_before_insert):
+            result = self.write([self.record(day), self.record(date(2000, 3, 2))])
+        self.assertEqual((result['created'], result['updated']), (1, 0))
+        self.assertEqual([error['index'] for error in result['errors']], [0])
+        concurrent = TechnicalService.objects.get(machine=self.machine, service_date=day)
+        self.assertEqual((concurrent.service_company, concurrent.operating_hours), (self.other, 1))
+        self.assertTrue(TechnicalService.objects.filter(machine=self.machine, service_date=date(2000, 3, 2)).exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ChangeFeedTests(TestCase):
+    """Лента изменений: журнал по порядку фиксации, отметки о потере видимости, срок хранения"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=7, prefix='F').generate(12)
+        cls.machine = Machine.objects.filter(
+            service_company__isnull=False, reclamations__isnull=False, components__isnull=False
+        ).order_by('pk').first()
+        cls.client_user = cls.machine.client
+        cls.other_client = User.objects.create_user('feed-client', role='client')
+        cls.manager = User.objects.create_user('feed-manager', role='manager')
+
+    def sync(self, user, cursor=None, limit=PAGE_SIZE):
+        """Все страницы после курсора: ({лента: {id}}, {(лента, id)}, курсор)"""
+        changes, deleted = {}, set()
+        while True:
+            page = collect_changes(user, cursor, limit)
+            for feed, rows in page['changes'].items():
+                changes.setdefault(feed, set()).update(row['id'] for row in rows)
+            deleted |= {(row['feed'], row['id']) for row in page['deleted']}
+            cursor = page['cursor']
+            if not page['has_more']:
+                return changes, deleted, cursor
+
+    def test_triggers_installed(self):
+        # Перестройка таблицы SQLite в новой миграции удаляет её триггеры
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'change_%'")
+            self.assertEqual(cursor.fetchone()[0], len(FEEDS) * 3 + 1)
+
+    def test_snapshot_pages_cover_visible_rows(self):
+        changes, deleted, _ = self.sync(self.client_user, limit=7)
+        machines = self.client_user.get_accessible_machines()
+        self.assertEqual(changes['machines'], set(machines.values_list('pk', flat=True)))
+        self.assertEqual(
+            changes['technical-services'],
+            set(TechnicalService.get_visible_to_user(self.client_user).values_list('pk', flat=True)),
+        )
+        self.assertEqual(deleted, set())
+
+    def test_log_ignores_write_time(self):
+        _, _, cursor = self.sync(self.manager)
+        service = self.machine.technical_services.first()
+        # Время записи старше курсора - как у строки из транзакции, зафиксированной после опроса
+        TechnicalService.objects.filter(pk=service.pk).update(
+            operating_hours=F('operating_hours') + 1, updated_at=datetime(2000, 1, 1, tzinfo=timezone.utc)
+        )
+        changes, deleted, cursor = self.sync(self.manager, cursor)
+        self.assertEqual(changes, {'technical-services': {service.pk}})
+        self.assertEqual(self.sync(self.manager, cursor)[:2], ({}, set()))
+
+    def test_client_change_hides_machine_from_previous_client(self):
+        cursors = {user: self.sync(user)[2] for user in (self.client_user, self.other_client, self.manager)}
+        children = {
+            'machines': {self.machine.pk},
+            'technical-services': set(self.machine.technical_services.values_list('pk', flat=True)),
+            'reclamations': set(self.machine.reclamations.values_list('pk', flat=True)),
+            'components': set(self.machine.components.values_list('pk', flat=True)),
+        }
+        Machine.objects.filter(pk=self.machine.pk).update(client=self.other_client)
+
+        _, deleted, _ = self.sync(self.client_user, cursors[self.client_user])
+        self.assertEqual(deleted, {(feed, pk) for feed, ids in children.items() for pk in ids})
+        changes, deleted, _ = self.sync(self.other_client, cursors[self.other_client])
+        self.assertEqual((changes, deleted), (children, set()))
+        changes, deleted, _ = self.sync(self.manager, cursors[self.manager])
+        self.assertEqual((changes.get('machines'), deleted), ({self.machine.pk}, set()))
+
+    def test_service_company_change_hides_reclamation(self):
+        reclamation = self.machine.reclamations.first()
+        previous = reclamation.service_company
+        cursor = self.sync(previous)[2]
+        reclamation.service_company = User.objects.create_user('feed-service', role='service')
+        reclamation.save()
+        changes, deleted, _ = self.sync(previous, cursor)
+        self.assertNotIn('reclamations', changes)
+        self.assertEqual(deleted, {('reclamations', reclamation.pk)})
+
+    def test_delete(self):
+        cursor = self.sync(self.client_user)[2]
+        service = self.machine.technical_services.first()
+        pk = service.pk
+        service.delete()
+        self.assertEqual(self.sync(self.client_user, cursor)[1], {('technical-services', pk)})
+
+    def test_pruned_cursor_requires_resync(self):
+        cursor = self.sync(self.manager)[2]
+        self.machine.technical_services.update(operating_hours=F('operating_hours') + 1)
+        Change.objects.update(created_at=datetime(2000, 1, 1, tzinfo=timezone.utc))
+        self.assertGreater(prune_changes(), 0)
+        self.assertEqual(Change.objects.count(), 1)
+        with self.assertRaises(ResyncRequired):
+            collect_changes(self.manager, cursor)
+
+        headers = {'Authorization': f'Token {Token.objects.create(user=self.manager).key}'}
+        url = reverse('monitoring:api_changes')
+        response = self.client.get(url, {'cursor': cursor}, headers=headers)
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.json()['code'], 'resync_required')
+        # Заново без курсора, дальше - с новым
+        fresh = self.client.get(url, headers=headers).json()['cursor']
+        self.assertEqual(self.client.get(url, {'cursor': fresh}, headers=headers).status_code, 200)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ForecastTests(TestCase):
+    """Прогноз ТО: импорт пересчитывает только затронутые машины, сроки - по местной дате"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=9, prefix='P').generate(15)
+
+    def setUp(self):
+        cache.clear()
+        rebuild_forecasts()
+
+    def test_import_refreshes_only_touched_machines(self):
+        later = date.today()
+        service = TechnicalService.objects.filter(service_date__lt=later).order_by('-service_date', 'pk').first()
+        machine = service.machine
+
+        def add_service(frame):
+            row = frame[
+                (frame['Зав. № машины'] == machine.serial_number) & (frame['Вид ТО'] == service.service_type.name)
+            ].iloc[0].copy()
+            row['Дата проведения ТО'] = row['Дата заказ-наряда'] = later.strftime('%d.%m.%Y')
+            row['Наработка, м/час'] = str(service.operating_hours + 300)
+            frame.loc[len(frame)] = row
+
+        with tempfile.TemporaryDirectory() as directory:
+            export_tables(directory)
+            # Первый импорт запоминает строки; второй пишет только изменённые
+            run_import(directory)
+            untouched = dict(MaintenanceForecast.objects.exclude(machine=machine).values_list('pk', 'due_date'))
+            edit_table(directory, 'services', add_service)
+            run_import(directory)
+        self.assertEqual(
+            dict(MaintenanceForecast.objects.exclude(machine=machine).values_list('pk', 'due_date')), untouched
+        )
+        self.assertEqual(
+            MaintenanceForecast.objects.filter(machine=machine).order_by('-last_service_date')[0].last_service_date,
+            later,
+        )
+
+    @override_settings(TIME_ZONE='Asia/Vladivostok')
+    def test_due_within_uses_local_date(self):
+        forecast = MaintenanceForecast.objects.order_by('pk').first()
+        # 20:00 UTC - во Владивостоке уже следующий день
+        now = datetime(2030, 6, 1, 20, 0, tzinfo=timezone.utc)
+        MaintenanceForecast.objects.filter(pk=forecast.pk).update(due_date=date(2030, 6, 2))
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            self.assertIn(forecast, due_within(MaintenanceForecast.objects.all(), 0))
+
+
+class ImportWorkersTests(TestCase):
+    """import_data --workers: листы разбираются в процессах, без --stream"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=11, prefix='W').generate(10)
+
+    def test_workers_reject_stream(self):
+        with tempfile.TemporaryDirectory() as directory:
+            export_tables(directory)
+            with self.assertRaisesMessage(CommandError, '--workers и --stream несовместимы'):
+                run_import(directory, '--workers', '2', '--stream')
+            run = ImportRun.objects.create(file_path=directory, options={
+                'stream': True, 'chunk_size': 100, 'batch_size': 500, 'full': False,
+            })
+            with self.assertRaisesMessage(CommandError, '--workers и --stream несовместимы'):
+                call_command('import_data', '--resume', run.pk, '--workers', 2, stdout=StringIO())
+        self.assertEqual(ImportRun.objects.count(), 1)
+
+    def test_workers_import_all_sheets(self):
+        with tempfile.TemporaryDirectory() as directory:
+            export_tables(directory)
+            edit_table(directory, 'services', lambda frame: frame.drop(frame.index[::2], inplace=True))
+            TechnicalService.objects.all().delete()
+            report = run_import(directory, '--workers', '3')
+            expected = len(pd.read_csv(os.path.join(directory, 'services.csv')))
+        self.assertIn('ТО: новых', report)
+        self.assertEqual(TechnicalService.objects.count(), expected)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TechnicalServiceCreateRoleTests(TestCase):
+    """Вносить ТО в форме и через API могут одни и те же роли"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=13, prefix='T').generate(5)
+        cls.machine = Machine.objects.filter(service_company__isnull=False).order_by('pk').first()
+        cls.users = {'client': cls.machine.client, 'service': cls.machine.service_company}
+        cls.users['manager'] = User.objects.create_user('roles-manager', role='manager')
+
+    def test_same_roles_on_web_and_api(self):
+        for role, user in self.users.items():
+            with self.subTest(role=role):
+                headers = {'Authorization': f'Token {Token.objects.get_or_create(user=user)[0].key}'}
+                api = self.client.post(
+                    reverse('monitoring:api-technical-service-bulk'), [], content_type='application/json',
+                    headers=headers,
+                )
+                self.client.force_login(user)
+                web = self.client.get(reverse('monitoring:service_create', args=[self.machine.pk]))
+                allowed = user.can_edit_technical_services()
+                self.assertEqual(api.status_code, 200 if allowed else 403)
+                self.assertEqual(web.status_code, 200 if allowed else 302)
+                self.assertEqual(allowed, role != 'client')
+
+
+class CursorPaginatorTests(TestCase):
+    """Keyset-пагинация: границы страниц при равных датах, проход вперёд и назад"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=15, prefix='K').generate(23)
+        # Равные значения первого поля ключа - страницы различает только id
+        Machine.objects.filter(pk__in=Machine.objects.order_by('pk').values('pk')[:9]).update(
+            shipment_date=date(2020, 5, 1)
+        )
+        cls.ordering = ('-shipment_date', 'id')
+        cls.expected = list(Machine.objects.order_by(*cls.ordering).values_list('pk', flat=True))
+
+    def walk(self, paginator, cursor, step):
+        """Страницы от cursor по next_cursor (step='next') или previous_cursor"""
+        pages = []
+        while True:
+            page = paginator.page(cursor)
+            pages.append([machine.pk for machine in page])
+            cursor = page.next_cursor if step == 'next' else page.previous_cursor
+            if cursor is None:
+                return pages
+
+    def test_forward_and_backward_cover_every_row_once(self):
+        for per_page in (1, 4, 9, 23, 50):
+            with self.subTest(per_page=per_page):
+                paginator = CursorPaginator(Machine.objects.all(), self.ordering, per_page)
+                forward = self.walk(paginator, None, 'next')
+                self.assertEqual(sum(forward, []), self.expected)
+                self.assertTrue(all(len(page) == per_page for page in forward[:-1]))
+                # С конца страницы полные, неполной остаётся первая
+                backward = self.walk(paginator, paginator.page().last_cursor, 'prev')[::-1]
+                self.assertEqual(sum(backward, []), self.expected)
+                self.assertTrue(all(len(page) == per_page for page in backward[1:]))
+
+    def test_exact_last_page_has_no_next(self):
+        paginator = CursorPaginator(Machine.objects.all(), self.ordering, 23)
+        page = paginator.page()
+        self.assertEqual(len(page), 23)
+        self.assertFalse(page.has_next())
+        self.assertFalse(page.has_previous())
+
+    def test_page_after_row_with_equal_key(self):
+        paginator = CursorPaginator(Machine.objects.all(), self.ordering, 5)
+        tied = Machine.objects.filter(shipment_date=date(2020, 5, 1)).order_by('id')
+        cursor = paginator.encode_cursor('next', tied[2])
+        self.assertEqual(
+            [machine.pk for machine in paginator.page(cursor)], list(tied.values_list('pk', flat=True)[3:8])
+        )
+
+    def test_invalid_cursor(self):
+        paginator = CursorPaginator(Machine.objects.all(), self.ordering, 5)
+        for cursor in ('мусор', paginator.encode_cursor('next', None)[:-2] + 'xx', 'WyJuZXh0IixbMV1d'):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class MachineSummarySignalTests(TestCase):
+    """Витрина после каждого изменения через сигналы совпадает с полной пересборкой"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=17, prefix='S').generate(8)
+        cls.machine, cls.other = Machine.objects.order_by('pk')[:2]
+
+    def assertSummaryFresh(self):
+        incremental = list(MachineSummary.objects.order_by('pk').values())
+        rebuild_machine_summaries()
+        self.assertEqual(incremental, list(MachineSummary.objects.order_by('pk').values()))
+
+    def test_machine_and_reference_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.machine.shipment_date = date(2015, 1, 1)
+            self.machine.save()
+        engine = self.machine.engine_model
+        engine.name = f'{engine.name} (новая)'
+        engine.save()
+        self.assertSummaryFresh()
+        self.assertEqual(MachineSummary.objects.get(pk=self.machine.pk).engine_model_name, engine.name)
+
+    def test_service_moved_to_other_machine(self):
+        service = self.machine.technical_services.order_by('-service_date').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            service.machine = self.other
+            service.service_date = date(2030, 1, 1)
+            service.save()
+        self.assertSummaryFresh()
+        self.assertEqual(MachineSummary.objects.get(pk=self.other.pk).last_service_date, date(2030, 1, 1))
+        self.assertNotEqual(MachineSummary.objects.get(pk=self.machine.pk).last_service_date, date(2030, 1, 1))
+
+    def test_children_created_and_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Maintenance.objects.create(
+                machine=self.machine, type='repair', start_date=datetime(2024, 1, 1, tzinfo=timezone.utc),
+                description='Ремонт',
+            )
+            self.machine.reclamations.first().delete()
+            self.machine.components.update(current_hours=F('lifetime_hours'))
+            self.machine.components.first().save()
+        self.assertSummaryFresh()
+        self.assertTrue(MachineSummary.objects.get(pk=self.machine.pk).in_service)
+
+    def test_user_renamed(self):
+        client = self.machine.client
+        client.first_name, client.last_name = 'Иван', 'Петров'
+        client.save()
+        self.assertSummaryFresh()
+        self.assertEqual(MachineSummary.objects.get(pk=self.machine.pk).client_name, 'Иван Петров')
+
+
+class ImportUpsertTests(TestCase):
+    """Повторный импорт обновляет записи по ключу, не создавая дублей"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=19, prefix='U').generate(10)
+
+    def test_reimport_updates_in_place(self):
+        machine = Machine.objects.order_by('pk').first()
+        counts = (Machine.objects.count(), TechnicalService.objects.count(), Reclamation.objects.count())
+        engines = EngineModel.objects.count()
+
+        service = machine.technical_services.order_by('service_date').first()
+
+        def edit_services(frame):
+            row = (frame['Зав. № машины'] == machine.serial_number) & (
+                frame['Дата проведения ТО'] == service.service_date.strftime('%d.%m.%Y')
+            )
+            frame.loc[row, 'Наработка, м/час'] = str(service.operating_hours + 1)
+
+        def edit(frame):
+            row = frame['Зав. № машины'] == machine.serial_number
+            frame.loc[row, 'Модель двигателя'] = 'Д-245 (новый)'
+            frame.loc[row, 'Грузополучатель (конечный потребитель)'] = 'ООО Новый получатель'
+
+        with tempfile.TemporaryDirectory() as directory:
+            export_tables(directory)
+            edit_table(directory, 'machines', edit)
+            edit_table(directory, 'services', edit_services)
+            run_import(directory)
+        self.assertEqual(
+            (Machine.objects.count(), TechnicalService.objects.count(), Reclamation.objects.count()), counts
+        )
+        machine.refresh_from_db()
+        self.assertEqual(machine.engine_model.name, 'Д-245 (новый)')
+        self.assertEqual(EngineModel.objects.count(), engines + 1)
+        self.assertEqual(TechnicalService.objects.get(pk=service.pk).operating_hours, service.operating_hours + 1)
+        self.assertEqual(machine.consignee, 'ООО Новый получатель')
+
+
+class RowClientTests(TestCase):
+    """Клиент в ТО и рекламациях совпадает с клиентом машины при любом пути записи"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=31, prefix='R', clients=3).generate(10)
+        cls.machine = Machine.objects.annotate(rows=Count('technical_services')).filter(rows__gt=0).first()
+        cls.other = User.objects.exclude(pk=cls.machine.client_id).filter(role='client').first()
+
+    def assertClientsMatch(self):
+        for model in (TechnicalService, Reclamation):
+            with self.subTest(model=model.__name__):
+                self.assertTrue(model.objects.exists())
+                self.assertFalse(model.objects.exclude(client=F('machine__client')).exists())
+
+    def test_generated_fleet(self):
+        self.assertClientsMatch()
+
+    def test_machine_client_change(self):
+        self.machine.client = self.other
+        self.machine.save()
+        self.assertTrue(TechnicalService.objects.filter(machine=self.machine, client=self.other).exists())
+        self.assertClientsMatch()
+        Machine.objects.filter(pk=self.machine.pk).update(client=User.objects.filter(role='client').last())
+        self.assertClientsMatch()
+
+    def test_import_client_change(self):
+        def edit(frame):
+            frame.loc[frame['Зав. № машины'] == self.machine.serial_number, 'Покупатель'] = self.other.username
+
+        with tempfile.TemporaryDirectory() as directory:
+            export_tables(directory)
+            edit_table(directory, 'machines', edit)
+            run_import(directory)
+        self.assertEqual(Machine.objects.get(pk=self.machine.pk).client, self.other)
+        self.assertClientsMatch()
+
+    def test_batch_write(self):
+        manager = User.objects.create_user('row-client-manager', role='manager')
+        result = TechnicalServiceBatchWriter(manager).write([{
+            'serial_number': self.machine.serial_number,
+            'service_type': ServiceType.objects.order_by('pk').first().name,
+            'service_date': '2000-01-03',
+            'operating_hours': 100,
+            'work_order_number': 'ЗН-1',
+            'work_order_date': '2000-01-03',
+        }])
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(
+            TechnicalService.objects.get(machine=self.machine, service_date=date(2000, 1, 3)).client_id,
+            self.machine.client_id,
+        )
+
+
+def write_workbook(directory):
+    """Книга Excel в раскладке заводской выгрузки из CSV export_tables; -> путь"""
+    path = os.path.join(directory, 'fleet.xlsx')
+    with pd.ExcelWriter(path) as writer:
+        for name, (sheet, header, _) in SHEETS.items():
+            frame = pd.read_csv(os.path.join(directory, f'{name}.csv'), dtype='string')
+            frame.to_excel(writer, sheet_name=sheet if isinstance(sheet, str) else name, startrow=header, index=False)
+    return path
+
+
+class StreamImportTests(TestCase):
+    """import_data --stream читает книгу пакетами и пишет то же, что обычный импорт"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=23, prefix='T').generate(8)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        export_tables(self.directory)
+        self.workbook = write_workbook(self.directory)
+
+    def test_chunks_match_whole_sheet(self):
+        for name in SHEETS:
+            with self.subTest(sheet=name):
+                records = read_records(self.workbook, name)
+                chunks = list(iter_record_chunks(self.workbook, name, 7))
+                self.assertEqual([record for chunk in chunks for record in chunk], records)
+                self.assertTrue(all(len(chunk) <= 7 for chunk in chunks))
+                self.assertEqual(count_records(self.workbook, name), len(records))
+
+    def test_stream_import_matches_plain_import(self):
+        fields = ('machine__serial_number', 'service_type__name', 'service_date', 'operating_hours')
+
+        def imported(*args):
+            TechnicalService.objects.all().delete()
+            run_import(self.workbook, '--full', *args)
+            return list(TechnicalService.objects.order_by(*fields).values_list(*fields))
+
+        plain = imported()
+        self.assertTrue(plain)
+        self.assertEqual(imported('--stream', '--chunk-size', '7'), plain)
+        self.assertGreater(ImportChunk.objects.filter(run=ImportRun.objects.latest('pk'), sheet='services').count(), 1)
+
+
+class IncrementalImportTests(TestCase):
+    """Повторный импорт пропускает строки с тем же хэшем содержимого"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=29, prefix='H').generate(8)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        export_tables(self.directory)
+        run_import(self.directory)
+
+    def test_unchanged_rows_are_not_rewritten(self):
+        machines = Machine.objects.count()
+        services = TechnicalService.objects.count()
+        written = dict(TechnicalService.objects.values_list('pk', 'updated_at'))
+        report = run_import(self.directory)
+        self.assertIn(f'Машины: новых 0, изменено 0, без изменений {machines}, нет в файле 0', report)
+        self.assertIn(f'ТО: новых 0, изменено 0, без изменений {services}, нет в файле 0', report)
+        self.assertEqual(dict(TechnicalService.objects.values_list('pk', 'updated_at')), written)
+
+    def test_changed_and_missing_rows(self):
+        services = TechnicalService.objects.count()
+
+        def edit(frame):
+            frame.loc[0, 'Наработка, м/час'] = str(int(frame.loc[0, 'Наработка, м/час']) + 1)
+            frame.drop(frame.index[-1], inplace=True)
+
+        edit_table(self.directory, 'services', edit)
+        report = run_import(self.directory)
+        self.assertIn(f'ТО: новых 0, изменено 1, без изменений {services - 2}, нет в файле 1', report)
+
+    def test_full_rewrites_every_row(self):
+        services = TechnicalService.objects.count()
+        report = run_import(self.directory, '--full')
+        self.assertIn(f'ТО: новых 0, изменено {services}, без изменений 0', report)
+
+
+class ResumeImportTests(TestCase):
+    """import_data --resume продолжает прерванный запуск с первого незаписанного пакета"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=31, prefix='C').generate(8)
+
+    def test_resume_after_failure(self):
+        import_services = BulkImporter.import_services
+        calls = []
+
+        def fail_second_chunk(importer, records):
+            calls.append(len(records))
+            if len(calls) == 2:
+                raise RuntimeError('сбой записи')
+            return import_services(importer, records)
+
+        expected = TechnicalService.objects.count()
+        with tempfile.TemporaryDirectory() as directory:
+            export_tables(directory)
+            TechnicalService.objects.all().delete()
+            with mock.patch.object(BulkImporter, 'import_services', autospec=True, side_effect=fail_second_chunk):
+                with self.assertRaises(RuntimeError):
+                    call_command(
+                        'import_data', directory, '--stream', '--chunk-size', '50',
+                        stdout=StringIO(), stderr=StringIO(),
+                    )
+            run = ImportRun.objects.get()
+            self.assertEqual(run.status, ImportRun.FAILED)
+            self.assertEqual(list(run.chunks.filter(sheet='services').values_list('index', flat=True)), [0])
+            self.assertEqual(TechnicalService.objects.count(), 50)
+
+            output = StringIO()
+            with mock.patch.object(BulkImporter, 'import_services', autospec=True, side_effect=import_services):
+                call_command('import_data', '--resume', run.pk, stdout=output)
+                # Записанный пакет не пишется повторно
+                self.assertEqual(BulkImporter.import_services.call_count, -(-expected // 50) - 1)
+        run.refresh_from_db()
+        self.assertEqual(run.status, ImportRun.DONE)
+        self.assertEqual(TechnicalService.objects.count(), expected)
+        self.assertIn('ТО: новых', output.getvalue())
+        with self.assertRaisesMessage(CommandError, 'уже завершён'):
+            call_command('import_data', '--resume', run.pk, stdout=StringIO())
+
+
+@skipIf(pq is None, 'нужен pyarrow')
+class TableImportTests(TestCase):
+    """CSV и Parquet дают те же записи, что книга Excel"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=37, prefix='Q').generate(6)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        export_tables(self.directory)
+
+    def write_parquet(self, name):
+        """Parquet с типизированными колонками, как в выгрузке ERP"""
+        frame = pd.read_csv(os.path.join(self.directory, f'{name}.csv'), dtype='string')
+        for _, names, _, kind in SHEETS[name][2]:
+            if names[0] not in frame:
+                continue
+            if kind == 'date':
+                frame[names[0]] = pd.to_datetime(frame[names[0]], format='%d.%m.%Y')
+            elif kind == 'int':
+                frame[names[0]] = frame[names[0]].astype('Int64')
+        path = os.path.join(self.directory, 'parquet', f'{name}.parquet')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        frame.to_parquet(path, index=False)
+        return path
+
+    def test_formats_read_the_same_records(self):
+        workbook = write_workbook(self.directory)
+        semicolon = os.path.join(self.directory, 'semicolon')
+        os.makedirs(semicolon)
+        for name in SHEETS:
+            with self.subTest(sheet=name):
+                csv_path = os.path.join(self.directory, f'{name}.csv')
+                frame = pd.read_csv(csv_path, dtype='string')
+                frame.to_csv(os.path.join(semicolon, f'{name}.csv'), sep=';', index=False)
+                records = read_records(workbook, name)
+                self.assertTrue(records)
+                self.assertEqual(read_records(csv_path, name), records)
+                self.assertEqual(read_records(semicolon, name), records)
+                self.assertEqual(read_records(self.write_parquet(name), name), records)
+                self.assertEqual(count_records(csv_path, name), len(records))
+
+    def test_parquet_import(self):
+        for name in SHEETS:
+            self.write_parquet(name)
+        fields = ('machine__serial_number', 'failure_date', 'operating_hours', 'failure_node__name')
+        expected = list(Reclamation.objects.order_by(*fields).values_list(*fields))
+        Reclamation.objects.all().delete()
+        run_import(os.path.join(self.directory, 'parquet'), '--stream', '--chunk-size', '5')
+        self.assertEqual(list(Reclamation.objects.order_by(*fields).values_list(*fields)), expected)
+
+    def test_table_name_is_checked(self):
+        path = os.path.join(self.directory, 'fleet.csv')
+        os.rename(os.path.join(self.directory, 'machines.csv'), path)
+        with self.assertRaisesMessage(CommandError, 'должен называться одним из'):
+            run_import(path)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ExportTests(TestCase):
+    """Выгрузка списков: те же фильтры и ограничения по роли, что и в списке"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=41, prefix='E', clients=3).generate(8)
+        cls.machine = Machine.objects.order_by('pk').first()
+        cls.user = cls.machine.client
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def export(self, name, export_format, **params):
+        response = self.client.get(reverse(f'monitoring:{name}_export', args=[export_format]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return b''.join(response.streaming_content)
+
+    def test_csv_rows_are_scoped_and_filtered(self):
+        visible = TechnicalService.get_visible_to_user(self.user)
+        content = self.export('technical_service', 'csv').decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(content), delimiter=';'))
+        self.assertEqual(rows[0][0], 'Зав. № машины')
+        self.assertEqual(len(rows) - 1, visible.count())
+        self.assertLess(visible.count(), TechnicalService.objects.count())
+
+        serial = self.machine.serial_number
+        content = self.export('technical_service', 'csv', machine_serial_number=serial).decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(content), delimiter=';'))[1:]
+        self.assertEqual(len(rows), visible.filter(machine=self.machine).count())
+        self.assertEqual({row[0] for row in rows}, {serial})
+
+    def test_xlsx_matches_visible_machines(self):
+        workbook = load_workbook(io.BytesIO(self.export('machine', 'xlsx')), read_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(rows[0][0], 'Зав. № машины')
+        self.assertEqual(
+            sorted(row[0] for row in rows[1:]),
+            sorted(self.user.get_accessible_machines().values_list('serial_number', flat=True)),
+        )
+
+    def test_large_xlsx_is_refused(self):
+        serial = self.machine.serial_number
+        with mock.patch('monitoring.exports.XLSX_MAX_ROWS', 3):
+            response = self.client.get(
+                reverse('monitoring:technical_service_export', args=['xlsx']), {'machine_serial_number': serial},
+                follow=True,
+            )
+            self.assertRedirects(
+                response, f"{reverse('monitoring:technical_service_list')}?machine_serial_number={serial}"
+            )
+            self.assertContains(response, 'выгрузите CSV')
+            # CSV не ограничен
+            content = self.export('technical_service', 'csv', machine_serial_number=serial).decode('utf-8-sig')
+        self.assertGreater(len(content.splitlines()) - 1, 3)
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('monitoring:reclamation_export', args=['pdf']))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FleetDumpTests(TestCase):
+    """NDJSON-выгрузка парка: строка на видимую машину, вложенные записи - по видимости роли"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=43, prefix='N', service_companies=2).generate(9)
+        cls.user = Machine.objects.filter(service_company__isnull=False).order_by('pk').first().service_company
+
+    def test_lines_follow_visibility(self):
+        headers = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+        response = self.client.get(reverse('monitoring:api_fleet_dump'), headers=headers)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            [line['id'] for line in lines],
+            list(self.user.get_accessible_machines().order_by('pk').values_list('pk', flat=True)),
+        )
+        services = TechnicalService.get_visible_to_user(self.user)
+        for line in lines:
+            self.assertEqual(
+                [service['id'] for service in line['technical_services']],
+                list(services.filter(machine=line['id']).order_by('service_date', 'pk').values_list('pk', flat=True)),
+            )
+            for reclamation in line['reclamations']:
+                self.assertNotIn('machine', reclamation)
+
+    def test_chunks_use_constant_queries(self):
+        machines = self.user.get_accessible_machines().count()
+        # Первый проход заодно загружает справочники в кеш процесса
+        whole = b''.join(fleet_lines(self.user))
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(fleet_lines(self.user, chunk_size=2))
+        self.assertEqual(len(chunks), -(-machines // 2))
+        # Машины одним курсором, ТО и рекламации - на каждый пакет
+        self.assertEqual(len(queries), 1 + 2 * len(chunks))
+        self.assertEqual(b''.join(chunks), whole)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CachedAuthenticationTests(TestCase):
+    """Токен и пользователь из кеша; сохранение пользователя и удаление токена сбрасывают кеш"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('auth-client', role='client')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        # id пользователей повторяются между тестами - кеш не должен пережить тест
+        self.addCleanup(cache.clear)
+        self.authentication = CachedTokenAuthentication()
+
+    def test_warm_token_needs_no_queries(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual((user, token), (self.user, self.token))
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedAuthenticationBackend().get_user(self.user.pk), self.user)
+
+    def test_deactivated_user_and_deleted_token(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+        self.assertIsNone(CachedAuthenticationBackend().get_user(self.user.pk))
+
+        self.user.is_active = True
+        self.user.save()
+        self.authentication.authenticate_credentials(self.token.key)
+        Token.objects.get(key=self.token.key).delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_user_save_checks_username_without_select(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Иван'
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT')])
+        user.username = 'auth-renamed'
+        with self.assertRaisesMessage(ValueError, 'Изменение логина запрещено'):
+            user.save()
+        # Собранный не из БД объект сверяется с БД
+        detached = User(pk=self.user.pk, username='auth-renamed')
+        with self.assertRaisesMessage(ValueError, 'Изменение логина запрещено'):
+            detached.save()
+
+
+@override_settings(
+    ROOT_URLCONF='silant_core.urls_asgi',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class AsyncViewTests(TestCase):
+    """Асинхронные страницы и списки API отдают то же, что синхронные"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=47, prefix='A', clients=2, service_companies=2).generate(8)
+        machine = Machine.objects.filter(service_company__isnull=False).order_by('pk').first()
+        cls.machine = machine
+        cls.users = {'client': machine.client, 'service': machine.service_company}
+        cls.users['manager'] = User.objects.create_user('async-manager', role='manager')
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def sync_get(self, url, **kwargs):
+        with override_settings(ROOT_URLCONF='silant_core.urls'):
+            return self.client.get(url, **kwargs)
+
+    def test_machine_detail_reclamations_without_join(self):
+        # Узел и способ восстановления - из кеша справочников, сервисная компания рекламации не выводится
+        url = reverse('monitoring:machine_detail', args=[self.machine.pk])
+        self.client.force_login(self.users['manager'])
+        for get in (self.sync_get, self.client.get):
+            with self.subTest(get=get.__name__):
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(get(url).status_code, 200)
+                selects = [query['sql'] for query in queries if 'FROM "monitoring_reclamation"' in query['sql']]
+                self.assertTrue(selects)
+                self.assertFalse([sql for sql in selects if 'JOIN' in sql])
+
+    def test_api_lists_match_sync(self):
+        for role, user in self.users.items():
+            headers = {'Authorization': f'Token {Token.objects.get_or_create(user=user)[0].key}'}
+            for url in ('/api/machines/', '/api/technical-services/', '/api/reclamations/'):
+                with self.subTest(role=role, url=url):
+                    expected = self.sync_get(url, headers=headers)
+                    self.assertEqual(expected.status_code, 200)
+                    response = self.client.get(url, headers=headers)
+                    self.assertIsNone(response.resolver_match.url_name)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.json(), expected.json())
+                    cursor = expected.json()['next']
+                    if cursor:
+                        self.assertEqual(
+                            self.client.get(cursor, headers=headers).json(),
+                            self.sync_get(cursor, headers=headers).json(),
+                        )
+
+    def test_api_requires_token(self):
+        response = self.client.get('/api/machines/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        response = self.client.get('/api/machines/', headers={'Authorization': 'Token missing'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_pages_match_sync(self):
+        pages = {
+            reverse('monitoring:machine_list'): lambda context: [machine.pk for machine in context['machine_list']],
+            reverse('monitoring:machine_detail', args=[self.machine.pk]): lambda context: [
+                row['object'].pk for row in context['to_with_permissions']
+            ],
+        }
+        for role, user in self.users.items():
+            self.client.force_login(user)
+            for url, rows in pages.items():
+                with self.subTest(role=role, url=url):
+                    expected = self.sync_get(url)
+                    response = self.client.get(url)
+                    # Асинхронные маршруты без имён - ответ пришёл не от синхронного view
+                    self.assertIsNone(response.resolver_match.url_name)
+                    self.assertEqual(response.status_code, expected.status_code)
+                    self.assertEqual(rows(response.context), rows(expected.context))
+
+    async def test_search_redirects_signed_in_user(self):
+        await self.async_client.aforce_login(self.users['client'])
+        response = await self.async_client.get('/search/')
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ReliabilityReportTests(TestCase):
+    """Векторный расчёт надёжности совпадает с расчётом по каждой группе отдельно"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=53, prefix='M').generate(40)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_fit_recovers_known_distribution(self):
+        rng = np.random.default_rng(0)
+        x = 1000 * rng.weibull(2.0, 5000)
+        shape, scale = fit_weibull(x, np.ones(x.size), np.zeros(x.size, dtype=int), 1, np.ones(x.size))
+        self.assertAlmostEqual(shape[0], 2.0, delta=0.1)
+        self.assertAlmostEqual(scale[0], 1000, delta=30)
+
+    def test_groups_fit_independently(self):
+        rng = np.random.default_rng(1)
+        samples = [1000 * rng.weibull(1.5, 300), 500 * rng.weibull(3.0, 200), np.array([100.0])]
+        x = np.concatenate(samples)
+        failed = (rng.random(x.size) < 0.8).astype(float)
+        group = np.repeat(np.arange(len(samples)), [sample.size for sample in samples])
+        shape, scale = fit_weibull(x, failed, group, len(samples), np.ones(x.size))
+        for index in range(2):
+            alone = group == index
+            expected = fit_weibull(x[alone], failed[alone], np.zeros(alone.sum(), dtype=int), 1, np.ones(alone.sum()))
+            self.assertAlmostEqual(shape[index], expected[0][0], places=4)
+            self.assertAlmostEqual(scale[index] / expected[1][0], 1, places=4)
+        # Один отказ - оценки нет
+        self.assertTrue(np.isnan(shape[2]))
+
+    def explicit_sample(self, node_id):
+        """Выборка узла отказа, собранная по машинам в цикле"""
+        x, failed = [], []
+        for machine in Machine.objects.order_by('pk'):
+            hours = sorted(machine.reclamations.values_list('operating_hours', flat=True))
+            exposure = max([machine.current_hours, *hours])
+            node_hours = sorted(
+                machine.reclamations.filter(failure_node_id=node_id).values_list('operating_hours', flat=True)
+            )
+            previous = 0
+            for value in node_hours:
+                x.append(max(value - previous, 1))
+                failed.append(1.0)
+                previous = value
+            if exposure - previous > 0:
+                x.append(exposure - previous)
+                failed.append(0.0)
+        return np.array(x, dtype=float), np.array(failed)
+
+    def test_failure_node_matches_explicit_sample(self):
+        report = reliability_report('failure_node')
+        self.assertEqual(report['failures'], Reclamation.objects.count())
+        self.assertEqual(sum(row['failures'] for row in report['results']), Reclamation.objects.count())
+        row = next(row for row in report['results'] if row['weibull_shape'] is not None)
+        x, failed = self.explicit_sample(row['key'])
+        shape, scale = fit_weibull(x, failed, np.zeros(x.size, dtype=int), 1, np.ones(x.size))
+        self.assertAlmostEqual(row['weibull_shape'], round(float(shape[0]), 3), delta=0.002)
+        self.assertAlmostEqual(row['weibull_scale'] / float(scale[0]), 1, places=3)
+
+    def test_machine_model_mtbf_and_cache(self):
+        report = reliability_report('machine_model')
+        row = report['results'][0]
+        machines = Machine.objects.filter(machine_model_id=row['key'])
+        self.assertEqual(row['machines'], machines.count())
+        self.assertEqual(row['failures'], Reclamation.objects.filter(machine__in=machines).count())
+        self.assertAlmostEqual(row['mtbf_hours'], row['exposure_hours'] / row['failures'], delta=0.1)
+
+        with self.assertNumQueries(3):
+            # Только сверка версии данных
+            self.assertEqual(reliability_report('machine_model'), report)
+        reclamation = Reclamation.objects.filter(machine__in=machines).first()
+        reclamation.pk = None
+        reclamation.failure_date -= timedelta(days=1)
+        reclamation.save()
+        fresh = {item['key']: item for item in reliability_report('machine_model')['results']}
+        self.assertEqual(fresh[row['key']]['failures'], row['failures'] + 1)
+
+
+class FleetGeneratorTests(TestCase):
+    """Одно зерно и одна дата - один и тот же парк"""
+
+    def fleet(self, prefix, **kwargs):
+        """Парк без id и префикса - то, что должно совпасть"""
+        FleetGenerator(prefix=prefix, today=date(2025, 6, 1), **kwargs).generate(12)
+        tag = f'{prefix.lower()}-'
+        machines = Machine.objects.filter(serial_number__startswith=prefix).order_by('serial_number')
+        return [
+            (
+                machine.serial_number.removeprefix(prefix), machine.machine_model.name, machine.engine_model.name,
+                machine.shipment_date, machine.current_hours, machine.equipment,
+                machine.client.username.removeprefix(tag),
+                machine.service_company.username.removeprefix(tag) if machine.service_company else None,
+                list(machine.components.order_by('name').values_list('name', 'install_date', 'current_hours')),
+                [
+                    (*service[:3], service[3].removeprefix(prefix))
+                    for service in machine.technical_services.order_by('service_date').values_list(
+                        'service_type__name', 'service_date', 'operating_hours', 'work_order_number'
+                    )
+                ],
+                list(machine.reclamations.order_by('failure_date').values_list(
+                    'failure_date', 'failure_node__name', 'operating_hours', 'recovery_date'
+                )),
+                machine.maintenance_history.count(),
+            )
+            for machine in machines
+        ]
+
+    def test_same_seed_same_fleet(self):
+        fleet = self.fleet('G', seed=7)
+        self.assertEqual(self.fleet('H', seed=7, batch_size=5), fleet)
+        self.assertNotEqual(self.fleet('K', seed=8), fleet)
+        # Сравнивались не пустые машины: у каждой есть ТО
+        self.assertTrue(all(machine[9] for machine in fleet))
+
+    def test_command_rejects_used_prefix(self):
+        call_command('generate_fleet', '--machines', '2', '--prefix', 'GF', stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, 'уже есть парк'):
+            call_command('generate_fleet', '--machines', '2', '--prefix', 'GF', stdout=StringIO())
+        self.assertEqual(Machine.objects.filter(serial_number__startswith='GF').count(), 2)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ReclamationFormTests(TestCase):
+    """Вторая рекламация машины на ту же дату отказа - ошибка формы, а не IntegrityError"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=59, prefix='F').generate(10)
+        machine = Machine.objects.annotate(reclamation_count=Count('reclamations')).filter(
+            reclamation_count__gte=2
+        ).order_by('pk').first()
+        cls.reclamation, cls.sibling = machine.reclamations.order_by('pk')[:2]
+        cls.manager = User.objects.create_user('form-manager', role='manager')
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(self.manager)
+
+    def form_data(self, reclamation, **changes):
+        data = {
+            'failure_date': reclamation.failure_date.isoformat(),
+            'operating_hours': reclamation.operating_hours,
+            'failure_node': reclamation.failure_node_id,
+            'failure_description': 'Отказ',
+            'recovery_method': reclamation.recovery_method_id,
+            'spare_parts_used': '',
+            'recovery_date': reclamation.recovery_date.isoformat(),
+            'service_company': '',
+        }
+        return {**data, **changes}
+
+    def test_duplicate_on_create(self):
+        count = Reclamation.objects.count()
+        response = self.client.post(
+            reverse('monitoring:reclamation_create', args=[self.reclamation.machine_id]),
+            self.form_data(self.reclamation),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response.context['form'], 'failure_date', 'У этой машины уже есть рекламация с такой датой отказа'
+        )
+        self.assertEqual(Reclamation.objects.count(), count)
+
+        free_date = self.reclamation.failure_date - timedelta(days=1)
+        while Reclamation.objects.filter(machine=self.reclamation.machine, failure_date=free_date).exists():
+            free_date -= timedelta(days=1)
+        response = self.client.post(
+            reverse('monitoring:reclamation_create', args=[self.reclamation.machine_id]),
+            self.form_data(self.reclamation, failure_date=free_date.isoformat(), recovery_date=free_date.isoformat()),
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Reclamation.objects.count(), count + 1)
+
+    def test_duplicate_on_update(self):
+        sibling = self.sibling
+        url = reverse('monitoring:reclamation_edit', args=[sibling.pk])
+        duplicate = self.form_data(sibling, failure_date=self.reclamation.failure_date.isoformat())
+        response = self.client.post(url, duplicate)
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response.context['form'], 'failure_date', 'У этой машины уже есть рекламация с такой датой отказа'
+        )
+        # Своя дата отказа - не дубль
+        self.assertEqual(self.client.post(url, self.form_data(sibling)).status_code, 302)
+
+
+class UniqueDatesMigrationTests(TransactionTestCase):
+    """Миграция ограничений дат останавливается на повторах и перечисляет их"""
+
+    before = [('monitoring', '0011_machinesummary')]
+    after = [('monitoring', '0012_unique_service_and_reclamation_dates')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_are_reported(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        references = {
+            f'{name}_id': apps.get_model('monitoring', model).objects.create(name=f'Миграция {name}').pk
+            for name, model in (
+                ('machine_model', 'MachineModel'), ('engine_model', 'EngineModel'),
+                ('transmission_model', 'TransmissionModel'), ('drive_axle_model', 'DriveAxleModel'),
+                ('steering_axle_model', 'SteeringAxleModel'),
+            )
+        }
+        client = apps.get_model('monitoring', 'User').objects.create(username='migration-client', role='client')
+        machine = apps.get_model('monitoring', 'Machine').objects.create(
+            serial_number='MIG-1', shipment_date=date(2024, 1, 1), client_id=client.pk, **references
+        )
+        service_type = apps.get_model('monitoring', 'ServiceType').objects.create(name='Миграция ТО')
+        services = [
+            apps.get_model('monitoring', 'TechnicalService').objects.create(
+                machine=machine, service_type=service_type, service_date=date(2024, 5, 1), operating_hours=hours,
+                work_order_date=date(2024, 5, 1),
+            )
+            for hours in (100, 110)
+        ]
+
+        executor = MigrationExecutor(connection)
+        message = f'ТО: машина MIG-1, 2024-05-01 - id {services[0].pk}, {services[1].pk}'
+        with self.assertRaisesMessage(RuntimeError, message):
+            executor.migrate(self.after)
+
+        services[1].delete()
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+
+
+class StatusAnnotationTests(TestCase):
+    """Статусы из with_status() совпадают со свойствами, которые считают их по записям"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=61, prefix='B').generate(2)
+        cls.machine = Machine.objects.order_by('pk').first()
+        cls.machine.components.all().delete()
+        cls.machine.maintenance_history.all().delete()
+
+    def assertStatusMatches(self):
+        annotated = Machine.objects.with_status().get(pk=self.machine.pk)
+        plain = Machine.objects.get(pk=self.machine.pk)
+        self.assertEqual(annotated.requires_maintenance, plain.requires_maintenance)
+        self.assertEqual(annotated.in_service, plain.in_service)
+        return plain
+
+    def test_wear_boundary(self):
+        component = Component.objects.create(
+            machine=self.machine, name='Фильтр', part_number='F-1', lifetime_hours=1, current_hours=0,
+            install_date=date(2024, 1, 1),
+        )
+        # 85% - ещё нет, 86% - уже да; доли, на которых легко ошибиться на процент
+        for lifetime in (0, 1, 7, 50, 100, 333, 1000, 4999):
+            boundary = -(-86 * lifetime // 100)
+            for current in {0, boundary - 1, boundary, boundary + 1, 85 * lifetime // 100, lifetime, 2 * lifetime}:
+                if current < 0:
+                    continue
+                with self.subTest(lifetime=lifetime, current=current):
+                    Component.objects.filter(pk=component.pk).update(lifetime_hours=lifetime, current_hours=current)
+                    plain = self.assertStatusMatches()
+                    self.assertEqual(plain.requires_maintenance, lifetime > 0 and current * 100 >= 86 * lifetime)
+
+    def test_open_and_closed_maintenance(self):
+        started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.assertFalse(self.assertStatusMatches().in_service)
+        closed = Maintenance.objects.create(
+            machine=self.machine, type='repair', start_date=started, end_date=started + timedelta(days=3),
+            description='Ремонт',
+        )
+        self.assertFalse(self.assertStatusMatches().in_service)
+        Maintenance.objects.create(machine=self.machine, type='repair', start_date=started, description='Ремонт')
+        self.assertTrue(self.assertStatusMatches().in_service)
+        closed.delete()
+        self.assertTrue(self.assertStatusMatches().in_service)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ApiListTests(TestCase):
+    """Списки API: ?fields= сужает ответ и SELECT, число запросов не зависит от размера страницы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        FleetGenerator(seed=67, prefix='I').generate(10)
+        cls.user = User.objects.create_user('api-manager', role='manager')
+        cls.headers = {'Authorization': f'Token {Token.objects.create(user=cls.user).key}'}
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def get(self, url, **params):
+        return self.client.get(url, params, headers=self.headers)
+
+    def test_sparse_fieldset(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get('/api/technical-services/', fields='id,service_date')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertTrue(results)
+        self.assertEqual({key for row in results for key in row}, {'id', 'service_date'})
+        select = next(query['sql'] for query in queries if 'FROM "monitoring_technicalservice"' in query['sql'])
+        self.assertIn('"service_date"', select)
+        self.assertNotIn('"operating_hours"', select)
+        self.assertNotIn('"work_order_number"', select)
+
+    def test_unknown_field(self):
+        response = self.get('/api/machines/', fields='id,no_such_field')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('no_such_field', response.json()['fields'])
+
+    def test_queries_do_not_grow_with_page_size(self):
+        lists = {
+            '/api/machines/': Machine,
+            '/api/technical-services/': TechnicalService,
+            '/api/reclamations/': Reclamation,
+        }
+        for url, model in lists.items():
+            total = model.objects.count()
+            # Первый запрос прогревает кеш токена и справочников
+            self.get(url)
+            for page_size in (5, 200):
+                with self.subTest(url=url, page_size=page_size):
+                    # Токен, пользователь и названия справочников - из кеша, запрос - только сама страница
+                    with self.assertNumQueries(1):
+                        response = self.get(url, page_size=page_size)
+                    self.assertEqual(len(response.json()['results']), min(page_size, total))
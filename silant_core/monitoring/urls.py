@@ -1,6 +1,8 @@
 # monitoring/urls.py
-from django.urls import path
-from . import views
+from django.urls import include, path
+from rest_framework.authtoken.views import obtain_auth_token
+from rest_framework.routers import DefaultRouter
+from . import views, views_api
 from .utils import role_required
 from .views import (
     CustomLoginView,
@@ -11,12 +13,29 @@ from .views import (
 
 app_name = 'monitoring'
 
+router = DefaultRouter()
+router.register('machines', views_api.MachineViewSet, basename='api-machine')
+router.register('technical-services', views_api.TechnicalServiceViewSet, basename='api-technical-service')
+router.register('reclamations', views_api.ReclamationViewSet, basename='api-reclamation')
+router.register(
+    'maintenance-forecasts', views_api.MaintenanceForecastViewSet, basename='api-maintenance-forecast'
+)
+router.register(
+    'analytics/reclamation-rollup', views_api.ReclamationRollupViewSet, basename='api-reclamation-rollup'
+)
+for prefix, viewset in views_api.REFERENCE_VIEWSETS:
+    router.register(f'references/{prefix}', viewset, basename=f'api-{prefix}')
+
 urlpatterns = [
     # Машины
     path('machines/',
          role_required(['client', 'service', 'manager'])(views.MachineListView.as_view()),
          name='machine_list'),
 
+    path('machines/export/<slug:export_format>/',
+         role_required(['client', 'service', 'manager'])(views.MachineExportView.as_view()),
+         name='machine_export'),
+
     path('machine/<int:pk>/',
          role_required(['client', 'service', 'manager'])(views.MachineDetailView.as_view()),
          name='machine_detail'),
@@ -36,6 +55,14 @@ urlpatterns = [
          role_required(['client', 'service', 'manager'])(views.TechnicalServiceListView.as_view()),
          name='technical_service_list'),
 
+    path('technical-services/export/<slug:export_format>/',
+         role_required(['client', 'service', 'manager'])(views.TechnicalServiceExportView.as_view()),
+         name='technical_service_export'),
+
+    path('technical-services/due/',
+         role_required(['client', 'service', 'manager'])(views.MaintenanceDueView.as_view()),
+         name='maintenance_due'),
+
     path('technical-service/create/<int:machine_id>/',
          role_required(['client', 'service', 'manager'])(views.TechnicalServiceCreateView.as_view()),
          name='service_create'),
@@ -53,6 +80,14 @@ urlpatterns = [
          role_required(['client', 'service', 'manager'])(views.ReclamationListView.as_view()),
          name='reclamation_list'),
 
+    path('reclamations/export/<slug:export_format>/',
+         role_required(['client', 'service', 'manager'])(views.ReclamationExportView.as_view()),
+         name='reclamation_export'),
+
+    path('reclamations/analytics/',
+         role_required(['service', 'manager'])(views.ReclamationAnalyticsView.as_view()),
+         name='reclamation_analytics'),
+
     path('reclamation/create/<int:machine_id>/',
          role_required(['service', 'manager'])(views.ReclamationCreateView.as_view()),
          name='reclamation_create'),
@@ -77,4 +112,14 @@ urlpatterns = [
     path('references/<int:pk>/edit/',
          role_required(['manager'])(views.ReferenceUpdateView.as_view()),
          name='reference_edit'),
-]
\ No newline at end of file
+
+    # API
+    path('api/token/', obtain_auth_token, name='api_token'),
+    path('api/changes/', views_api.ChangesView.as_view(), name='api_changes'),
+    path('api/analytics/reclamations/', views_api.ReclamationAnalyticsView.as_view(),
+         name='api_reclamation_analytics'),
+    path('api/analytics/reliability/', views_api.ReliabilityReportView.as_view(),
+         name='api_reliability_report'),
+    path('api/fleet.ndjson', views_api.FleetDumpView.as_view(), name='api_fleet_dump'),
+    path('api/', include(router.urls)),
+]
@@ -0,0 +1,25 @@
+# monitoring/urls_async.py
+from django.urls import path
+
+from . import urls, views_async
+from .utils import role_required
+
+app_name = 'monitoring'
+
+# Асинхронные страницы и списки API стоят перед синхронными на тех же путях и
+# перехватывают GET; имена остаются у синхронных маршрутов, reverse не меняется.
+urlpatterns = [
+    path('machines/',
+         role_required(['client', 'service', 'manager'])(views_async.machine_list)),
+
+    path('machine/<int:pk>/',
+         role_required(['client', 'service', 'manager'])(views_async.machine_detail)),
+
+    path('search/', views_async.machine_search),
+
+    path('api/machines/', views_async.api_machine_list),
+    path('api/technical-services/', views_async.api_technical_service_list),
+    path('api/reclamations/', views_async.api_reclamation_list),
+
+    *urls.urlpatterns,
+]
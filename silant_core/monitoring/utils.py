@@ -1,13 +1,23 @@
 from django.contrib.auth.decorators import user_passes_test
 from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import HttpResponseForbidden
 
 def role_required(roles):
     def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            # Асинхронному view пользователь нужен без синхронного обращения к сессии
+            async def async_wrapper(request, *args, **kwargs):
+                request.user = await request.auser()
+                if request.user.is_authenticated and request.user.role in roles:
+                    return await view_func(request, *args, **kwargs)
+                return HttpResponseForbidden("Доступ запрещен")
+            return markcoroutinefunction(wraps(view_func)(async_wrapper))
+
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
             if request.user.is_authenticated and request.user.role in roles:
                 return view_func(request, *args, **kwargs)
             return HttpResponseForbidden("Доступ запрещен")
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
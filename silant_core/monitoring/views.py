@@ -1,3 +1,5 @@
+from datetime import date
+
 from django.views.generic import DetailView, ListView, UpdateView, CreateView, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.shortcuts import render, redirect, get_object_or_404
@@ -5,36 +7,82 @@ from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 from django_filters.views import FilterView
 from django.contrib.auth.views import LoginView, LogoutView
-from .models import Machine, User, TechnicalService, Reclamation, Reference
+from .models import (
+    Machine, MachineSummary, MaintenanceForecast, User, TechnicalService, Reclamation, ReclamationRollup, Reference
+)
 from .forms import MachineForm, TechnicalServiceForm, ReclamationForm, ReferenceForm
 from .filters import MachineFilter, TechnicalServiceFilter, ReclamationFilter
+from .pagination import CursorPaginationMixin, bounded_count
+from .references import attach_references
+from .replica import replica_reads
+from .exports import ExportMixin
+from .forecast import due_within
+from .rollup import downtime_report, filter_rollup
 
 # ======================== MACHINES ========================
-class MachineListView(LoginRequiredMixin, FilterView):
-    model = Machine
+@replica_reads
+class MachineListView(LoginRequiredMixin, CursorPaginationMixin, FilterView):
+    model = MachineSummary
     template_name = 'monitoring/machine_list.html'
     context_object_name = 'machine_list'
     filterset_class = MachineFilter
-    paginate_by = 10
+    cursor_ordering = ('-shipment_date', 'machine_id')
 
     def get_queryset(self):
-        queryset = self.request.user.get_accessible_machines().order_by('-shipment_date')
+        queryset = MachineSummary.get_visible_to_user(self.request.user).order_by('-shipment_date')
         self.filterset = self.filterset_class(self.request.GET, queryset=queryset)
         return self.filterset.qs
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['filter'] = self.filterset
-        context['total_machines'] = self.request.user.get_accessible_machines().count()
+        context['total_machines'] = bounded_count(
+            MachineSummary.get_visible_to_user(self.request.user), self.count_limit
+        )
+        context['total_is_exact'] = context['total_machines'] <= self.count_limit
         context['in_service'] = sum(1 for machine in context['object_list'] if machine.in_service)
         return context
 
 
+class MachineExportView(ExportMixin, MachineListView):
+    export_filename = 'machines'
+    list_url_name = 'monitoring:machine_list'
+    export_ordering = ('-shipment_date', 'machine_id')
+    export_columns = (
+        ('Зав. № машины', 'serial_number'),
+        ('Модель техники', 'machine_model_name'),
+        ('Модель двигателя', 'engine_model_name'),
+        ('Зав. № двигателя', 'engine_serial'),
+        ('Модель трансмиссии', 'transmission_model_name'),
+        ('Зав. № трансмиссии', 'transmission_serial'),
+        ('Модель ведущего моста', 'drive_axle_model_name'),
+        ('Зав. № ведущего моста', 'drive_axle_serial'),
+        ('Модель управляемого моста', 'steering_axle_model_name'),
+        ('Зав. № управляемого моста', 'steering_axle_serial'),
+        ('Дата отгрузки с завода', 'shipment_date'),
+        ('Наработка, м/час', 'current_hours'),
+        ('Покупатель', 'client_name'),
+        ('Сервисная компания', 'service_company_name'),
+        ('В сервисе', 'in_service'),
+        ('Последнее ТО', 'last_service_date'),
+        ('Рекламаций', 'reclamation_count'),
+    )
+    export_values = [key for _, key in export_columns]
+
+    def prepare_row(self, row):
+        row['in_service'] = 'да' if row['in_service'] else 'нет'
+        return row
+
+
+@replica_reads
 class MachineDetailView(LoginRequiredMixin, DetailView):
     model = Machine
     template_name = 'monitoring/machine_detail.html'
     context_object_name = 'machine'
 
+    def get_queryset(self):
+        return Machine.objects.with_status()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         machine = self.object
@@ -42,11 +90,14 @@ class MachineDetailView(LoginRequiredMixin, DetailView):
 
         # Проверка прав для добавления и редактирования
         context['can_edit_machine'] = user.can_edit_machines()
-        context['can_add_service'] = user.role in ['service', 'manager']
+        context['can_add_service'] = user.can_edit_technical_services()
         context['can_add_reclamation'] = user.role in ['service', 'manager']
 
         # ТО с проверкой прав редактирования
-        technical_services = TechnicalService.get_visible_to_user(user).filter(machine=machine).order_by('-service_date')
+        technical_services = list(
+            TechnicalService.get_visible_to_user(user).filter(machine=machine).order_by('-service_date')
+        )
+        attach_references(technical_services, 'service_type', 'service_organization')
         context['to_with_permissions'] = [
             {
                 'object': ts,
@@ -55,7 +106,10 @@ class MachineDetailView(LoginRequiredMixin, DetailView):
         ]
 
         # Рекламации с проверкой прав редактирования
-        reclamations = Reclamation.get_visible_to_user(user).filter(machine=machine).order_by('-failure_date')
+        reclamations = list(
+            Reclamation.get_visible_to_user(user).filter(machine=machine).order_by('-failure_date')
+        )
+        attach_references(reclamations, 'failure_node', 'recovery_method')
         context['reclamations_with_permissions'] = [
             {
                 'object': r,
@@ -97,6 +151,7 @@ class MachineUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         return reverse('monitoring:machine_detail', kwargs={'pk': self.object.pk})
 
 
+@replica_reads
 class MachineSearchView(TemplateView):
     template_name = 'monitoring/machine_search.html'
 
@@ -106,8 +161,8 @@ class MachineSearchView(TemplateView):
         machine = None
         if serial_number:
             try:
-                machine = Machine.objects.get(serial_number=serial_number)
-            except Machine.DoesNotExist:
+                machine = MachineSummary.objects.get(serial_number=serial_number)
+            except MachineSummary.DoesNotExist:
                 pass
         context['serial_number'] = serial_number
         context['machine'] = machine
@@ -138,16 +193,49 @@ class CustomLogoutView(LogoutView):
 
 
 # ======================== TECHNICAL SERVICE ========================
-class TechnicalServiceListView(LoginRequiredMixin, FilterView):
+@replica_reads
+class TechnicalServiceListView(LoginRequiredMixin, CursorPaginationMixin, FilterView):
     model = TechnicalService
     template_name = 'monitoring/technical_service_list.html'
     filterset_class = TechnicalServiceFilter
     context_object_name = 'technical_service_list'
+    cursor_ordering = ('-service_date', 'id')
+    cached_references = ('machine.machine_model', 'service_type', 'service_organization')
 
     def get_queryset(self):
-        return TechnicalService.get_visible_to_user(self.request.user).order_by('-service_date')
-
-
+        return TechnicalService.get_visible_to_user(self.request.user).select_related(
+            'machine'
+        ).order_by('-service_date')
+
+
+class TechnicalServiceExportView(ExportMixin, TechnicalServiceListView):
+    export_filename = 'technical_services'
+    list_url_name = 'monitoring:technical_service_list'
+    export_ordering = ('-service_date', 'id')
+    export_columns = (
+        ('Зав. № машины', 'machine__serial_number'),
+        ('Модель техники', 'machine__machine_model__name'),
+        ('Вид ТО', 'service_type__name'),
+        ('Дата проведения ТО', 'service_date'),
+        ('Наработка, м/час', 'operating_hours'),
+        ('№ заказ-наряда', 'work_order_number'),
+        ('Дата заказ-наряда', 'work_order_date'),
+        ('Организация, проводившая ТО', 'organization'),
+        ('Сервисная компания', 'service_company__username'),
+    )
+    export_values = (
+        'machine__serial_number', 'machine__machine_model__name', 'service_type__name',
+        'service_date', 'operating_hours', 'work_order_number', 'work_order_date',
+        'service_organization__name', 'service_organization_name', 'service_company__username',
+    )
+
+    def prepare_row(self, row):
+        # Организация из справочника или введённая текстом
+        row['organization'] = row['service_organization__name'] or row['service_organization_name']
+        return row
+
+
+@replica_reads
 class TechnicalServiceDetailView(LoginRequiredMixin, DetailView):
     model = TechnicalService
     template_name = 'monitoring/technical_service_detail.html'
@@ -160,7 +248,8 @@ class TechnicalServiceCreateView(LoginRequiredMixin, CreateView):
     template_name = 'monitoring/technical_service_form.html'
 
     def dispatch(self, request, *args, **kwargs):
-        if request.user.role not in ['service', 'manager']:
+        # Анонимного пользователя LoginRequiredMixin отправит на вход
+        if request.user.is_authenticated and not request.user.can_edit_technical_services():
             messages.error(request, "У вас нет прав для создания ТО")
             return redirect('monitoring:machine_list')
         return super().dispatch(request, *args, **kwargs)
@@ -206,15 +295,48 @@ class TechnicalServiceUpdateView(LoginRequiredMixin, UserPassesTestMixin, Update
         return reverse('monitoring:technical_service_detail', kwargs={'pk': self.object.pk})
 
 
+@replica_reads
+class MaintenanceDueView(LoginRequiredMixin, CursorPaginationMixin, ListView):
+    """ТО, ожидаемые по прогнозу в ближайшие ?days= дней, и просроченные"""
+    template_name = 'monitoring/maintenance_due.html'
+    context_object_name = 'forecast_list'
+    cursor_ordering = ('due_date', 'id')
+    cached_references = ('machine.machine_model', 'service_type')
+    default_days = 30
+    max_days = 365
+
+    def get_days(self):
+        try:
+            days = int(self.request.GET.get('days', self.default_days))
+        except ValueError:
+            days = self.default_days
+        return max(0, min(days, self.max_days))
+
+    def get_queryset(self):
+        forecasts = MaintenanceForecast.get_visible_to_user(self.request.user).select_related('machine')
+        return due_within(forecasts, self.get_days())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['days'] = self.get_days()
+        context['today'] = date.today()
+        return context
+
+
 # ======================== RECLAMATION ========================
-class ReclamationListView(LoginRequiredMixin, FilterView):
+@replica_reads
+class ReclamationListView(LoginRequiredMixin, CursorPaginationMixin, FilterView):
     model = Reclamation
     template_name = 'monitoring/reclamation_list.html'
     filterset_class = ReclamationFilter
     context_object_name = 'reclamation_list'
+    cursor_ordering = ('-failure_date', 'id')
+    cached_references = ('failure_node', 'recovery_method')
 
     def get_queryset(self):
-        return Reclamation.get_visible_to_user(self.request.user).order_by('-failure_date')
+        return Reclamation.get_visible_to_user(self.request.user).select_related(
+            'machine', 'service_company'
+        ).order_by('-failure_date')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -223,6 +345,62 @@ class ReclamationListView(LoginRequiredMixin, FilterView):
         return context
 
 
+class ReclamationExportView(ExportMixin, ReclamationListView):
+    export_filename = 'reclamations'
+    list_url_name = 'monitoring:reclamation_list'
+    export_ordering = ('-failure_date', 'id')
+    export_columns = (
+        ('Зав. № машины', 'machine__serial_number'),
+        ('Дата отказа', 'failure_date'),
+        ('Наработка, м/час', 'operating_hours'),
+        ('Узел отказа', 'failure_node__name'),
+        ('Описание отказа', 'failure_description'),
+        ('Способ восстановления', 'recovery_method__name'),
+        ('Используемые запасные части', 'spare_parts_used'),
+        ('Дата восстановления', 'recovery_date'),
+        ('Время простоя, дней', 'downtime'),
+        ('Сервисная компания', 'service_company__username'),
+    )
+    export_values = [key for _, key in export_columns if key != 'downtime']
+
+    def prepare_row(self, row):
+        row['downtime'] = (row['recovery_date'] - row['failure_date']).days
+        return row
+
+
+@replica_reads
+class ReclamationAnalyticsView(LoginRequiredMixin, TemplateView):
+    """Простои по рекламациям из свёртки ReclamationRollup, без чтения самих рекламаций"""
+    template_name = 'monitoring/reclamation_analytics.html'
+    dimensions = (
+        ('failure_node', 'Узел отказа'),
+        ('recovery_method', 'Способ восстановления'),
+        ('machine_model', 'Модель техники'),
+        ('service_company', 'Сервисная компания'),
+        ('month', 'Месяц'),
+    )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        params = self.request.GET
+        by = params.get('by')
+        if by not in dict(self.dimensions):
+            by = 'failure_node'
+        rollup = ReclamationRollup.get_visible_to_user(self.request.user)
+        try:
+            rollup = filter_rollup(rollup, {'from': params.get('from'), 'to': params.get('to')})
+            context['period_error'] = False
+        except ValueError:
+            context['period_error'] = True
+        context['by'] = by
+        context['dimensions'] = self.dimensions
+        context['period_from'] = params.get('from', '')
+        context['period_to'] = params.get('to', '')
+        context['report'] = downtime_report(rollup, by)
+        return context
+
+
+@replica_reads
 class ReclamationDetailView(LoginRequiredMixin, DetailView):
     model = Reclamation
     template_name = 'monitoring/reclamation_detail.html'
@@ -246,10 +424,11 @@ class ReclamationCreateView(LoginRequiredMixin, CreateView):
             return redirect('monitoring:machine_list')
         return super().dispatch(request, *args, **kwargs)
 
-    def form_valid(self, form):
-        machine_id = self.kwargs.get('machine_id')
-        form.instance.machine = get_object_or_404(Machine, pk=machine_id)
-        return super().form_valid(form)
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        # Машина нужна форме до проверки: по ней ищется рекламация с той же датой отказа
+        kwargs['instance'] = Reclamation(machine=get_object_or_404(Machine, pk=self.kwargs.get('machine_id')))
+        return kwargs
 
     def get_success_url(self):
         return reverse('monitoring:machine_detail', kwargs={'pk': self.object.machine.pk})
@@ -272,6 +451,7 @@ class ReclamationUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView)
 
 
 # ======================== REFERENCE ========================
+@replica_reads
 class ReferenceListView(LoginRequiredMixin, ListView):
     model = Reference
     template_name = 'monitoring/reference_list.html'
@@ -1,41 +1,255 @@
-from rest_framework import viewsets, permissions
+from django.http import StreamingHttpResponse
+from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from .batch import MAX_BATCH_SIZE, ReclamationBatchWriter, TechnicalServiceBatchWriter
+from .changes import MAX_PAGE_SIZE, PAGE_SIZE, InvalidChangesCursor, ResyncRequired, collect_changes
+from .dump import fleet_lines
+from .forecast import due_within
+from .models import MaintenanceForecast, Reclamation, ReclamationRollup, TechnicalService
+from .permissions import IsManager, IsService
+from .reliability import DIMENSIONS as RELIABILITY_DIMENSIONS, reliability_report
+from .replica import replica_reads
+from .rollup import DIMENSIONS, downtime_report, filter_rollup
+from .serializers import (
+    REFERENCE_MODELS, MachineSerializer, MaintenanceForecastSerializer, ReclamationRollupSerializer,
+    ReclamationSerializer, TechnicalServiceSerializer,
+    queryset_columns, reference_serializer
+)
+
+
+class ManagerPermission(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.can_edit_machines()
+
+
+class ReferenceEditPermission(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.method in permissions.SAFE_METHODS or request.user.can_edit_references()
 
-class MachineViewSet(viewsets.ModelViewSet):
-    serializer_class = MachineSerializer
+
+class TechnicalServiceCreatePermission(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.can_edit_technical_services()
+
+
+class ReclamationCreatePermission(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.can_edit_reclamations()
+
+
+class ServiceOrManagerPermission(permissions.BasePermission):
+    def has_object_permission(self, request, view, obj):
+        return obj.can_be_edited_by(request.user)
+
+
+class BatchWriteMixin:
+    """
+    POST .../bulk/ - список записей или {"records": [...]}. Ошибки
+    возвращаются по номеру записи, остальные записи сохраняются.
+    """
+    batch_writer_class = None
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        records = request.data
+        if isinstance(records, dict):
+            records = records.get('records')
+        if not isinstance(records, list):
+            return Response({'detail': "Ожидается список записей"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(records) > MAX_BATCH_SIZE:
+            return Response(
+                {'detail': f"Не больше {MAX_BATCH_SIZE} записей за запрос"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(self.batch_writer_class(request.user).write(records))
+
+
+@replica_reads
+class ColumnsViewSetMixin:
+    """
+    Списки и карточки читают только колонки полей ответа (с учётом ?fields=),
+    названия справочников - из кеша справочников процесса. Записи, видимые
+    пользователю, отдаёт get_base_queryset() наследника.
+    """
+    cursor_ordering = ('id',)
 
     def get_queryset(self):
+        queryset = self.get_base_queryset()
+        if self.request.method not in permissions.SAFE_METHODS:
+            return queryset
+        ordering = [name.lstrip('-') for name in self.cursor_ordering]
+        return queryset_columns(queryset, self.get_serializer(), extra=ordering)
+
+
+class MachineViewSet(ColumnsViewSetMixin, viewsets.ModelViewSet):
+    serializer_class = MachineSerializer
+    cursor_ordering = ('-shipment_date', 'id')
+
+    def get_base_queryset(self):
         return self.request.user.get_accessible_machines()
 
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'destroy', 'create']:
             permission_classes = [permissions.IsAuthenticated, ManagerPermission]
         else:
-            permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+            permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
 
-class TechnicalServiceViewSet(viewsets.ModelViewSet):
+class TechnicalServiceViewSet(BatchWriteMixin, ColumnsViewSetMixin, viewsets.ModelViewSet):
     serializer_class = TechnicalServiceSerializer
+    batch_writer_class = TechnicalServiceBatchWriter
+    cursor_ordering = ('-service_date', 'id')
 
-    def get_queryset(self):
+    def get_base_queryset(self):
         return TechnicalService.get_visible_to_user(self.request.user)
 
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'destroy']:
             permission_classes = [permissions.IsAuthenticated, ServiceOrManagerPermission]
-        elif self.action == 'create':
-            permission_classes = [permissions.IsAuthenticated, ClientOrServicePermission]
+        elif self.action in ['create', 'bulk']:
+            permission_classes = [permissions.IsAuthenticated, TechnicalServiceCreatePermission]
         else:
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
 
-class ManagerPermission(permissions.BasePermission):
-    def has_permission(self, request, view):
-        return request.user.can_edit_machines()
+class ReclamationViewSet(BatchWriteMixin, ColumnsViewSetMixin, viewsets.ModelViewSet):
+    serializer_class = ReclamationSerializer
+    batch_writer_class = ReclamationBatchWriter
+    cursor_ordering = ('-failure_date', 'id')
 
+    def get_base_queryset(self):
+        return Reclamation.get_visible_to_user(self.request.user)
 
-class ServiceOrManagerPermission(permissions.BasePermission):
-    def has_object_permission(self, request, view, obj):
-        return obj.can_be_edited_by(request.user)
\ No newline at end of file
+    def get_permissions(self):
+        if self.action in ['update', 'partial_update', 'destroy']:
+            permission_classes = [permissions.IsAuthenticated, ServiceOrManagerPermission]
+        elif self.action in ['create', 'bulk']:
+            permission_classes = [permissions.IsAuthenticated, ReclamationCreatePermission]
+        else:
+            permission_classes = [permissions.IsAuthenticated]
+        return [permission() for permission in permission_classes]
+
+
+class MaintenanceForecastViewSet(ColumnsViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Прогноз ТО по машинам пользователя. ?due_within=N - ТО в ближайшие N
+    дней вместе с просроченными, ?service_type= - id вида ТО.
+    """
+    serializer_class = MaintenanceForecastSerializer
+    cursor_ordering = ('due_date', 'id')
+
+    def get_base_queryset(self):
+        forecasts = MaintenanceForecast.get_visible_to_user(self.request.user)
+        params = self.request.query_params
+        try:
+            if params.get('due_within'):
+                forecasts = due_within(forecasts, int(params['due_within']))
+            if params.get('service_type'):
+                forecasts = forecasts.filter(service_type_id=int(params['service_type']))
+        except (ValueError, OverflowError):
+            raise ValidationError("due_within - число дней, service_type - id вида ТО")
+        return forecasts
+
+
+class ReferenceViewSet(ColumnsViewSetMixin, viewsets.ModelViewSet):
+    """Справочник: читать могут все, менять - менеджер"""
+    permission_classes = [permissions.IsAuthenticated, ReferenceEditPermission]
+    cursor_ordering = ('name', 'id')
+    model = None
+
+    def get_base_queryset(self):
+        return self.model.objects.all()
+
+
+# Вьюсеты справочников: (префикс URL, вьюсет)
+REFERENCE_VIEWSETS = [
+    (prefix, type(
+        f'{model.__name__}ViewSet',
+        (ReferenceViewSet,),
+        {'model': model, 'serializer_class': reference_serializer(model)},
+    ))
+    for prefix, model in REFERENCE_MODELS
+]
+
+
+class ChangesView(APIView):
+    """
+    Изменения после ?cursor= (без курсора - всё, что видно пользователю).
+    Ответ содержит новый курсор; пока has_more, запрос повторяется с ним.
+    Курсор старше хранимого журнала - 410 с кодом resync_required: клиент
+    заново получает всё без курсора.
+    """
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', PAGE_SIZE))
+        except ValueError:
+            limit = PAGE_SIZE
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        try:
+            data = collect_changes(request.user, request.query_params.get('cursor'), limit)
+        except ResyncRequired:
+            return Response(
+                {'detail': "Курсор старше журнала изменений, нужна полная синхронизация", 'code': 'resync_required'},
+                status=status.HTTP_410_GONE,
+            )
+        except InvalidChangesCursor:
+            raise NotFound("Некорректный курсор изменений")
+        return Response(data)
+
+
+@replica_reads
+class FleetDumpView(APIView):
+    """Все видимые машины с ТО и рекламациями, NDJSON - строка на машину"""
+
+    def get(self, request):
+        response = StreamingHttpResponse(fleet_lines(request.user), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="fleet.ndjson"'
+        return response
+
+
+def visible_rollup(request):
+    try:
+        return filter_rollup(ReclamationRollup.get_visible_to_user(request.user), request.query_params)
+    except ValueError:
+        raise ValidationError("Месяцы - в виде 2024-03, справочники и сервисная компания - по id")
+
+
+class ReclamationRollupViewSet(ColumnsViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    """Строки свёртки рекламаций; фильтры - как у отчёта"""
+    serializer_class = ReclamationRollupSerializer
+    permission_classes = [permissions.IsAuthenticated, IsService | IsManager]
+    cursor_ordering = ('month', 'id')
+
+    def get_base_queryset(self):
+        return visible_rollup(self.request)
+
+
+@replica_reads
+class ReclamationAnalyticsView(APIView):
+    """Простои по рекламациям в разрезе ?by= (узел отказа, модель техники, ...) из свёртки"""
+    permission_classes = [permissions.IsAuthenticated, IsService | IsManager]
+
+    def get(self, request):
+        by = request.query_params.get('by', 'failure_node')
+        if by not in DIMENSIONS:
+            raise ValidationError({'by': f"Допустимо: {', '.join(DIMENSIONS)}"})
+        return Response({'by': by, 'results': downtime_report(visible_rollup(request), by)})
+
+
+@replica_reads
+class ReliabilityReportView(APIView):
+    """MTBF и параметры Вейбулла в разрезе ?by= по машинам пользователя"""
+    permission_classes = [permissions.IsAuthenticated, IsService | IsManager]
+
+    def get(self, request):
+        by = request.query_params.get('by', 'machine_model')
+        if by not in RELIABILITY_DIMENSIONS:
+            raise ValidationError({'by': f"Допустимо: {', '.join(RELIABILITY_DIMENSIONS)}"})
+        return Response(reliability_report(by, request.user))
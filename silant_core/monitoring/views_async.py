@@ -0,0 +1,156 @@
+"""
+Асинхронные версии страниц и списков API только для чтения.
+
+Подключаются профилем ASGI (silant_core.settings_asgi) поверх тех же URL,
+что и синхронные. Запросы к БД идут через асинхронный ORM, поэтому пока
+ответ медленно уходит клиенту, воркер обслуживает других, а не держит
+поток на каждое соединение. Данные и права - те же, что в синхронных view.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .authentication import CachedTokenAuthentication
+from .filters import MachineFilter
+from .models import Machine, MachineSummary, Reclamation, TechnicalService
+from .pagination import ApiCursorPagination, CursorPaginator, InvalidCursor, abounded_count
+from .references import attach_references
+from .replica import replica_reads
+from .views import MachineListView
+from .views_api import MachineViewSet, ReclamationViewSet, TechnicalServiceViewSet
+
+
+# ======================== СТРАНИЦЫ ========================
+@replica_reads
+@require_safe
+async def machine_list(request):
+    user = request.user
+    queryset = MachineSummary.get_visible_to_user(user).order_by('-shipment_date')
+    filterset = MachineFilter(request.GET, queryset=queryset)
+    view = MachineListView
+    paginator = CursorPaginator(filterset.qs, view.cursor_ordering, view.paginate_by, view.count_limit)
+    try:
+        page = await paginator.apage(request.GET.get(view.cursor_kwarg))
+    except InvalidCursor:
+        raise Http404("Некорректный курсор страницы")
+    total = await abounded_count(MachineSummary.get_visible_to_user(user), view.count_limit)
+
+    return render(request, view.template_name, {
+        'view': view,
+        'filter': filterset,
+        'paginator': paginator,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+        'object_list': page.object_list,
+        'machine_list': page.object_list,
+        'total_machines': total,
+        'total_is_exact': total <= view.count_limit,
+        'in_service': sum(1 for machine in page.object_list if machine.in_service),
+    })
+
+
+@replica_reads
+@require_safe
+async def machine_detail(request, pk):
+    user = request.user
+    machine = await Machine.objects.with_status().filter(pk=pk).afirst()
+    if machine is None:
+        raise Http404("Машина не найдена")
+
+    technical_services = [
+        ts async for ts in TechnicalService.get_visible_to_user(user).filter(machine=machine).order_by('-service_date')
+    ]
+    reclamations = [
+        r async for r in Reclamation.get_visible_to_user(user).filter(machine=machine).order_by('-failure_date')
+    ]
+    # Справочники - из кеша процесса; при промахе он читает БД, поэтому через sync_to_async
+    await sync_to_async(attach_references)(technical_services, 'service_type', 'service_organization')
+    await sync_to_async(attach_references)(reclamations, 'failure_node', 'recovery_method')
+
+    return render(request, 'monitoring/machine_detail.html', {
+        'machine': machine,
+        'object': machine,
+        'can_edit_machine': user.can_edit_machines(),
+        'can_add_service': user.can_edit_technical_services(),
+        'can_add_reclamation': user.role in ['service', 'manager'],
+        'to_with_permissions': [
+            {'object': ts, 'can_edit': user.role in ['service', 'manager']}
+            for ts in technical_services
+        ],
+        'reclamations_with_permissions': [
+            {'object': r, 'can_edit': r.can_be_edited_by(user)}
+            for r in reclamations
+        ],
+    })
+
+
+@replica_reads
+@require_safe
+async def machine_search(request):
+    """Публичный поиск по заводскому номеру"""
+    request.user = await request.auser()
+    if request.user.is_authenticated:
+        return redirect('monitoring:machine_list')
+    serial_number = request.GET.get('serial_number', '').strip()
+    machine = None
+    if serial_number:
+        machine = await MachineSummary.objects.filter(serial_number=serial_number).afirst()
+    return render(request, 'monitoring/machine_search.html', {
+        'serial_number': serial_number,
+        'machine': machine,
+    })
+
+
+# ======================== API ========================
+def api_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def api_error(exc):
+    """Ответ об ошибке в том же виде, что у обработчика исключений DRF"""
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = api_response(data, status=exc.status_code)
+    if exc.status_code == 401:
+        response['WWW-Authenticate'] = CachedTokenAuthentication().authenticate_header(None)
+    return response
+
+
+def async_api_list(viewset_class):
+    """
+    Список вьюсета API: те же запрос, колонки, сериализатор и курсор, но
+    страница читается асинхронно. Токен проверяется CachedTokenAuthentication.
+    Остальные методы (создание) уходят в синхронный вьюсет.
+    """
+    sync_view = sync_to_async(viewset_class.as_view({'get': 'list', 'post': 'create'}))
+
+    @replica_reads
+    @csrf_exempt
+    async def view(request):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync_view(request)
+        drf_request = Request(request)
+        try:
+            credentials = await sync_to_async(CachedTokenAuthentication().authenticate)(drf_request)
+            if credentials is None:
+                raise NotAuthenticated()
+            drf_request.user, drf_request.auth = credentials
+            viewset = viewset_class(request=drf_request, format_kwarg=None, action='list', kwargs={})
+            paginator = ApiCursorPagination()
+            rows = await paginator.apaginate_queryset(viewset.get_queryset(), drf_request, viewset)
+            # Названия справочников берутся из кеша процесса, а холодный кеш читает БД
+            data = await sync_to_async(lambda: viewset.get_serializer(rows, many=True).data)()
+        except APIException as exc:
+            return api_error(exc)
+        return api_response(paginator.get_paginated_data(data))
+
+    return view
+
+
+api_machine_list = async_api_list(MachineViewSet)
+api_technical_service_list = async_api_list(TechnicalServiceViewSet)
+api_reclamation_list = async_api_list(ReclamationViewSet)
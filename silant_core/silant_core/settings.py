@@ -53,6 +53,8 @@ LOGIN_REDIRECT_URL = '/machines/'
 LOGOUT_REDIRECT_URL = '/login/'
 
 AUTHENTICATION_BACKENDS = [
+    # Первым - чтобы новые сессии брали пользователя из кеша; остальные нужны уже открытым сессиям
+    'monitoring.authentication.CachedAuthenticationBackend',
     'django.contrib.auth.backends.ModelBackend',
     'allauth.account.auth_backends.AuthenticationBackend',
 ]
@@ -67,11 +69,12 @@ ACCOUNT_ADAPTER = 'monitoring.adapters.NoSignupAdapter'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'monitoring.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'monitoring.pagination.ApiCursorPagination',
 }
 
 MIDDLEWARE = [
@@ -116,6 +119,20 @@ DATABASES = {
 }
 
 
+# Cache
+# Кеш процесса - для разработки и тестов. Профиль с несколькими процессами
+# (settings_production) заменяет его общим: в кеше сессии и кеш входа.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Сессия читается из кеша, БД - только при промахе; запись идёт в оба
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
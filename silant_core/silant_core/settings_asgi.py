@@ -0,0 +1,18 @@
+"""
+Профиль развёртывания под ASGI.
+
+Маршруты чтения обслуживают асинхронные view (monitoring.views_async), поэтому
+один воркер держит много медленных клиентов без потока на каждого:
+
+    uvicorn silant_core.asgi:application --workers 1
+
+Прагмы SQLite - из профиля settings_production, но соединения с БД под
+ASGI живут в потоках sync_to_async, держать их между запросами нельзя -
+CONN_MAX_AGE остаётся 0.
+"""
+from .settings_production import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'silant_core.urls_asgi'
+
+for database in DATABASES.values():  # noqa: F405
+    database['CONN_MAX_AGE'] = 0
@@ -0,0 +1,48 @@
+"""
+Профиль развёртывания на SQLite с несколькими процессами-воркерами:
+
+    gunicorn silant_core.wsgi:application --workers 4 \
+        --env DJANGO_SETTINGS_MODULE=silant_core.settings_production
+
+В режиме WAL читатели не ждут писателя (импорт, пересчёт витрин), а
+писатель - читателей. Прагмы выполняются на каждом новом соединении;
+journal_mode=WAL сохраняется в самом файле БД, остальные действуют на
+соединение. Соединение живёт между запросами (CONN_MAX_AGE) и
+проверяется перед повторным использованием.
+
+Сравнить с обычным профилем - manage.py bench_reads_during_import.
+"""
+from .settings import *  # noqa: F401,F403
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # В WAL при сбое питания теряются последние транзакции, но не целостность файла
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение - в КиБ: 64 МиБ страниц на соединение
+    'cache_size': -64 * 1024,
+    # Писатель ждёт занятую БД до 5 с, а не падает сразу с "database is locked"
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+DATABASES['default'].update({  # noqa: F405
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        'init_command': '; '.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        # Транзакция сразу берёт блокировку записи: иначе при переходе от чтения
+        # к записи SQLite в WAL отвечает "database is locked", не дожидаясь busy_timeout
+        'transaction_mode': 'IMMEDIATE',
+    },
+})
+
+# Сессии и кеш входа: сброс записи при выходе или отключении пользователя
+# должен быть виден каждому процессу. Файловый кеш не требует отдельного
+# сервиса; при нескольких хостах - Redis/Memcached.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',  # noqa: F405
+    }
+}
@@ -0,0 +1,38 @@
+"""
+Профиль с репликой для чтения (см. monitoring/replica.py).
+
+Реплика - копия файла SQLite рядом с основной БД, её обновляет отдельный
+процесс:
+
+    manage.py refresh_replica --interval 30 --settings=silant_core.settings_replica
+
+Пока снимков нет или последний старше REPLICA_MAX_LAG, все запросы читают
+основную БД.
+"""
+from .settings_production import *  # noqa: F401,F403
+from .settings_production import SQLITE_PRAGMAS
+
+DATABASES['replica'] = {  # noqa: F405
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db.replica.sqlite3',  # noqa: F405
+    # При обновлении копией файл подменяется - соединение открывается на каждый запрос
+    'CONN_MAX_AGE': 0,
+    'OPTIONS': {
+        'init_command': '; '.join(
+            f'PRAGMA {name}={value}'
+            for name, value in {**SQLITE_PRAGMAS, 'query_only': 'ON'}.items()
+            # Режим журнала реплики задаёт refresh_replica
+            if name != 'journal_mode'
+        ),
+    },
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_ROUTERS = ['monitoring.replica.ReplicaRouter']
+
+MIDDLEWARE = [*MIDDLEWARE, 'monitoring.replica.ReplicaMiddleware']  # noqa: F405
+
+# backup - онлайн-бэкап поверх реплики, copy - VACUUM INTO и подмена файла
+REPLICA_REFRESH_MODE = 'backup'
+# Реплика старше этого (секунд) не читается
+REPLICA_MAX_LAG = 120
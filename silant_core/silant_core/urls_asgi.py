@@ -0,0 +1,8 @@
+from django.contrib import admin
+from django.urls import path, include
+
+# Профиль ASGI: страницы и списки API для чтения - асинхронные, остальное как в urls.py
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('', include('monitoring.urls_async')),
+]